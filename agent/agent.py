@@ -2,78 +2,130 @@ import requests
 import time
 import json
 import os
+import random
 from datetime import datetime
+from urllib.parse import quote
+from collectors import Scheduler, default_collectors
+from sender import Sender
 
 # Configuration
 API_URL = os.getenv('API_URL', 'http://localhost:8000/api/v1')
+# Prefer a long-lived API key (nm_...) over a user JWT, which expires
+API_KEY = os.getenv('API_KEY', '')
 API_TOKEN = os.getenv('API_TOKEN', '')
 HOST_NAME = os.getenv('HOST_NAME', 'agent-host')
 HOST_IP = os.getenv('HOST_IP', '127.0.0.1')
+SPOOL_DIR = os.getenv('SPOOL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool'))
+BATCH_SIZE = int(os.getenv('BATCH_SIZE', '500'))
+FLUSH_INTERVAL = float(os.getenv('FLUSH_INTERVAL', '10'))
+HOST_ID_FILE = os.getenv('HOST_ID_FILE', os.path.join(SPOOL_DIR, 'host_id.json'))
+# Random delay before the first API call so a fleet restart is spread out
+STARTUP_JITTER = float(os.getenv('STARTUP_JITTER', '30'))
+BACKOFF_BASE = float(os.getenv('BACKOFF_BASE', '1'))
+BACKOFF_MAX = float(os.getenv('BACKOFF_MAX', '300'))
 
 # Headers for API requests
 headers = {
-    'Authorization': f'Bearer {API_TOKEN}',
+    'Authorization': f'Bearer {API_KEY or API_TOKEN}',
     'Content-Type': 'application/json'
 }
 
 
-def register_host():
-    """Register host if not exists"""
+def load_cached_host_id():
+    """Host id saved by a previous run for this API and host name"""
     try:
-        response = requests.get(f'{API_URL}/hosts', headers=headers)
-        hosts = response.json()
-        
-        for host in hosts:
-            if host['name'] == HOST_NAME:
-                return host['id']
-        
-        # Create new host
-        host_data = {
-            'name': HOST_NAME,
-            'ip_address': HOST_IP,
-            'tags': ['agent', 'monitoring']
-        }
-        response = requests.post(f'{API_URL}/hosts', json=host_data, headers=headers)
-        if response.status_code in [200, 201]:
-            return response.json()['id']
-    except Exception as e:
-        print(f'Error registering host: {e}')
-    
+        with open(HOST_ID_FILE) as f:
+            cached = json.load(f)
+        if cached.get('api_url') == API_URL and cached.get('name') == HOST_NAME:
+            return cached['id']
+    except (OSError, ValueError, KeyError):
+        pass
     return None
 
 
-def collect_metrics():
-    """Collect system metrics"""
-    metrics = {
-        'cpu_usage': __import__('random').random() * 100,
-        'memory_usage': __import__('random').random() * 100,
-        'disk_usage': __import__('random').random() * 100,
-        'network_in': __import__('random').random() * 1000,
-        'network_out': __import__('random').random() * 1000,
-    }
-    return metrics
+def save_cached_host_id(host_id):
+    os.makedirs(os.path.dirname(HOST_ID_FILE) or '.', exist_ok=True)
+    tmp = f'{HOST_ID_FILE}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'api_url': API_URL, 'name': HOST_NAME, 'id': host_id}, f)
+    os.replace(tmp, HOST_ID_FILE)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Exponential backoff with full jitter, never shorter than Retry-After"""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def register_host():
+    """
+    Resolve this agent's host id.
+    
+    A cached id is checked with a single-row GET; if the API is unreachable
+    it is trusted so metrics can spool. Otherwise the host is upserted by
+    name. Failures are retried with jittered exponential backoff.
+    """
+    cached = load_cached_host_id()
+    attempt = 0
+    while True:
+        retry_after = None
+        try:
+            if cached:
+                response = requests.get(f'{API_URL}/hosts/{cached}', headers=headers, timeout=10)
+                if response.status_code == 200 and response.json()['name'] == HOST_NAME:
+                    return cached
+                if response.status_code in (200, 401, 403, 404):
+                    cached = None
+                    continue
+            else:
+                host_data = {'ip_address': HOST_IP, 'tags': ['agent', 'monitoring']}
+                response = requests.put(
+                    f'{API_URL}/hosts/by-name/{quote(HOST_NAME, safe="")}', json=host_data, headers=headers, timeout=10
+                )
+                if response.status_code == 200:
+                    host_id = response.json()['id']
+                    save_cached_host_id(host_id)
+                    return host_id
+                if response.status_code == 409:
+                    print(f'Host name {HOST_NAME} is registered to another user')
+            retry_after = _retry_after(response)
+            print(f'Host registration failed with status {response.status_code}')
+        except requests.RequestException as e:
+            if cached:
+                print(f'API unreachable, using cached host id {cached}: {e}')
+                return cached
+            print(f'Error registering host: {e}')
+        
+        delay = backoff_delay(attempt, retry_after)
+        attempt += 1
+        print(f'Retrying host registration in {delay:.1f}s')
+        time.sleep(delay)
 
 
-def send_heartbeat(host_id):
-    """Send heartbeat metrics"""
+def send_due(sender, scheduler, host_id):
+    """Queue the samples of every collector that is due"""
     if not host_id:
         return False
     
     try:
-        metrics = collect_metrics()
+        samples = scheduler.run_due()
+        timestamp = datetime.utcnow().isoformat()
         
-        for key, value in metrics.items():
-            metric_data = {
-                'host_id': host_id,
-                'key': key,
-                'value': value
-            }
-            requests.post(f'{API_URL}/metrics', json=metric_data, headers=headers)
+        for key, value in samples:
+            sender.add({'host_id': host_id, 'key': key, 'value': value, 'timestamp': timestamp})
         
-        print(f'[{datetime.now()}] Heartbeat sent for {HOST_NAME}')
         return True
     except Exception as e:
-        print(f'Error sending heartbeat: {e}')
+        print(f'Error collecting metrics: {e}')
         return False
 
 
@@ -82,19 +134,24 @@ def main():
     print(f'Netmon Agent started - Host: {HOST_NAME}')
     print(f'API URL: {API_URL}')
     
+    time.sleep(random.uniform(0, STARTUP_JITTER))
     host_id = register_host()
-    if not host_id:
-        print('Failed to register host, retrying...')
-        time.sleep(10)
-        return
     
     print(f'Host registered with ID: {host_id}')
     
-    interval = int(os.getenv('HEARTBEAT_INTERVAL', '60'))
+    interval = float(os.getenv('HEARTBEAT_INTERVAL', '60'))
+    scheduler = Scheduler(default_collectors(interval))
     
-    while True:
-        send_heartbeat(host_id)
-        time.sleep(interval)
+    sender = Sender(API_URL, headers, SPOOL_DIR, max_batch=BATCH_SIZE, flush_interval=FLUSH_INTERVAL)
+    sender.start()
+    
+    try:
+        while True:
+            send_due(sender, scheduler, host_id)
+            time.sleep(scheduler.seconds_until_due())
+    finally:
+        scheduler.close()
+        sender.stop()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,301 @@
+"""
+System metric collectors for the Netmon agent.
+
+Collectors read /proc directly. Each keeps its file open and re-reads it
+from offset 0, and turns monotonically increasing counters into per-second
+rates using its previous sample. A collector has its own interval; the
+Scheduler runs whichever ones are due and reports how long each took.
+"""
+import os
+import time
+
+
+class ProcFile:
+    """A /proc file opened once and re-read with seek(0)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+
+    def read(self):
+        if self._f is None:
+            self._f = open(self.path, 'rb', buffering=0)
+        self._f.seek(0)
+        chunks = []
+        while True:
+            chunk = self._f.read(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+class Collector:
+    """Base collector: `collect()` returns a dict of key -> value"""
+
+    name = 'collector'
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.next_due = 0.0
+
+    def collect(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RateCollector(Collector):
+    """Collector whose values are deltas of counters between two samples"""
+
+    def __init__(self, interval):
+        super().__init__(interval)
+        self._prev = None
+        self._prev_time = None
+
+    def read_counters(self):
+        """Current counters as a dict of name -> int"""
+        raise NotImplementedError
+
+    def rates(self, current, previous, elapsed):
+        """Derive metrics from two counter samples"""
+        raise NotImplementedError
+
+    def collect(self):
+        now = time.monotonic()
+        current = self.read_counters()
+        previous, previous_time = self._prev, self._prev_time
+        self._prev, self._prev_time = current, now
+        if previous is None or now <= previous_time:
+            return {}
+        return self.rates(current, previous, now - previous_time)
+
+
+def _delta(current, previous, name):
+    # A counter that went backwards was reset or wrapped; report nothing
+    value = current.get(name, 0) - previous.get(name, 0)
+    return value if value >= 0 else 0
+
+
+def _device_delta(current, previous, counter):
+    """
+    Sum of one counter's deltas over (counter, device) keys in both samples.
+
+    A device that appeared or vanished in between contributes nothing,
+    rather than its whole counter or a drop of the total.
+    """
+    return sum(
+        _delta(current, previous, name)
+        for name in current.keys() & previous.keys()
+        if name[0] == counter
+    )
+
+
+class CpuCollector(RateCollector):
+    """Busy and iowait percentage from the aggregate line of /proc/stat"""
+
+    name = 'cpu'
+    FIELDS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal')
+
+    def __init__(self, interval, path='/proc/stat'):
+        super().__init__(interval)
+        self._file = ProcFile(path)
+
+    def read_counters(self):
+        data = self._file.read()
+        line = data[:data.index(b'\n')].split()
+        return dict(zip(self.FIELDS, map(int, line[1:1 + len(self.FIELDS)])))
+
+    def rates(self, current, previous, elapsed):
+        total = sum(_delta(current, previous, f) for f in self.FIELDS)
+        if total == 0:
+            return {}
+        idle = _delta(current, previous, 'idle') + _delta(current, previous, 'iowait')
+        return {
+            'cpu_usage': 100.0 * (total - idle) / total,
+            'cpu_iowait': 100.0 * _delta(current, previous, 'iowait') / total,
+        }
+
+    def close(self):
+        self._file.close()
+
+
+class MemoryCollector(Collector):
+    """Used memory percentage and available bytes from /proc/meminfo"""
+
+    name = 'memory'
+
+    def __init__(self, interval, path='/proc/meminfo'):
+        super().__init__(interval)
+        self._file = ProcFile(path)
+
+    def collect(self):
+        values = {}
+        for line in self._file.read().splitlines():
+            name, _, rest = line.partition(b':')
+            if name in (b'MemTotal', b'MemAvailable'):
+                values[name] = int(rest.split()[0]) * 1024
+                if len(values) == 2:
+                    break
+        total = values.get(b'MemTotal')
+        available = values.get(b'MemAvailable')
+        if not total or available is None:
+            return {}
+        return {
+            'memory_usage': 100.0 * (total - available) / total,
+            'memory_available_bytes': float(available),
+        }
+
+    def close(self):
+        self._file.close()
+
+
+class NetworkCollector(RateCollector):
+    """Received and sent bytes per second over all non-loopback interfaces"""
+
+    name = 'network'
+
+    def __init__(self, interval, path='/proc/net/dev'):
+        super().__init__(interval)
+        self._file = ProcFile(path)
+
+    def read_counters(self):
+        counters = {}
+        # Two header lines, then "iface: rx_bytes ... (8 rx fields) tx_bytes ..."
+        for line in self._file.read().splitlines()[2:]:
+            iface, _, rest = line.partition(b':')
+            iface = iface.strip()
+            if iface == b'lo':
+                continue
+            fields = rest.split()
+            counters['rx', iface] = int(fields[0])
+            counters['tx', iface] = int(fields[8])
+        return counters
+
+    def rates(self, current, previous, elapsed):
+        return {
+            'network_in': _device_delta(current, previous, 'rx') / elapsed,
+            'network_out': _device_delta(current, previous, 'tx') / elapsed,
+        }
+
+    def close(self):
+        self._file.close()
+
+
+class DiskCollector(RateCollector):
+    """Disk throughput and utilisation from /proc/diskstats, space used on `mount`"""
+
+    name = 'disk'
+    SECTOR_BYTES = 512
+    # How often to re-check which block devices are whole disks
+    DEVICE_REFRESH_SECONDS = 300
+
+    def __init__(self, interval, path='/proc/diskstats', mount='/', sys_block='/sys/block'):
+        super().__init__(interval)
+        self._file = ProcFile(path)
+        self.mount = mount
+        self.sys_block = sys_block
+        self._devices = None
+        self._devices_checked = 0.0
+
+    def _whole_disks(self):
+        now = time.monotonic()
+        if self._devices is None or now - self._devices_checked > self.DEVICE_REFRESH_SECONDS:
+            try:
+                names = os.listdir(self.sys_block)
+            except OSError:
+                names = []
+            self._devices = {
+                n.encode() for n in names
+                if not n.startswith(('loop', 'ram', 'zram', 'dm-', 'md'))
+            }
+            self._devices_checked = now
+        return self._devices
+
+    def read_counters(self):
+        devices = self._whole_disks()
+        counters = {}
+        for line in self._file.read().splitlines():
+            fields = line.split()
+            if len(fields) < 14 or fields[2] not in devices:
+                continue
+            device = fields[2]
+            counters['read', device] = int(fields[5])
+            counters['written', device] = int(fields[9])
+            counters['busy_ms', device] = int(fields[12])
+        return counters
+
+    def rates(self, current, previous, elapsed):
+        device_count = max(len({name[1] for name in current.keys() & previous.keys()}), 1)
+        return {
+            'disk_read_bytes': _device_delta(current, previous, 'read') * self.SECTOR_BYTES / elapsed,
+            'disk_write_bytes': _device_delta(current, previous, 'written') * self.SECTOR_BYTES / elapsed,
+            'disk_io_util': min(
+                100.0, _device_delta(current, previous, 'busy_ms') / (elapsed * 10.0 * device_count)
+            ),
+        }
+
+    def collect(self):
+        samples = super().collect()
+        st = os.statvfs(self.mount)
+        total = st.f_blocks * st.f_frsize
+        if total:
+            samples['disk_usage'] = 100.0 * (total - st.f_bavail * st.f_frsize) / total
+        return samples
+
+    def close(self):
+        self._file.close()
+
+
+class Scheduler:
+    """Runs each collector on its own interval"""
+
+    def __init__(self, collectors):
+        self.collectors = list(collectors)
+
+    def run_due(self, now=None):
+        """
+        Collect from every due collector.
+
+        Returns (key, value) pairs, including `agent.collector.<name>.ms`
+        with the time each collector took.
+        """
+        now = time.monotonic() if now is None else now
+        samples = []
+        for collector in self.collectors:
+            if now < collector.next_due:
+                continue
+            collector.next_due = now + collector.interval
+            started = time.perf_counter()
+            try:
+                values = collector.collect()
+            except (OSError, ValueError, IndexError) as e:
+                print(f'Collector {collector.name} failed: {e}')
+                continue
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            samples.extend(values.items())
+            samples.append((f'agent.collector.{collector.name}.ms', elapsed_ms))
+        return samples
+
+    def seconds_until_due(self, now=None):
+        now = time.monotonic() if now is None else now
+        return max(0.0, min(c.next_due for c in self.collectors) - now)
+
+    def close(self):
+        for collector in self.collectors:
+            collector.close()
+
+
+def default_collectors(default_interval):
+    """Standard collectors; COLLECTOR_INTERVAL_<NAME> overrides an interval"""
+    classes = (CpuCollector, MemoryCollector, NetworkCollector, DiskCollector)
+    return [
+        cls(float(os.getenv(f'COLLECTOR_INTERVAL_{cls.name.upper()}', default_interval)))
+        for cls in classes
+    ]
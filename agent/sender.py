@@ -0,0 +1,213 @@
+"""
+Buffered metric sender for the Netmon agent.
+
+Points are queued in memory and flushed as one gzip-compressed batch when the
+queue reaches `max_batch` points or `flush_interval` seconds have passed.
+Batches that cannot be delivered are appended to an on-disk spool and
+replayed, oldest first, once the API accepts requests again.
+"""
+import gzip
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class Spool:
+    """Bounded, append-only spool of undelivered batches.
+
+    Each segment file holds one JSON batch per line. The newest segment is
+    appended to until it reaches `segment_bytes`; when the spool grows past
+    `max_bytes` the oldest segments are dropped.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, segment_bytes=1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.dropped_batches = 0
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _segments(self):
+        names = [n for n in os.listdir(self.directory) if n.startswith('segment-') and n.endswith('.jsonl')]
+        return [os.path.join(self.directory, n) for n in sorted(names)]
+
+    def _new_segment_path(self):
+        return os.path.join(self.directory, f'segment-{time.time_ns():020d}.jsonl')
+
+    def append(self, batch):
+        """Append one batch to the newest segment"""
+        line = json.dumps(batch, separators=(',', ':')) + '\n'
+        with self._lock:
+            segments = self._segments()
+            path = segments[-1] if segments else None
+            if path is None or os.path.getsize(path) >= self.segment_bytes:
+                path = self._new_segment_path()
+                segments.append(path)
+            with open(path, 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._enforce_limit(segments)
+
+    def _enforce_limit(self, segments):
+        sizes = [(path, os.path.getsize(path)) for path in segments]
+        total = sum(size for _, size in sizes)
+        while total > self.max_bytes and len(sizes) > 1:
+            path, size = sizes.pop(0)
+            with open(path) as f:
+                self.dropped_batches += sum(1 for _ in f)
+            os.remove(path)
+            total -= size
+
+    def pending(self):
+        """Number of spooled segment files"""
+        with self._lock:
+            return len(self._segments())
+
+    def replay(self, send, max_segments=4):
+        """
+        Send spooled batches oldest first with `send(batch) -> bool`.
+
+        Delivered segments are removed. If a send fails, the undelivered
+        remainder of the segment is written back and replay stops. Sends
+        happen outside the lock, so appends may meanwhile drop the segment
+        being replayed to stay under `max_bytes`; it then stays dropped.
+        """
+        for _ in range(max_segments):
+            with self._lock:
+                segments = self._segments()
+                if not segments:
+                    return True
+                path = segments[0]
+                with open(path) as f:
+                    lines = [line for line in f if line.strip()]
+                if not lines:
+                    os.remove(path)
+                    continue
+                # Start a fresh segment so appends do not race with replay
+                if len(segments) == 1:
+                    open(self._new_segment_path(), 'a').close()
+
+            for index, line in enumerate(lines):
+                if not send(json.loads(line)):
+                    with self._lock:
+                        if os.path.exists(path):
+                            tmp = path + '.tmp'
+                            with open(tmp, 'w') as f:
+                                f.writelines(lines[index:])
+                            os.replace(tmp, path)
+                    return False
+
+            with self._lock:
+                if os.path.exists(path):
+                    os.remove(path)
+        return True
+
+
+class Sender:
+    """Queue metric points and deliver them in compressed batches"""
+
+    def __init__(self, api_url, headers, spool_dir, max_batch=500, flush_interval=10.0,
+                 max_queue=50000, timeout=10.0, spool_max_bytes=64 * 1024 * 1024):
+        self.url = f'{api_url}/metrics/batch'
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Content-Encoding': 'gzip',
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.spool = Spool(spool_dir, max_bytes=spool_max_bytes)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        """Start the background flush thread"""
+        self._thread = threading.Thread(target=self._run, name='netmon-sender', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flush what is queued and stop the flush thread"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(self.timeout * 2)
+        self.flush()
+
+    def add(self, point):
+        """Queue one point; wakes the flusher when a full batch is ready"""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                # Keep the newest data; the oldest points are the least useful
+                self._queue.popleft()
+            self._queue.append(point)
+            if len(self._queue) >= self.max_batch:
+                self._cond.notify()
+
+    def _run(self):
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            with self._cond:
+                while not self._stopped and len(self._queue) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopped:
+                    return
+            self.flush()
+            deadline = time.monotonic() + self.flush_interval
+
+    def _drain(self):
+        with self._cond:
+            count = min(len(self._queue), self.max_batch)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _post(self, batch):
+        body = gzip.compress(json.dumps({'metrics': batch}, separators=(',', ':')).encode(), compresslevel=6)
+        try:
+            response = self.session.post(self.url, data=body, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f'Error sending metrics: {e}')
+            return False
+        if response.status_code >= 500 or response.status_code == 429:
+            print(f'API unavailable ({response.status_code}), spooling batch')
+            return False
+        if response.status_code >= 400:
+            # The API rejected the data itself; retrying would not help
+            print(f'Batch rejected ({response.status_code}): {response.text[:200]}')
+        return True
+
+    def flush(self):
+        """Send everything queued; spool batches that cannot be delivered"""
+        with self._send_lock:
+            delivered = True
+            while True:
+                batch = self._drain()
+                if not batch:
+                    break
+                if delivered:
+                    delivered = self._post(batch)
+                if not delivered:
+                    self.spool.append(batch)
+            if delivered:
+                self.spool.replay(self._post)
+            return delivered
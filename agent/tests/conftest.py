@@ -0,0 +1,8 @@
+"""
+Shared test setup for the agent
+"""
+import os
+import sys
+
+# The agent runs as a script from its own directory (`python agent.py`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,150 @@
+"""
+Tests for the /proc collectors, fed from fixture files
+"""
+import pytest
+import collectors
+from collectors import (
+    CpuCollector, DiskCollector, MemoryCollector, NetworkCollector, Scheduler, _delta,
+)
+
+NET_HEADER = (
+    'Inter-|   Receive                                                |  Transmit\n'
+    ' face |bytes    packets errs drop fifo frame compressed multicast'
+    '|bytes    packets errs drop fifo colls carrier compressed\n'
+)
+
+
+class Clock:
+    """Stands in for the time module; advanced by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(collectors, 'time', clock)
+    return clock
+
+
+def _sample(collector, path, content, clock, seconds=10.0):
+    path.write_text(content)
+    clock.now += seconds
+    return collector.collect()
+
+
+def _stat(user, system, idle, iowait):
+    return f'cpu  {user} 0 {system} {idle} {iowait} 0 0 0 0 0\ncpu0 1 2 3 4 5 6 7 8 9 10\n'
+
+
+def _netdev(**interfaces):
+    lines = [
+        f'{name:>6}: {rx} 10 0 0 0 0 0 0 {tx} 10 0 0 0 0 0 0\n'
+        for name, (rx, tx) in interfaces.items()
+    ]
+    return NET_HEADER + ''.join(lines)
+
+
+def _diskstats(**devices):
+    return ''.join(
+        f'   8       0 {name} 100 0 {read} 50 200 0 {written} 80 0 {busy} 130 0 0 0 0\n'
+        for name, (read, written, busy) in devices.items()
+    )
+
+
+def test_delta_ignores_counter_resets():
+    """Test a counter that went backwards yields nothing rather than a negative rate"""
+    assert _delta({'a': 15}, {'a': 10}, 'a') == 5
+    assert _delta({'a': 3}, {'a': 10}, 'a') == 0
+
+
+def test_cpu_usage_from_two_readings(tmp_path, clock):
+    """Test busy and iowait percentages come from the delta of two readings"""
+    path = tmp_path / 'stat'
+    cpu = CpuCollector(10, path=str(path))
+
+    assert _sample(cpu, path, _stat(100, 100, 700, 100), clock) == {}
+    values = _sample(cpu, path, _stat(150, 150, 750, 150), clock)
+    assert values == {'cpu_usage': 50.0, 'cpu_iowait': 25.0}
+    # Counters reset (e.g. a restored VM): nothing rather than nonsense
+    assert _sample(cpu, path, _stat(1, 1, 1, 1), clock) == {}
+
+
+def test_memory_usage(tmp_path, clock):
+    """Test used percentage and available bytes from /proc/meminfo"""
+    path = tmp_path / 'meminfo'
+    path.write_text('MemTotal:       1000 kB\nMemFree:         100 kB\nMemAvailable:    250 kB\n')
+    assert MemoryCollector(10, path=str(path)).collect() == {
+        'memory_usage': 75.0,
+        'memory_available_bytes': 250.0 * 1024,
+    }
+    path.write_text('MemTotal:       1000 kB\nMemFree:         100 kB\n')
+    assert MemoryCollector(10, path=str(path)).collect() == {}
+
+
+def test_network_rates_per_interface(tmp_path, clock):
+    """Test byte rates skip loopback and survive interfaces coming, going and resetting"""
+    path = tmp_path / 'dev'
+    net = NetworkCollector(10, path=str(path))
+
+    _sample(net, path, _netdev(lo=(10**9, 10**9), eth0=(1000, 2000), eth1=(500, 500)), clock)
+    values = _sample(net, path, _netdev(lo=(2 * 10**9, 2 * 10**9), eth0=(2000, 4000), eth1=(1500, 500)), clock)
+    assert values == {'network_in': 200.0, 'network_out': 200.0}
+
+    # eth1 vanished and wlan0 appeared with a large lifetime counter
+    values = _sample(net, path, _netdev(eth0=(3000, 6000), wlan0=(10**9, 10**9)), clock)
+    assert values == {'network_in': 100.0, 'network_out': 200.0}
+
+    # eth0 reset; wlan0 still counts
+    values = _sample(net, path, _netdev(eth0=(10, 10), wlan0=(10**9 + 500, 10**9)), clock)
+    assert values == {'network_in': 50.0, 'network_out': 0.0}
+
+
+def test_disk_rates_per_device(tmp_path, clock):
+    """Test throughput and utilisation over whole disks only, with a disk removed"""
+    sys_block = tmp_path / 'block'
+    for name in ('sda', 'sdb', 'loop0'):
+        (sys_block / name).mkdir(parents=True)
+    path = tmp_path / 'diskstats'
+    disk = DiskCollector(10, path=str(path), mount=str(tmp_path), sys_block=str(sys_block))
+
+    _sample(disk, path, _diskstats(sda=(0, 0, 0), sdb=(0, 0, 0), loop0=(0, 0, 0), sda1=(0, 0, 0)), clock)
+    values = _sample(
+        disk, path,
+        _diskstats(sda=(20, 40, 5000), sdb=(20, 0, 0), loop0=(10**6, 10**6, 10**6), sda1=(20, 40, 5000)),
+        clock,
+    )
+    assert values['disk_read_bytes'] == 40 * 512 / 10
+    assert values['disk_write_bytes'] == 40 * 512 / 10
+    assert values['disk_io_util'] == 25.0
+    assert 0.0 <= values['disk_usage'] <= 100.0
+
+    # sdb was detached: only sda counts, utilisation over one disk
+    values = _sample(disk, path, _diskstats(sda=(40, 40, 10000)), clock)
+    assert values['disk_read_bytes'] == 20 * 512 / 10
+    assert values['disk_write_bytes'] == 0.0
+    assert values['disk_io_util'] == 50.0
+
+
+def test_scheduler_skips_missing_files(tmp_path, clock):
+    """Test a collector whose file is missing is skipped and others still report"""
+    path = tmp_path / 'meminfo'
+    path.write_text('MemTotal:       1000 kB\nMemAvailable:    500 kB\n')
+    scheduler = Scheduler([
+        CpuCollector(10, path=str(tmp_path / 'missing')),
+        MemoryCollector(10, path=str(path)),
+    ])
+
+    samples = dict(scheduler.run_due())
+    assert samples['memory_usage'] == 50.0
+    assert 'agent.collector.memory.ms' in samples
+    assert 'agent.collector.cpu.ms' not in samples
+    assert scheduler.seconds_until_due() == 10.0
+    scheduler.close()
@@ -0,0 +1,118 @@
+"""
+Tests for the spool and the buffered sender
+"""
+import os
+from sender import Sender, Spool
+
+
+def _batch(n, size=1):
+    return [{'key': f'k{n}', 'value': float(i)} for i in range(size)]
+
+
+def _collect(spool):
+    sent = []
+    assert spool.replay(lambda batch: sent.append(batch) or True, max_segments=100)
+    return sent
+
+
+def test_spool_replays_in_order(tmp_path):
+    """Test batches come back oldest first and delivered segments are removed"""
+    spool = Spool(str(tmp_path), segment_bytes=100)
+    for n in range(10):
+        spool.append(_batch(n))
+    assert spool.pending() > 1
+
+    assert _collect(spool) == [_batch(n) for n in range(10)]
+    assert spool.pending() <= 1
+    assert _collect(spool) == []
+
+
+def test_spool_size_bound_drops_oldest(tmp_path):
+    """Test the spool stays near max_bytes by dropping whole old segments"""
+    spool = Spool(str(tmp_path), max_bytes=2000, segment_bytes=500)
+    for n in range(100):
+        spool.append(_batch(n, size=5))
+
+    total = sum(os.path.getsize(os.path.join(tmp_path, name)) for name in os.listdir(tmp_path))
+    assert total <= 2000 + 500
+    assert spool.dropped_batches > 0
+    sent = _collect(spool)
+    assert len(sent) + spool.dropped_batches == 100
+    assert sent[-1] == _batch(99, size=5)
+    assert sent == sorted(sent, key=lambda batch: int(batch[0]['key'][1:]))
+
+
+def test_spool_failed_replay_keeps_remainder(tmp_path):
+    """Test a failed send writes back only the undelivered batches"""
+    spool = Spool(str(tmp_path))
+    for n in range(5):
+        spool.append(_batch(n))
+    sent = []
+
+    def flaky(batch):
+        if len(sent) == 2:
+            return False
+        sent.append(batch)
+        return True
+
+    assert not spool.replay(flaky)
+    assert sent == [_batch(0), _batch(1)]
+    assert _collect(spool) == [_batch(n) for n in range(2, 5)]
+
+
+def _replay_while_appending(spool, result):
+    """Replay one segment while new batches push it out of the size bound"""
+    sent = []
+
+    def send(batch):
+        for n in range(10):
+            spool.append(_batch(100 + n, size=5))
+        sent.append(batch)
+        return result
+
+    return spool.replay(send, max_segments=1), sent
+
+
+def test_spool_segment_dropped_during_replay(tmp_path):
+    """Test replay survives the size bound removing the segment it is sending"""
+    spool = Spool(str(tmp_path), max_bytes=600, segment_bytes=300)
+    for n in range(2):
+        spool.append(_batch(n, size=5))
+
+    assert _replay_while_appending(spool, True) == (True, [_batch(0, size=5), _batch(1, size=5)])
+    assert spool.dropped_batches > 0
+
+
+def test_spool_dropped_segment_not_written_back(tmp_path):
+    """Test a failed replay does not resurrect a segment the size bound dropped"""
+    spool = Spool(str(tmp_path), max_bytes=600, segment_bytes=300)
+    for n in range(2):
+        spool.append(_batch(n, size=5))
+
+    assert _replay_while_appending(spool, False) == (False, [_batch(0, size=5)])
+    assert all(batch[0]['key'] not in ('k0', 'k1') for batch in _collect(spool))
+
+
+def test_sender_spools_until_api_recovers(tmp_path):
+    """Test undelivered batches are spooled and replayed before new data"""
+    sender = Sender('http://netmon.invalid/api/v1', {}, str(tmp_path), max_batch=2)
+    delivered = []
+    up = False
+
+    def post(batch):
+        if up:
+            delivered.append(batch)
+        return up
+
+    sender._post = post
+    for n in range(4):
+        sender.add({'key': 'cpu', 'value': float(n)})
+    assert not sender.flush()
+    assert sender.spool.pending() == 1
+
+    up = True
+    sender.add({'key': 'cpu', 'value': 4.0})
+    assert sender.flush()
+    values = [p['value'] for batch in delivered for p in batch]
+    assert sorted(values) == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert sender.spool.pending() <= 1
@@ -0,0 +1,3 @@
+"""
+Load benchmark harness
+"""
@@ -0,0 +1,61 @@
+"""
+Compare two benchmark result files
+
+    python -m api.bench.compare baseline.json candidate.json --threshold 0.15
+
+Exits with status 1 when ingest throughput drops, or a route's p95/p99
+latency grows, by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+LATENCY_FIELDS = ("p50_ms", "p95_ms", "p99_ms")
+# Percentiles that fail the comparison; p50 is reported only
+GATED_FIELDS = ("p95_ms", "p99_ms")
+
+
+def compare(baseline: dict, candidate: dict, threshold: float):
+    """Rows of (name, baseline, candidate, change, regressed)"""
+    rows = []
+
+    old = baseline["ingest"]["points_per_second"]
+    new = candidate["ingest"]["points_per_second"]
+    change = (new - old) / old if old else 0.0
+    rows.append(("ingest points/s", old, new, change, change < -threshold))
+
+    for route, old_stats in sorted(baseline["routes"].items()):
+        new_stats = candidate["routes"].get(route)
+        if new_stats is None:
+            continue
+        for field in LATENCY_FIELDS:
+            old, new = old_stats[field], new_stats[field]
+            change = (new - old) / old if old else 0.0
+            regressed = field in GATED_FIELDS and change > threshold
+            rows.append((f"{route} {field}", old, new, change, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative change")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    rows = compare(baseline, candidate, args.threshold)
+    width = max(len(row[0]) for row in rows)
+    for name, old, new, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<{width}}  {old:12.2f}  {new:12.2f}  {change:+8.1%}{flag}")
+
+    return 1 if any(row[4] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""
+Load benchmark for the Netmon API
+
+Simulates N agents sending heartbeat batches plus dashboard readers, and
+writes ingest throughput and per-route latency percentiles as JSON.
+
+    python -m api.bench.run --agents 50 --readers 5 --duration 30 --out bench.json
+    python -m api.bench.run --url http://localhost:8000 --agents 200
+
+Without --url the app runs in-process on a fresh SQLite database.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+# Same keys the agent's default collectors report
+AGENT_KEYS = (
+    "cpu_usage", "cpu_iowait", "memory_usage", "memory_available_bytes",
+    "network_in", "network_out", "disk_read_bytes", "disk_write_bytes",
+    "disk_io_util", "disk_usage", "agent.collector.cpu.ms",
+    "agent.collector.memory.ms", "agent.collector.network.ms", "agent.collector.disk.ms",
+)
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    """Latency samples and error counts per route template"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.points = 0
+
+    async def call(self, client, method, route, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except Exception:
+            self.errors[route] += 1
+            return None
+        self.latencies[route].append((time.perf_counter() - started) * 1000.0)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+        return response
+
+    def summary(self):
+        routes = {}
+        for route in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies[route])
+            routes[route] = {
+                "count": len(values),
+                "errors": self.errors[route],
+                "mean_ms": sum(values) / len(values) if values else 0.0,
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "p99_ms": percentile(values, 99),
+            }
+        return routes
+
+
+async def create_account(client, recorder):
+    name = f"bench-{uuid.uuid4().hex[:12]}"
+    await recorder.call(
+        client, "POST", "POST /auth/register", "/api/v1/auth/register",
+        json={"username": name, "email": f"{name}@example.com", "password": "bench-password"},
+    )
+    response = await recorder.call(
+        client, "POST", "POST /auth/login", "/api/v1/auth/login",
+        json={"username": name, "password": "bench-password"},
+    )
+    response.raise_for_status()
+    return name, {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def agent(client, recorder, headers, name, args, stop_at, rng):
+    """One agent: register by name, then send a heartbeat batch every interval"""
+    response = await recorder.call(
+        client, "PUT", "PUT /hosts/by-name/{name}", f"/api/v1/hosts/by-name/{name}",
+        json={"ip_address": "10.0.0.1", "tags": ["bench"]}, headers=headers,
+    )
+    response.raise_for_status()
+    host_id = response.json()["id"]
+
+    # Agents do not start in lockstep
+    await asyncio.sleep(rng.uniform(0, args.interval))
+    while time.monotonic() < stop_at:
+        started = time.monotonic()
+        timestamp = datetime.utcnow().isoformat()
+        points = [
+            {"host_id": host_id, "key": key, "value": rng.random() * 100, "timestamp": timestamp}
+            for key in AGENT_KEYS[:args.keys]
+        ]
+        response = await recorder.call(
+            client, "POST", "POST /metrics/batch", "/api/v1/metrics/batch",
+            json={"metrics": points}, headers=headers,
+        )
+        if response is not None and response.status_code in (200, 202):
+            recorder.points += len(points)
+        await asyncio.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+    return host_id
+
+
+async def reader(client, recorder, headers, host_ids, args, stop_at, rng):
+    """One dashboard: host list, latest values, a series and a summary per cycle"""
+    while time.monotonic() < stop_at:
+        started = time.monotonic()
+        await recorder.call(client, "GET", "GET /hosts/", "/api/v1/hosts/", headers=headers)
+        ids = host_ids[:100]
+        await recorder.call(
+            client, "GET", "GET /metrics/latest", "/api/v1/metrics/latest",
+            params={"host_ids": ",".join(map(str, ids))}, headers=headers,
+        )
+        params = {"host_id": rng.choice(host_ids), "key": rng.choice(AGENT_KEYS[:args.keys])}
+        await recorder.call(
+            client, "GET", "GET /metrics/series", "/api/v1/metrics/series",
+            params=params, headers=headers,
+        )
+        await recorder.call(
+            client, "GET", "GET /metrics/summary", "/api/v1/metrics/summary",
+            params=params, headers=headers,
+        )
+        await recorder.call(client, "GET", "GET /alerts/", "/api/v1/alerts/", headers=headers)
+        await asyncio.sleep(max(0.0, args.reader_interval - (time.monotonic() - started)))
+
+
+async def run(args, client):
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    _, headers = await create_account(client, recorder)
+
+    run_id = uuid.uuid4().hex[:8]
+    names = [f"bench-{run_id}-{i}" for i in range(args.agents)]
+    # Register hosts up front so readers have ids from the first cycle
+    host_ids = []
+    for name in names:
+        response = await client.put(
+            f"/api/v1/hosts/by-name/{name}", json={"ip_address": "10.0.0.1"}, headers=headers
+        )
+        host_ids.append(response.json()["id"])
+
+    started = time.monotonic()
+    stop_at = started + args.duration
+    tasks = [
+        agent(client, recorder, headers, name, args, stop_at, random.Random(rng.random()))
+        for name in names
+    ] + [
+        reader(client, recorder, headers, host_ids, args, stop_at, random.Random(rng.random()))
+        for _ in range(args.readers)
+    ]
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+
+    buffer = None
+    response = await client.get("/api/v1/metrics/buffer", headers=headers)
+    if response.status_code == 200:
+        buffer = response.json()
+
+    return {
+        "ingest": {
+            "points": recorder.points,
+            "seconds": elapsed,
+            "points_per_second": recorder.points / elapsed if elapsed else 0.0,
+            "buffer": buffer,
+        },
+        "routes": recorder.summary(),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_in_process(args):
+    """Run against the app in this process on a throwaway SQLite database"""
+    import httpx
+
+    from api.db.database import engine
+    from api.db.migrate import upgrade
+    from api.main import app
+
+    upgrade(engine)
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await run(args, client)
+    finally:
+        await app.router.shutdown()
+
+
+async def run_remote(args):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.agents + args.readers)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30.0) as client:
+        return await run(args, client)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--agents", type=int, default=20)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds of load")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between agent heartbeats")
+    parser.add_argument("--reader-interval", type=float, default=1.0)
+    parser.add_argument("--keys", type=int, default=len(AGENT_KEYS), help="Metrics per heartbeat")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="Write JSON results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.url:
+        mode = "remote"
+    else:
+        mode = "in-process"
+        # Must be set before the app (and its engines) are imported
+        db_path = os.path.join(tempfile.mkdtemp(prefix="netmon-bench-"), "bench.db")
+        os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    results = asyncio.run(run_remote(args) if args.url else run_in_process(args))
+    results["meta"] = {
+        "commit": git_commit(),
+        "created_at": datetime.utcnow().isoformat(),
+        "mode": mode,
+        "python": platform.python_version(),
+        "params": {k: v for k, v in vars(args).items() if k != "out"},
+    }
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Compressed request bodies
+"""
+import zlib
+from typing import Callable
+from fastapi import HTTPException, Request, Response, status
+from fastapi.routing import APIRoute
+
+# Upper bound on an inflated request body, to refuse decompression bombs
+MAX_DECOMPRESSED_BYTES = 64 * 1024 * 1024
+
+
+class GzipRequest(Request):
+    """Request whose body is transparently inflated for Content-Encoding: gzip"""
+
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            body = await super().body()
+            if "gzip" in self.headers.get("content-encoding", "").lower():
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                try:
+                    body = decompressor.decompress(body, MAX_DECOMPRESSED_BYTES)
+                except zlib.error:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Invalid gzip body",
+                    )
+                if decompressor.unconsumed_tail:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail="Decompressed body too large",
+                    )
+            self._body = body
+        return self._body
+
+
+class GzipRoute(APIRoute):
+    """Route class that accepts gzip-compressed request bodies"""
+
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+
+        async def gzip_route_handler(request: Request) -> Response:
+            request = GzipRequest(request.scope, request.receive)
+            return await original_route_handler(request)
+
+        return gzip_route_handler
+
+
+def read_varint(data: bytes, pos: int):
+    """Decode a base-128 varint at pos; returns (value, next position)"""
+    result = shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("truncated varint")
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+        if shift > 63:
+            raise ValueError("varint too long")
+
+
+def snappy_decompress(data: bytes, max_bytes: int = MAX_DECOMPRESSED_BYTES) -> bytes:
+    """
+    Decode a raw (unframed) snappy block, as sent by Prometheus remote_write.
+
+    Raises ValueError on corrupt input or when the declared size exceeds
+    max_bytes.
+    """
+    length, pos = read_varint(data, 0)
+    if length > max_bytes:
+        raise ValueError("decompressed body too large")
+    out = bytearray()
+    end = len(data)
+    while pos < end:
+        tag = data[pos]
+        pos += 1
+        kind = tag & 3
+        if kind == 0:
+            # Literal; lengths over 60 follow the tag in 1-4 little-endian bytes
+            size = tag >> 2
+            if size >= 60:
+                extra = size - 59
+                size = int.from_bytes(data[pos:pos + extra], "little")
+                pos += extra
+            size += 1
+            if pos + size > end:
+                raise ValueError("literal runs past input")
+            out += data[pos:pos + size]
+            pos += size
+            continue
+        if pos + (1, 2, 4)[kind - 1] > end:
+            raise ValueError("copy runs past input")
+        if kind == 1:
+            size = 4 + ((tag >> 2) & 7)
+            offset = ((tag >> 5) << 8) | data[pos]
+            pos += 1
+        elif kind == 2:
+            size = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos:pos + 2], "little")
+            pos += 2
+        else:
+            size = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos:pos + 4], "little")
+            pos += 4
+        if offset == 0 or offset > len(out):
+            raise ValueError("copy offset out of range")
+        start = len(out) - offset
+        if offset >= size:
+            out += out[start:start + size]
+        else:
+            # Overlapping copy repeats the last `offset` bytes
+            pattern = bytes(out[start:])
+            out += (pattern * (size // offset + 1))[:size]
+        if len(out) > length:
+            raise ValueError("output exceeds declared length")
+    if len(out) != length:
+        raise ValueError("output shorter than declared length")
+    return bytes(out)
@@ -0,0 +1,240 @@
+"""
+Prometheus self-instrumentation
+"""
+import time
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+# Seconds; the usual Prometheus client defaults
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+UNMATCHED = "<unmatched>"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+
+
+class Histogram:
+    """Fixed-bucket histogram; observing is a bisect and two additions"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str, out: List[str]) -> None:
+        sep = "," if labels else ""
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            out.append(f'{name}_bucket{{{labels}{sep}le="{bound:g}"}} {cumulative}')
+        out.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        out.append(f"{name}_sum{{{labels}}} {self.sum}")
+        out.append(f"{name}_count{{{labels}}} {self.count}")
+
+
+class RouteMetrics:
+    """Counters of one (method, route template); labels are built once"""
+
+    __slots__ = ("labels", "latency", "statuses")
+
+    def __init__(self, method: str, template: str):
+        self.labels = _labels(method=method, route=template)
+        self.latency = Histogram()
+        self.statuses: Dict[int, int] = {}
+
+    def observe(self, status: int, seconds: float) -> None:
+        self.latency.observe(seconds)
+        statuses = self.statuses
+        statuses[status] = statuses.get(status, 0) + 1
+
+
+class HttpMetrics:
+    """Per-route request counts and latency plus the in-flight gauge"""
+
+    def __init__(self):
+        # template -> method -> RouteMetrics
+        self.routes: Dict[str, Dict[str, RouteMetrics]] = {}
+        self.in_flight = 0
+
+    def route(self, method: str, template: str) -> RouteMetrics:
+        methods = self.routes.get(template)
+        if methods is None:
+            methods = self.routes[template] = {}
+        metrics = methods.get(method)
+        if metrics is None:
+            metrics = methods[method] = RouteMetrics(method, template)
+        return metrics
+
+    def render(self, out: List[str]) -> None:
+        out.append("# HELP netmon_http_requests_in_flight Requests being served")
+        out.append("# TYPE netmon_http_requests_in_flight gauge")
+        out.append(f"netmon_http_requests_in_flight {self.in_flight}")
+
+        routes = [m for methods in self.routes.values() for m in methods.values()]
+        out.append("# HELP netmon_http_requests_total Requests by route template and status")
+        out.append("# TYPE netmon_http_requests_total counter")
+        for metrics in routes:
+            for status, count in sorted(metrics.statuses.items()):
+                out.append(f'netmon_http_requests_total{{{metrics.labels},status="{status}"}} {count}')
+        out.append("# HELP netmon_http_request_duration_seconds Request latency by route template")
+        out.append("# TYPE netmon_http_request_duration_seconds histogram")
+        for metrics in routes:
+            metrics.latency.render("netmon_http_request_duration_seconds", metrics.labels, out)
+
+
+class PrometheusMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request.
+
+    Requests are labelled by the matched route template (`/api/v1/hosts/{host_id}`),
+    never the raw path, so label cardinality is bounded by the route table.
+    """
+
+    def __init__(self, app, metrics: HttpMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.in_flight -= 1
+            route = scope.get("route")
+            template = getattr(route, "path", None) or UNMATCHED
+            metrics.route(scope["method"], template).observe(status, elapsed)
+
+
+class PoolMetrics:
+    """Checkout wait time of a SQLAlchemy pool plus its size gauges"""
+
+    def __init__(self, name: str, pool):
+        self.name = name
+        self.labels = _labels(pool=name)
+        self.pool = pool
+        self.wait = Histogram()
+        # The pool has no wait-time event; time its internal checkout call,
+        # which is where a caller blocks when every connection is in use
+        do_get = pool._do_get
+        wait = self.wait
+
+        def timed_do_get():
+            started = time.perf_counter()
+            try:
+                return do_get()
+            finally:
+                wait.observe(time.perf_counter() - started)
+
+        pool._do_get = timed_do_get
+
+    def gauges(self) -> Dict[str, int]:
+        pool = self.pool
+        values = {}
+        for name in ("size", "checkedout", "overflow", "checkedin"):
+            method = getattr(pool, name, None)
+            if method is not None:
+                values[name] = method()
+        return values
+
+
+http_metrics = HttpMetrics()
+
+
+def _counter(out: List[str], name: str, help_text: str, samples) -> None:
+    out.append(f"# HELP {name} {help_text}")
+    out.append(f"# TYPE {name} counter")
+    for labels, value in samples:
+        out.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+
+def _gauge(out: List[str], name: str, help_text: str, samples) -> None:
+    out.append(f"# HELP {name} {help_text}")
+    out.append(f"# TYPE {name} gauge")
+    for labels, value in samples:
+        out.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+
+def render_metrics(pools: List[PoolMetrics]) -> str:
+    """Prometheus text exposition of this worker's metrics"""
+    from api.core.security import principal_cache
+    from api.services.buffer import ingest_buffer
+    from api.services.events import event_broker
+    from api.services.ingest import ingest_stats
+    from api.services.items import item_registry
+    from api.services.latest import latest_values
+
+    out: List[str] = []
+    http_metrics.render(out)
+
+    out.append("# HELP netmon_db_pool_connections SQLAlchemy pool connections by state")
+    out.append("# TYPE netmon_db_pool_connections gauge")
+    for pool in pools:
+        for state, value in pool.gauges().items():
+            out.append(f'netmon_db_pool_connections{{{pool.labels},state="{state}"}} {value}')
+    out.append("# HELP netmon_db_pool_wait_seconds Time spent waiting for a pooled connection")
+    out.append("# TYPE netmon_db_pool_wait_seconds histogram")
+    for pool in pools:
+        pool.wait.render("netmon_db_pool_wait_seconds", pool.labels, out)
+
+    _counter(out, "netmon_ingest_rows_total", "Metric rows written; rate() gives rows per second",
+             [("", ingest_stats.rows)])
+    _counter(out, "netmon_ingest_writes_total", "Ingestion transactions", [("", ingest_stats.writes)])
+    buffer = ingest_buffer.stats()
+    _gauge(out, "netmon_ingest_buffer_depth", "Points waiting in the ingestion buffer",
+           [("", buffer["depth"])])
+    _counter(out, "netmon_ingest_buffer_rejected_total", "Points refused with 429",
+             [("", buffer["rejected"])])
+    _counter(out, "netmon_ingest_buffer_dropped_total", "Buffered points that failed to write",
+             [("", buffer["dropped"])])
+    _gauge(out, "netmon_ingest_buffer_last_flush_seconds", "Duration of the last flush",
+           [("", buffer["last_flush_seconds"])])
+    _gauge(out, "netmon_ingest_buffer_rows_per_flush", "Average rows per flush",
+           [("", buffer["avg_rows_per_flush"])])
+
+    _gauge(out, "netmon_event_subscribers", "Open event streams", [("", len(event_broker))])
+    _counter(out, "netmon_event_dropped_total", "Event streams dropped for falling behind",
+             [("", event_broker.dropped)])
+
+    caches = (("principal", principal_cache), ("item_registry", item_registry))
+    _counter(out, "netmon_cache_hits_total", "Cache hits",
+             [(_labels(cache=name), cache.hits) for name, cache in caches])
+    _counter(out, "netmon_cache_misses_total", "Cache misses",
+             [(_labels(cache=name), cache.misses) for name, cache in caches])
+    _gauge(out, "netmon_cache_hit_ratio", "Hits over lookups since start", [
+        (_labels(cache=name), cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0.0)
+        for name, cache in caches
+    ])
+    _counter(out, "netmon_latest_values_redis_errors_total", "Redis failures in the latest-value cache",
+             [("", latest_values.redis_errors)])
+
+    out.append("")
+    return "\n".join(out)
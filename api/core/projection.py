@@ -0,0 +1,54 @@
+"""
+Column projection and fast serialization for list endpoints
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Type
+from fastapi import HTTPException, status
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+
+def response_columns(model, schema: Type[BaseModel]) -> Dict[str, Any]:
+    """Model column behind each field of a response schema, in schema order"""
+    return {name: getattr(model, name) for name in schema.model_fields}
+
+
+def select_fields(columns: Dict[str, Any], fields: Optional[str]) -> List[str]:
+    """Field names from a `fields=a,b` parameter; every field when absent"""
+    if not fields:
+        return list(columns)
+    wanted = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in wanted if f not in columns]
+    if unknown or not wanted:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields requested",
+        )
+    return wanted
+
+
+def projected_columns(columns: Dict[str, Any], names: List[str], sort_key: Sequence[Any]) -> List[Any]:
+    """
+    Columns to select: the requested ones, then the sort key.
+
+    The sort key is always selected so the cursor can be built, but rows
+    are cut back to the requested fields when serialized.
+    """
+    return [columns[name] for name in names] + list(sort_key)
+
+
+def page_response(
+    rows: Sequence[Sequence[Any]],
+    names: List[str],
+    limit: int,
+    cursor_of: Callable[[Sequence[Any]], str],
+) -> ORJSONResponse:
+    """
+    `{items, next_cursor}` built straight from Core rows.
+
+    Rows come from a query with `limit + 1`; the extra row only signals a
+    next page. Items skip ORM objects and response-model validation and are
+    encoded by orjson.
+    """
+    next_cursor = cursor_of(rows[limit - 1]) if len(rows) > limit else None
+    items = [dict(zip(names, row)) for row in rows[:limit]]
+    return ORJSONResponse({"items": items, "next_cursor": next_cursor})
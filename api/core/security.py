@@ -1,19 +1,209 @@
 """
 Security utilities
 """
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, NamedTuple, Optional, Set, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthCredentials
+from fastapi import Depends, HTTPException, Query, Request, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from api.core.config import settings
-from api.db.database import get_db
-from api.db.models import User
-from sqlalchemy.orm import Session
+from api.db.database import get_async_db
+from api.db.models import ApiKey, User
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+
+class PrincipalCache:
+    """
+    Bounded LRU + TTL cache of authenticated users.
+
+    Entries are keyed by (sub, exp) of the verified token and never outlive
+    the token itself. Cached users are detached from any session, so only
+    their loaded column values may be used.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[User, float]]" = OrderedDict()
+        self._keys_by_user: Dict[str, Set[Tuple[str, int]]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple[str, int]) -> Optional[User]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                user, expires = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return user
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple[str, int], user: User, token_exp: int) -> None:
+        expires = time.monotonic() + min(self.ttl, token_exp - time.time())
+        with self._lock:
+            self._entries[key] = (user, expires)
+            self._entries.move_to_end(key)
+            self._keys_by_user.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Tuple[str, int]) -> None:
+        self._entries.pop(key, None)
+        keys = self._keys_by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[0]]
+
+    def invalidate_user(self, username: str) -> None:
+        """Drop every cached token of a user, e.g. after deactivation"""
+        with self._lock:
+            for key in list(self._keys_by_user.get(username, ())):
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+
+principal_cache = PrincipalCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
+
+
+API_KEY_PREFIX = "nm_"
+
+
+class ApiKeyEntry(NamedTuple):
+    user: User
+    host_id: Optional[int]
+    key_id: int
+    expires: float
+
+
+class ApiKeyCache:
+    """
+    Verified API keys by the presented key string.
+
+    A hit is one dict lookup and a clock comparison. Entries expire after
+    API_KEY_CACHE_TTL_SECONDS (or the key's own expiry) so revocations made
+    by other workers apply within that window; local revocations apply at
+    once.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, ApiKeyEntry] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[ApiKeyEntry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires > time.monotonic():
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def put(self, key: str, user: User, api_key: ApiKey) -> ApiKeyEntry:
+        ttl = self.ttl
+        if api_key.expires_at is not None:
+            ttl = min(ttl, (api_key.expires_at - datetime.utcnow()).total_seconds())
+        entry = ApiKeyEntry(user, api_key.host_id, api_key.id, time.monotonic() + ttl)
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                del self._entries[next(iter(self._entries))]
+        return entry
+
+    def _drop(self, predicate) -> None:
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if predicate(e)]:
+                del self._entries[key]
+
+    def revoke(self, key_id: int) -> None:
+        self._drop(lambda entry: entry.key_id == key_id)
+
+    def invalidate_user(self, user_id: int) -> None:
+        self._drop(lambda entry: entry.user.id == user_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+api_key_cache = ApiKeyCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.API_KEY_CACHE_TTL_SECONDS,
+)
+
+
+def generate_api_key() -> Tuple[str, str]:
+    """(prefix, key); the key is shown to its owner once and never stored"""
+    prefix = secrets.token_hex(6)
+    return prefix, f"{API_KEY_PREFIX}{prefix}_{secrets.token_urlsafe(32)}"
+
+
+def hash_api_key(key: str) -> str:
+    """HMAC-SHA256 keyed by SECRET_KEY; keys are random, so no slow hash is needed"""
+    return hmac.new(settings.SECRET_KEY.encode(), key.encode(), hashlib.sha256).hexdigest()
+
+
+def api_key_host_scope(request: Request) -> Optional[int]:
+    """Host an API-key-authenticated request is limited to, if any"""
+    return getattr(request.state, "api_key_host_id", None)
+
+
+def check_host_scope(request: Request, host_ids) -> None:
+    """403 unless a host-scoped API key covers every host in host_ids"""
+    scope = api_key_host_scope(request)
+    if scope is not None and set(host_ids) - {scope}:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"API key is limited to host {scope}"
+        )
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_principal(mapper, connection, target: User) -> None:
+    """
+    Evict users changed through the ORM, including renames.
+
+    Bulk query.update() bypasses mapper events; call
+    principal_cache.invalidate_user() after those.
+    """
+    principal_cache.invalidate_user(target.username)
+    api_key_cache.invalidate_user(target.id)
+    for old_name in inspect(target).attrs.username.history.deleted or ():
+        principal_cache.invalidate_user(old_name)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -36,26 +226,135 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def get_current_user(
-    credentials: HTTPAuthCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    credential_exception = HTTPException(
+def _credential_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+async def _verify_api_key(db: AsyncSession, key: str) -> ApiKeyEntry:
+    prefix = key[len(API_KEY_PREFIX):].partition("_")[0]
+    result = await db.execute(select(ApiKey).where(ApiKey.prefix == prefix))
+    api_key = result.scalars().first()
+    if (
+        api_key is None
+        or not hmac.compare_digest(api_key.key_hash, hash_api_key(key))
+        or api_key.revoked_at is not None
+        or (api_key.expires_at is not None and api_key.expires_at <= datetime.utcnow())
+    ):
+        raise _credential_exception()
+    
+    result = await db.execute(select(User).where(User.id == api_key.user_id))
+    user = result.scalars().first()
+    if user is None or not user.is_active:
+        raise _credential_exception()
+    
+    db.expunge(user)
+    return api_key_cache.put(key, user, api_key)
+
+
+def _decode_jwt(token: str, purpose: Optional[str] = None) -> dict:
+    """Verified claims of a JWT issued for purpose (None: an access token)"""
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credential_exception
     except JWTError:
-        raise credential_exception
+        raise _credential_exception()
+    if payload.get("sub") is None or payload.get("purpose") != purpose:
+        raise _credential_exception()
+    return payload
+
+
+async def _jwt_user(db: AsyncSession, payload: dict) -> User:
+    username: str = payload["sub"]
+    cache_key = (username, payload.get("exp", 0))
+    user = principal_cache.get(cache_key)
+    if user is not None:
+        return user
+    
+    result = await db.execute(select(User).where(User.username == username))
+    user = result.scalars().first()
+    if user is None or not user.is_active:
+        raise _credential_exception()
     
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise credential_exception
+    db.expunge(user)
+    principal_cache.put(cache_key, user, payload.get("exp", 0))
     
     return user
+
+
+async def authenticate(request: Request, token: str, db: AsyncSession, api_keys: bool = False) -> User:
+    """User of a bearer token: a JWT, or an API key where api_keys allows it"""
+    if token.startswith(API_KEY_PREFIX):
+        if not api_keys:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="API keys can only be used for ingestion"
+            )
+        entry = api_key_cache.get(token) or await _verify_api_key(db, token)
+        request.state.api_key_host_id = entry.host_id
+        return entry.user
+    
+    return await _jwt_user(db, _decode_jwt(token))
+
+
+STREAM_TICKET_PURPOSE = "events-stream"
+
+
+def create_stream_ticket(user: User, host_id: Optional[int]) -> str:
+    """
+    Short-lived JWT that opens the event stream and nothing else.
+
+    Carries the API key's host scope, if any, so the stream stays limited
+    to that host.
+    """
+    data = {"sub": user.username, "purpose": STREAM_TICKET_PURPOSE}
+    if host_id is not None:
+        data["host_id"] = host_id
+    return create_access_token(data, timedelta(seconds=settings.EVENTS_TICKET_SECONDS))
+
+
+async def get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """User of a JWT; API keys are refused"""
+    return await authenticate(request, credentials.credentials, db)
+
+
+async def get_ingest_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """
+    get_current_user that also accepts API keys.
+
+    Only for what an agent needs: metric ingestion and registering its own
+    host. Routes must apply the key's host scope (check_host_scope).
+    """
+    return await authenticate(request, credentials.credentials, db, api_keys=True)
+
+
+async def get_stream_user(
+    request: Request,
+    ticket: Optional[str] = Query(None, description="Ticket from POST /events/ticket, for clients that cannot set headers"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """
+    get_ingest_user that also accepts `?ticket=`.
+
+    Browsers' EventSource cannot send an Authorization header. Access tokens
+    and API keys never go in the URL, where proxies and access logs keep
+    them; the query only takes a stream ticket.
+    """
+    if credentials is not None:
+        return await authenticate(request, credentials.credentials, db, api_keys=True)
+    if not ticket:
+        raise _credential_exception()
+    payload = _decode_jwt(ticket, STREAM_TICKET_PURPOSE)
+    request.state.api_key_host_id = payload.get("host_id")
+    return await _jwt_user(db, payload)
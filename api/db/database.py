@@ -1,18 +1,73 @@
 """
 Database connection
 """
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import logging
+from typing import Callable, TypeVar
+from sqlalchemy import and_, create_engine, event, or_, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool
 from api.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Process-wide cache changes staged in a session until its transaction commits
+_ON_COMMIT = "netmon_on_commit"
+
+
+def _pool_options(url: str) -> dict:
+    # SQLite connections are cheap and aiosqlite runs each one in its own
+    # thread, so pooling only gets in the way there
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+
+
+def async_database_url(url: str) -> str:
+    """Async driver URL for a sync SQLALCHEMY_DATABASE_URL"""
+    scheme, sep, rest = url.partition("://")
+    driver = {
+        "postgresql": "postgresql+asyncpg",
+        "postgresql+psycopg2": "postgresql+asyncpg",
+        "postgres": "postgresql+asyncpg",
+        "sqlite": "sqlite+aiosqlite",
+    }.get(scheme, scheme)
+    return f"{driver}{sep}{rest}"
+
+
 engine = create_engine(
     settings.SQLALCHEMY_DATABASE_URL,
     echo=False,
     pool_pre_ping=True,
+    **_pool_options(settings.SQLALCHEMY_DATABASE_URL),
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+ASYNC_DATABASE_URL = settings.SQLALCHEMY_ASYNC_DATABASE_URL or async_database_url(
+    settings.SQLALCHEMY_DATABASE_URL
+)
+
+_async_pool = _pool_options(ASYNC_DATABASE_URL) if settings.DB_ASYNC_POOL else {}
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=False,
+    pool_pre_ping=True,
+    **(_async_pool or {"poolclass": NullPool}),
+)
+
+# Objects stay usable after commit; the async session cannot lazy-load
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 
 def get_db():
     db = SessionLocal()
@@ -20,3 +75,60 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def dialect_insert(db: Session, model):
+    """INSERT construct supporting ON CONFLICT for the session's database"""
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(model)
+    return postgresql.insert(model)
+
+
+def tuple_in(db: Session, columns, keys):
+    """`(a, b) IN ((1, 2), ...)` that every database answers from an index"""
+    if db.get_bind().dialect.name == "sqlite":
+        # SQLite scans the whole table for a row-value IN of several rows
+        return or_(*(and_(*(c == v for c, v in zip(columns, key))) for key in keys))
+    return tuple_(*columns).in_(keys)
+
+
+def on_commit(db: Session, key, factory: Callable[[], T], apply: Callable[[T], None]) -> T:
+    """
+    Value staged under key in the session's current transaction.
+
+    factory creates it on first use. Once the transaction commits,
+    apply(value) runs; after a rollback, or a close without commit, the
+    value is dropped. Caches keep only what is durable this way.
+    """
+    staged = db.info.setdefault(_ON_COMMIT, {})
+    entry = staged.get(key)
+    if entry is None:
+        entry = staged[key] = (factory(), apply)
+    return entry[0]
+
+
+def staged_value(db: Session, key):
+    """What on_commit staged under key in the current transaction, if anything"""
+    entry = db.info.get(_ON_COMMIT, {}).get(key)
+    return entry[0] if entry is not None else None
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed(session: Session) -> None:
+    for value, apply in session.info.pop(_ON_COMMIT, {}).values():
+        try:
+            apply(value)
+        except Exception:
+            # The transaction is committed already; do not fail the caller
+            logger.exception("Applying committed changes failed")
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_uncommitted(session: Session, transaction) -> None:
+    if transaction.parent is None:
+        session.info.pop(_ON_COMMIT, None)
@@ -0,0 +1,168 @@
+"""
+Versioned schema migrations
+
+Migrations are modules in api/db/migrations named `NNNN_description.py`
+with an `upgrade(conn)` function. Each runs in its own transaction and is
+recorded in `schema_migrations`, so every version is applied once.
+
+    python -m api.db.migrate           apply pending migrations, then
+                                       partition metrics if
+                                       METRICS_PARTITIONING asks for it
+    python -m api.db.migrate --status  list applied and pending versions
+"""
+import argparse
+import importlib
+import logging
+import pkgutil
+import re
+import sys
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Set
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+PACKAGE = "api.db.migrations"
+
+# Arbitrary constant; serializes migration runs of several servers on PostgreSQL
+_LOCK_KEY = 4_127_903
+
+_NAME = re.compile(r"^(\d{4})_(\w+)$")
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", String(16), primary_key=True),
+    Column("name", String(255)),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+
+class Migration(NamedTuple):
+    version: str
+    name: str
+    upgrade: Callable[[Connection], None]
+
+
+def discover() -> List[Migration]:
+    """All migrations, in version order"""
+    package = importlib.import_module(PACKAGE)
+    migrations = []
+    for module in pkgutil.iter_modules(package.__path__):
+        match = _NAME.match(module.name)
+        if not match:
+            continue
+        loaded = importlib.import_module(f"{PACKAGE}.{module.name}")
+        migrations.append(Migration(match.group(1), match.group(2), loaded.upgrade))
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions in {PACKAGE}")
+    return sorted(migrations)
+
+
+def applied_versions(conn: Connection) -> Set[str]:
+    schema_migrations.create(conn, checkfirst=True)
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending(engine: Engine) -> List[Migration]:
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    return [m for m in discover() if m.version not in done]
+
+
+def upgrade(engine: Engine) -> List[str]:
+    """Apply pending migrations; returns the versions applied"""
+    applied = []
+    postgres = engine.dialect.name == "postgresql"
+    with engine.connect() as conn:
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _LOCK_KEY})
+            conn.commit()
+        try:
+            with conn.begin():
+                done = applied_versions(conn)
+            for migration in discover():
+                if migration.version in done:
+                    continue
+                logger.info("Applying migration %s_%s", migration.version, migration.name)
+                with conn.begin():
+                    migration.upgrade(conn)
+                    conn.execute(schema_migrations.insert().values(
+                        version=migration.version, name=migration.name, applied_at=datetime.utcnow()
+                    ))
+                applied.append(migration.version)
+        finally:
+            if postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _LOCK_KEY})
+                conn.commit()
+    return applied
+
+
+# Helpers for migrations that must also run against schemas that already
+# have the change, e.g. databases created from a newer baseline
+
+def has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+
+def has_index(conn: Connection, table: str, index: str) -> bool:
+    return any(i["name"] == index for i in inspect(conn).get_indexes(table))
+
+
+def has_table(conn: Connection, table: str) -> bool:
+    return inspect(conn).has_table(table)
+
+
+# PostgreSQL spellings in frozen DDL and what SQLite (tests, benchmarks) takes
+_SQLITE_DDL = [
+    ("BIGSERIAL PRIMARY KEY", "INTEGER PRIMARY KEY"),
+    ("SERIAL PRIMARY KEY", "INTEGER PRIMARY KEY"),
+    ("JSONB", "JSON"),
+]
+
+
+def run_ddl(conn: Connection, sql: str) -> None:
+    """
+    Run `;`-separated PostgreSQL DDL, adapted on SQLite.
+
+    Migrations spell their schema out rather than use the models, so that
+    each stays what it was when released.
+    """
+    if conn.dialect.name == "sqlite":
+        for postgres, sqlite in _SQLITE_DDL:
+            sql = sql.replace(postgres, sqlite)
+    for statement in sql.split(";"):
+        if statement.strip():
+            conn.execute(text(statement))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument("--status", action="store_true", help="List migrations without applying them")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from api.db.database import engine
+
+    if args.status:
+        waiting = {m.version for m in pending(engine)}
+        for migration in discover():
+            state = "pending" if migration.version in waiting else "applied"
+            print(f"{migration.version}_{migration.name}  {state}")
+        return 0
+
+    applied = upgrade(engine)
+    print(f"Applied {len(applied)} migration(s)" + (f": {', '.join(applied)}" if applied else ""))
+
+    # Not a migration: it follows METRICS_PARTITIONING whenever that is set
+    from api.services.partitions import setup_partitioning
+
+    if setup_partitioning(engine):
+        print("Converted metrics to a partitioned table")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
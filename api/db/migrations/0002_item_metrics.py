@@ -0,0 +1,90 @@
+"""
+Metrics stored by item
+
+Every (host_id, key) gets one item, unique from now on, and a sample keeps
+only (item_id, value, timestamp). Existing samples are assigned the item of
+their host and key, creating items as needed. Rewrites the metrics table:
+on a large database, run it in a maintenance window.
+"""
+from sqlalchemy import inspect, text
+from api.db.migrate import has_column, has_index, run_ddl
+
+ITEM_TABLES = ("metrics", "triggers")
+
+SQLITE_METRICS = """
+CREATE TABLE metrics_new (
+    id INTEGER PRIMARY KEY,
+    item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+    value FLOAT NOT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO metrics_new (id, item_id, value, timestamp) SELECT id, item_id, value, timestamp FROM metrics;
+DROP TABLE metrics;
+ALTER TABLE metrics_new RENAME TO metrics
+"""
+
+
+def _has_unique(conn, table: str, columns) -> bool:
+    inspector = inspect(conn)
+    return any(c["column_names"] == columns for c in inspector.get_unique_constraints(table)) or any(
+        i["unique"] and i["column_names"] == columns for i in inspector.get_indexes(table)
+    )
+
+
+def _unique_items(conn) -> None:
+    # One item per (host_id, key): rows pointing at a duplicate move to the first
+    first = "SELECT MIN(i.id) FROM items i WHERE i.host_id = {t}.host_id AND i.key = {t}.key"
+    for table in ITEM_TABLES:
+        if has_column(conn, table, "key"):
+            conn.execute(text(
+                f"UPDATE {table} SET item_id = ({first.format(t=table)}) WHERE item_id IS NOT NULL"
+            ))
+    conn.execute(text("DELETE FROM items WHERE id NOT IN (SELECT MIN(id) FROM items GROUP BY host_id, key)"))
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE items ADD CONSTRAINT uq_items_host_id_key UNIQUE (host_id, key)"))
+    else:
+        # SQLite cannot add a constraint; a unique index enforces the same
+        conn.execute(text("CREATE UNIQUE INDEX uq_items_host_id_key ON items (host_id, key)"))
+
+
+def _item_metrics(conn) -> None:
+    conn.execute(text(
+        "INSERT INTO items (host_id, key, value_type, created_at) "
+        "SELECT DISTINCT m.host_id, m.key, 'numeric', CURRENT_TIMESTAMP FROM metrics m "
+        "WHERE NOT EXISTS (SELECT 1 FROM items i WHERE i.host_id = m.host_id AND i.key = m.key)"
+    ))
+    conn.execute(text(
+        "UPDATE metrics SET item_id = "
+        "(SELECT i.id FROM items i WHERE i.host_id = metrics.host_id AND i.key = metrics.key)"
+    ))
+
+    if conn.dialect.name == "postgresql":
+        for fk in inspect(conn).get_foreign_keys("metrics"):
+            if fk["constrained_columns"] == ["item_id"]:
+                conn.execute(text(f'ALTER TABLE metrics DROP CONSTRAINT "{fk["name"]}"'))
+        run_ddl(conn, """
+            ALTER TABLE metrics DROP COLUMN host_id, DROP COLUMN key, DROP COLUMN created_at,
+                ALTER COLUMN item_id SET NOT NULL, ALTER COLUMN id TYPE BIGINT;
+            ALTER SEQUENCE metrics_id_seq AS BIGINT;
+            ALTER TABLE metrics ADD CONSTRAINT metrics_item_id_fkey
+                FOREIGN KEY (item_id) REFERENCES items(id) ON DELETE CASCADE
+        """)
+    else:
+        # SQLite cannot drop columns that carry a foreign key
+        run_ddl(conn, SQLITE_METRICS)
+
+
+def upgrade(conn):
+    if not _has_unique(conn, "items", ["host_id", "key"]):
+        _unique_items(conn)
+    if has_column(conn, "metrics", "host_id"):
+        _item_metrics(conn)
+
+    if not has_index(conn, "metrics", "ix_metrics_item_id_timestamp"):
+        include = " INCLUDE (value)" if conn.dialect.name == "postgresql" else ""
+        conn.execute(text(f"CREATE INDEX ix_metrics_item_id_timestamp ON metrics (item_id, timestamp){include}"))
+    # The SQLite rebuild loses idx_metrics_timestamp; 0007 renames it elsewhere
+    if not has_index(conn, "metrics", "ix_metrics_timestamp") and not has_index(
+        conn, "metrics", "idx_metrics_timestamp"
+    ):
+        conn.execute(text("CREATE INDEX ix_metrics_timestamp ON metrics (timestamp)"))
@@ -0,0 +1,24 @@
+"""
+Per-item 1-minute and 1-hour rollup tables
+"""
+from api.db.migrate import has_table, run_ddl
+
+ROLLUP = """
+CREATE TABLE {table} (
+    item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+    bucket TIMESTAMP NOT NULL,
+    count INTEGER DEFAULT 0,
+    sum FLOAT DEFAULT 0,
+    min FLOAT,
+    max FLOAT,
+    sketch JSON,
+    PRIMARY KEY (item_id, bucket)
+);
+CREATE INDEX ix_{table}_bucket ON {table}(bucket)
+"""
+
+
+def upgrade(conn):
+    for table in ("metric_rollups_1m", "metric_rollups_1h"):
+        if not has_table(conn, table):
+            run_ddl(conn, ROLLUP.format(table=table))
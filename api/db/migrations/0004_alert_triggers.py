@@ -0,0 +1,12 @@
+"""
+Alerts record the trigger that raised them
+"""
+from sqlalchemy import text
+from api.db.migrate import has_column
+
+
+def upgrade(conn):
+    if not has_column(conn, "alerts", "trigger_id"):
+        conn.execute(text(
+            "ALTER TABLE alerts ADD COLUMN trigger_id INTEGER REFERENCES triggers(id) ON DELETE SET NULL"
+        ))
@@ -0,0 +1,23 @@
+"""
+API keys for agents
+"""
+from api.db.migrate import has_table, run_ddl
+
+SCHEMA = """
+CREATE TABLE api_keys (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    host_id INTEGER REFERENCES hosts(id) ON DELETE CASCADE,
+    name VARCHAR(255),
+    prefix VARCHAR(16) UNIQUE NOT NULL,
+    key_hash VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP,
+    revoked_at TIMESTAMP
+)
+"""
+
+
+def upgrade(conn):
+    if not has_table(conn, "api_keys"):
+        run_ddl(conn, SCHEMA)
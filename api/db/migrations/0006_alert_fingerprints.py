@@ -0,0 +1,19 @@
+"""
+Alert deduplication columns and the active-fingerprint index
+"""
+from sqlalchemy import text
+from api.db.migrate import has_column, has_index
+
+
+def upgrade(conn):
+    if not has_column(conn, "alerts", "fingerprint"):
+        conn.execute(text("ALTER TABLE alerts ADD COLUMN fingerprint VARCHAR(40)"))
+    if not has_column(conn, "alerts", "occurrences"):
+        conn.execute(text("ALTER TABLE alerts ADD COLUMN occurrences INTEGER NOT NULL DEFAULT 1"))
+    if not has_column(conn, "alerts", "last_seen_at"):
+        conn.execute(text("ALTER TABLE alerts ADD COLUMN last_seen_at TIMESTAMP"))
+    if not has_index(conn, "alerts", "ux_alerts_active_fingerprint"):
+        conn.execute(text(
+            "CREATE UNIQUE INDEX ux_alerts_active_fingerprint ON alerts (fingerprint) "
+            "WHERE status = 'active'"
+        ))
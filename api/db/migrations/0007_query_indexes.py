@@ -0,0 +1,112 @@
+"""
+Indexes matched to the queries, under one naming scheme
+
+Drops single-column indexes that a primary key, a unique constraint or a
+composite index already covers, renames the idx_* indexes of init.sql to
+the models' ix_* names and adds the indexes the keyset pages and the
+trigger refresh need.
+
+On PostgreSQL it also makes ix_metrics_item_id_timestamp covering and puts
+item_id first in the rollup primary keys. Rebuilding that metrics index
+locks out writes for as long as it takes; on a large table, build it first
+with CREATE INDEX CONCURRENTLY under a temporary name, drop the old one and
+rename the new one. This migration then finds it and leaves it alone.
+"""
+from sqlalchemy import inspect, text
+from api.db.migrate import has_index
+
+# Covered by a primary key, unique constraint or composite index, or unused
+REDUNDANT = {
+    "users": ["ix_users_id"],
+    "api_keys": ["ix_api_keys_id", "idx_api_keys_user_id"],
+    "hosts": ["ix_hosts_id", "ix_hosts_ip_address", "idx_hosts_user_id"],
+    "items": ["ix_items_id", "ix_items_host_id", "ix_items_key"],
+    "metrics": ["idx_metrics_timestamp"],
+    "alerts": ["ix_alerts_id", "ix_alerts_host_id", "idx_alerts_host_id", "idx_alerts_trigger_id"],
+    "triggers": ["ix_triggers_id", "ix_triggers_host_id", "idx_triggers_host_id"],
+}
+
+# Unique indexes create_all made for unique=True, index=True columns; on
+# PostgreSQL they become the constraints init.sql declares
+UNIQUE_INDEXES = {
+    "users": [("ix_users_username", "users_username_key"), ("ix_users_email", "users_email_key")],
+    "api_keys": [("ix_api_keys_prefix", "api_keys_prefix_key")],
+    "hosts": [("ix_hosts_name", "hosts_name_key")],
+}
+
+INDEXES = {
+    "api_keys": [
+        ("ix_api_keys_user_id", "user_id"),
+        ("ix_api_keys_host_id", "host_id"),
+    ],
+    "metrics": [
+        ("ix_metrics_timestamp", "timestamp"),
+    ],
+    "triggers": [
+        ("ix_triggers_host_id_id", "host_id, id"),
+        ("ix_triggers_item_id", "item_id"),
+        ("ix_triggers_updated_at", "updated_at"),
+    ],
+    "alerts": [
+        ("ix_alerts_trigger_id", "trigger_id"),
+        ("ix_alerts_triggered_at_id", "triggered_at, id"),
+        ("ix_alerts_host_id_triggered_at_id", "host_id, triggered_at, id"),
+        ("ix_alerts_status_triggered_at_id", "status, triggered_at, id"),
+        ("ix_alerts_host_id_status_triggered_at_id", "host_id, status, triggered_at, id"),
+    ],
+}
+
+
+def _covering_metrics_index(conn) -> None:
+    for index in inspect(conn).get_indexes("metrics"):
+        if index["name"] == "ix_metrics_item_id_timestamp":
+            if index.get("dialect_options", {}).get("postgresql_include") == ["value"]:
+                return
+            conn.execute(text("DROP INDEX ix_metrics_item_id_timestamp"))
+    conn.execute(text(
+        "CREATE INDEX ix_metrics_item_id_timestamp ON metrics (item_id, timestamp) INCLUDE (value)"
+    ))
+
+
+def _rollup_primary_key(conn, table: str) -> None:
+    pk = inspect(conn).get_pk_constraint(table)
+    if pk["constrained_columns"] != ["item_id", "bucket"]:
+        conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{pk["name"]}"'))
+        conn.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (item_id, bucket)"))
+
+
+def upgrade(conn):
+    postgres = conn.dialect.name == "postgresql"
+    tables = set(inspect(conn).get_table_names())
+
+    for table, names in REDUNDANT.items():
+        for name in names:
+            if table in tables and has_index(conn, table, name):
+                conn.execute(text(f"DROP INDEX {name}"))
+
+    if postgres:
+        for table, pairs in UNIQUE_INDEXES.items():
+            if table not in tables:
+                continue
+            constraints = {c["name"] for c in inspect(conn).get_unique_constraints(table)}
+            for index, constraint in pairs:
+                if not has_index(conn, table, index):
+                    continue
+                if constraint in constraints:
+                    conn.execute(text(f"DROP INDEX {index}"))
+                else:
+                    conn.execute(text(
+                        f"ALTER TABLE {table} ADD CONSTRAINT {constraint} UNIQUE USING INDEX {index}"
+                    ))
+
+    for table, indexes in INDEXES.items():
+        for name, columns in indexes:
+            if table in tables and not has_index(conn, table, name):
+                conn.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+
+    if postgres:
+        if "metrics" in tables:
+            _covering_metrics_index(conn)
+        for table in ("metric_rollups_1m", "metric_rollups_1h"):
+            if table in tables:
+                _rollup_primary_key(conn, table)
@@ -0,0 +1,48 @@
+"""
+Soft-deleted hosts and purge jobs
+
+Host names stay unique among live hosts only, so a deleted host's name can
+be reused while its data is still being purged. On SQLite a UNIQUE that is
+part of the table definition cannot be dropped; such databases keep names
+taken until the purge has finished.
+"""
+from sqlalchemy import inspect, text
+from api.db.migrate import has_column, has_index, has_table, run_ddl
+
+PURGE_JOBS = """
+CREATE TABLE purge_jobs (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    host_ids JSON NOT NULL,
+    status VARCHAR(50) NOT NULL DEFAULT 'pending',
+    deleted JSON,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX ix_purge_jobs_status_id ON purge_jobs(status, id)
+"""
+
+
+def upgrade(conn):
+    if not has_column(conn, "hosts", "deleted_at"):
+        conn.execute(text("ALTER TABLE hosts ADD COLUMN deleted_at TIMESTAMP"))
+    if not has_table(conn, "purge_jobs"):
+        run_ddl(conn, PURGE_JOBS)
+
+    if conn.dialect.name == "postgresql":
+        for constraint in inspect(conn).get_unique_constraints("hosts"):
+            if constraint["column_names"] == ["name"]:
+                conn.execute(text(f'ALTER TABLE hosts DROP CONSTRAINT "{constraint["name"]}"'))
+    if has_index(conn, "hosts", "ix_hosts_name"):
+        conn.execute(text("DROP INDEX ix_hosts_name"))
+    if not has_index(conn, "hosts", "ux_hosts_name"):
+        conn.execute(text("CREATE UNIQUE INDEX ux_hosts_name ON hosts (name) WHERE deleted_at IS NULL"))
+
+    # Partial from now on; cheap to rebuild, hosts is a small table
+    if has_index(conn, "hosts", "ix_hosts_user_id_id"):
+        conn.execute(text("DROP INDEX ix_hosts_user_id_id"))
+    conn.execute(text("CREATE INDEX ix_hosts_user_id_id ON hosts (user_id, id) WHERE deleted_at IS NULL"))
@@ -0,0 +1,3 @@
+"""
+Schema migrations, applied in version order by api.db.migrate
+"""
@@ -1,10 +1,14 @@
 """
 Database models
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, JSON, Enum
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, Float, DateTime, Boolean, ForeignKey, JSON, Enum,
+    Index, PrimaryKeyConstraint, UniqueConstraint, text,
+)
+from sqlalchemy.ext.declarative import declarative_base, declared_attr
 from datetime import datetime
 import enum
+from api.core.config import settings
 
 Base = declarative_base()
 
@@ -12,47 +16,144 @@ Base = declarative_base()
 class User(Base):
     __tablename__ = "users"
     
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, index=True)
-    email = Column(String, unique=True, index=True)
+    id = Column(Integer, primary_key=True)
+    username = Column(String, unique=True)
+    email = Column(String, unique=True)
     hashed_password = Column(String)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+class ApiKey(Base):
+    """Long-lived credential; only an HMAC of the secret is stored"""
+    __tablename__ = "api_keys"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
+    # Set for keys that may only ingest metrics of one host
+    host_id = Column(Integer, ForeignKey("hosts.id", ondelete="CASCADE"), index=True, nullable=True)
+    name = Column(String)
+    prefix = Column(String(16), unique=True, nullable=False)
+    key_hash = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=True)
+    revoked_at = Column(DateTime, nullable=True)
+
+
 class Host(Base):
+    """Deleting sets deleted_at; a PurgeJob removes the row and its data later"""
     __tablename__ = "hosts"
+    __table_args__ = (
+        # Both over live hosts only; a deleted host's name is free at once
+        Index(
+            "ix_hosts_user_id_id", "user_id", "id",
+            postgresql_where=text("deleted_at IS NULL"),
+            sqlite_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ux_hosts_name", "name", unique=True,
+            postgresql_where=text("deleted_at IS NULL"),
+            sqlite_where=text("deleted_at IS NULL"),
+        ),
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True, index=True)
-    ip_address = Column(String, index=True)
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    ip_address = Column(String)
     status = Column(String, default="unknown")
     tags = Column(JSON, default=[])
     user_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)
+
+
+class PurgeJob(Base):
+    """Deletes the data of soft-deleted hosts in the background, chunk by chunk"""
+    __tablename__ = "purge_jobs"
+    __table_args__ = (
+        Index("ix_purge_jobs_status_id", "status", "id"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    host_ids = Column(JSON, nullable=False)
+    # pending (again after a failed attempt), running or done
+    status = Column(String, default="pending", nullable=False)
+    # Rows deleted so far, per table
+    deleted = Column(JSON, default=dict)
+    attempts = Column(Integer, default=0, nullable=False)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Bumped with every chunk; a running job that stops moving is taken over
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
 
 class Item(Base):
     __tablename__ = "items"
+    __table_args__ = (
+        UniqueConstraint("host_id", "key", name="uq_items_host_id_key"),
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    host_id = Column(Integer, ForeignKey("hosts.id"), index=True)
-    key = Column(String, index=True)
+    id = Column(Integer, primary_key=True)
+    host_id = Column(Integer, ForeignKey("hosts.id", ondelete="CASCADE"))
+    key = Column(String)
     value_type = Column(String, default="numeric")
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+# Range-partitioned tables need the partition key in the primary key
+_METRICS_PARTITIONED = settings.METRICS_PARTITIONING in ("day", "week")
+
+
 class Metric(Base):
+    """One sample; host and key live on the item"""
     __tablename__ = "metrics"
+    __table_args__ = (
+        # Covering on PostgreSQL: series reads never visit the heap
+        Index("ix_metrics_item_id_timestamp", "item_id", "timestamp", postgresql_include=["value"]),
+        {"postgresql_partition_by": "RANGE (timestamp)"} if _METRICS_PARTITIONED else {},
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    host_id = Column(Integer, ForeignKey("hosts.id"), index=True)
-    item_id = Column(Integer, ForeignKey("items.id"), index=True, nullable=True)
-    key = Column(String, index=True)
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    item_id = Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), nullable=False)
     value = Column(Float)
-    timestamp = Column(DateTime, index=True, default=datetime.utcnow)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(
+        DateTime, index=True, default=datetime.utcnow,
+        primary_key=_METRICS_PARTITIONED, nullable=not _METRICS_PARTITIONED,
+    )
+
+
+class RollupMixin:
+    """Per-bucket aggregates of raw metrics for one item"""
+
+    @declared_attr
+    def __table_args__(cls):
+        # Spelled out: column order alone would put bucket first, and
+        # series reads look buckets up per item
+        return (PrimaryKeyConstraint("item_id", "bucket"),)
+
+    @declared_attr
+    def item_id(cls):
+        return Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), primary_key=True)
+
+    # Alone for retention, which deletes by age across all items
+    bucket = Column(DateTime, primary_key=True, index=True)
+    count = Column(Integer, default=0)
+    sum = Column(Float, default=0.0)
+    min = Column(Float, nullable=True)
+    max = Column(Float, nullable=True)
+    sketch = Column(JSON, nullable=True)
+
+
+class MetricRollup1m(RollupMixin, Base):
+    __tablename__ = "metric_rollups_1m"
+
+
+class MetricRollup1h(RollupMixin, Base):
+    __tablename__ = "metric_rollups_1h"
 
 
 class AlertLevel(str, enum.Enum):
@@ -64,9 +165,22 @@ class AlertLevel(str, enum.Enum):
 
 class Alert(Base):
     __tablename__ = "alerts"
+    __table_args__ = (
+        Index("ix_alerts_triggered_at_id", "triggered_at", "id"),
+        Index("ix_alerts_host_id_triggered_at_id", "host_id", "triggered_at", "id"),
+        Index("ix_alerts_status_triggered_at_id", "status", "triggered_at", "id"),
+        Index("ix_alerts_host_id_status_triggered_at_id", "host_id", "status", "triggered_at", "id"),
+        # At most one active alert per fingerprint; repeats bump that row
+        Index(
+            "ux_alerts_active_fingerprint", "fingerprint", unique=True,
+            postgresql_where=text("status = 'active'"),
+            sqlite_where=text("status = 'active'"),
+        ),
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    host_id = Column(Integer, ForeignKey("hosts.id"), index=True)
+    id = Column(Integer, primary_key=True)
+    host_id = Column(Integer, ForeignKey("hosts.id"))
+    trigger_id = Column(Integer, ForeignKey("triggers.id", ondelete="SET NULL"), index=True, nullable=True)
     title = Column(String)
     message = Column(String)
     level = Column(String, default="info")
@@ -74,6 +188,9 @@ class Alert(Base):
     triggered_at = Column(DateTime, default=datetime.utcnow)
     resolved_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    fingerprint = Column(String(40), nullable=True)
+    occurrences = Column(Integer, default=1, nullable=False)
+    last_seen_at = Column(DateTime, nullable=True)
 
 
 class TriggerCondition(str, enum.Enum):
@@ -85,9 +202,12 @@ class TriggerCondition(str, enum.Enum):
 
 class Trigger(Base):
     __tablename__ = "triggers"
+    __table_args__ = (
+        Index("ix_triggers_host_id_id", "host_id", "id"),
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    host_id = Column(Integer, ForeignKey("hosts.id"), index=True)
+    id = Column(Integer, primary_key=True)
+    host_id = Column(Integer, ForeignKey("hosts.id"))
     item_id = Column(Integer, ForeignKey("items.id"), index=True, nullable=True)
     key = Column(String)
     condition = Column(String)
@@ -96,4 +216,5 @@ class Trigger(Base):
     enabled = Column(Boolean, default=True)
     alert_level = Column(String, default="warning")
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # The trigger engine polls for rows changed since its last refresh
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
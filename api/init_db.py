@@ -2,12 +2,12 @@
 Database initialization script
 """
 from api.db.database import engine
-from api.db.models import Base
+from api.db.migrate import upgrade
 
 def init_db():
-    """Create all tables"""
-    Base.metadata.create_all(bind=engine)
-    print("Database tables created successfully")
+    """Apply all pending migrations"""
+    applied = upgrade(engine)
+    print(f"Database schema up to date ({len(applied)} migration(s) applied)")
 
 if __name__ == "__main__":
     init_db()
@@ -2,15 +2,28 @@
 Netmon API - Main application
 """
 import os
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from api.core.config import settings
-from api.routes import auth, hosts, metrics, alerts, triggers
-from api.db.database import engine
+from api.core.instrumentation import PoolMetrics, PrometheusMiddleware, http_metrics, render_metrics
+from api.routes import auth, api_keys, hosts, metrics, alerts, triggers, prometheus, events
+from api.db.database import engine, async_engine
 from api.db.models import Base
+from api.services.buffer import ingest_buffer
+from api.services.events import event_broker
+from api.services.partitions import partition_loop, setup_partitioning
+from api.services.probes import probe_loop
+from api.services.purge import purge_loop
+from api.services.retention import retention_loop
+from api.services.triggers import trigger_refresh_loop
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Schema is managed by migrations, applied by api.server before workers
+# start; DB_CREATE_ALL creates missing tables directly for dev and tests
+if settings.DB_CREATE_ALL:
+    Base.metadata.create_all(bind=engine)
+    setup_partitioning(engine)
 
 app = FastAPI(
     title="Netmon API",
@@ -30,12 +43,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.PROMETHEUS_ENABLED:
+    app.add_middleware(PrometheusMiddleware, metrics=http_metrics)
+    _pools = [PoolMetrics("sync", engine.pool), PoolMetrics("async", async_engine.sync_engine.pool)]
+
 # Include routers
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
+app.include_router(api_keys.router, prefix="/api/v1/api-keys", tags=["api-keys"])
 app.include_router(hosts.router, prefix="/api/v1/hosts", tags=["hosts"])
 app.include_router(metrics.router, prefix="/api/v1/metrics", tags=["metrics"])
 app.include_router(alerts.router, prefix="/api/v1/alerts", tags=["alerts"])
 app.include_router(triggers.router, prefix="/api/v1/triggers", tags=["triggers"])
+app.include_router(prometheus.router, prefix="/api/v1/prometheus", tags=["prometheus"])
+app.include_router(events.router, prefix="/api/v1/events", tags=["events"])
+
+
+_background_tasks = []
+
+
+@app.on_event("startup")
+async def start_background_jobs():
+    """Start periodic maintenance jobs"""
+    if settings.INGEST_BUFFER_ENABLED:
+        ingest_buffer.start()
+    if settings.EVENTS_RELAY_ENABLED:
+        event_broker.start()
+    # Every worker keeps its own trigger index current
+    if settings.TRIGGERS_ENABLED:
+        _background_tasks.append(asyncio.create_task(trigger_refresh_loop()))
+    # The rest must run once; api.server enables them in one worker only
+    if not settings.BACKGROUND_JOBS_ENABLED:
+        return
+    _background_tasks.append(asyncio.create_task(purge_loop()))
+    if settings.METRICS_PARTITIONING:
+        _background_tasks.append(asyncio.create_task(partition_loop()))
+    if settings.PROBES_ENABLED:
+        _background_tasks.append(asyncio.create_task(probe_loop()))
+    if settings.RETENTION_ENABLED:
+        _background_tasks.append(asyncio.create_task(retention_loop()))
+
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    """Flush buffered metrics and cancel periodic maintenance jobs"""
+    await ingest_buffer.stop()
+    await event_broker.stop()
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    await async_engine.dispose()
 
 
 @app.get("/health")
@@ -44,6 +101,15 @@ async def health_check():
     return {"status": "ok"}
 
 
+if settings.PROMETHEUS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        """Prometheus exposition of this worker's metrics"""
+        return PlainTextResponse(
+            render_metrics(_pools), media_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+
 @app.get("/api/v1")
 async def root():
     """API root"""
@@ -51,5 +117,6 @@ async def root():
 
 
 if __name__ == "__main__":
+    # Development only; production runs `python -m api.server`
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("api.main:app", host="0.0.0.0", port=8000, reload=True)
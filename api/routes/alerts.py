@@ -2,66 +2,94 @@
 Alerts routes
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List
-from api.db.database import get_db
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select, tuple_
+from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.db.database import get_async_db
 from api.db.models import Alert, Host, User
-from api.schemas import AlertCreate, AlertResponse
+from api.schemas import AlertCreate, AlertResponse, AlertPage
 from api.core.security import get_current_user
+from api.core.pagination import encode_cursor, decode_cursor
+from api.core.projection import page_response, projected_columns, response_columns, select_fields
+from api.services.alerts import alert_upsert
+from api.services.events import alert_event, queue_event
 
 router = APIRouter()
 
+ALERT_COLUMNS = response_columns(Alert, AlertResponse)
 
-@router.get("/", response_model=List[AlertResponse])
+
+@router.get("/", response_model=AlertPage, response_class=ORJSONResponse)
 async def list_alerts(
     host_id: int = Query(None),
     status_filter: str = Query(None),
-    db: Session = Depends(get_db),
+    cursor: str = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    fields: str = Query(None, description="Comma-separated fields to return, e.g. id,title,level"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """List alerts"""
-    query = db.query(Alert).join(Host).filter(Host.user_id == current_user.id)
+    """List alerts, newest first, one keyset page on (triggered_at, id)"""
+    names = select_fields(ALERT_COLUMNS, fields)
+    # A semi-join rather than a join, so the planner can walk the
+    # (triggered_at, id) index and stop after one page instead of sorting
+    query = select(*projected_columns(ALERT_COLUMNS, names, [Alert.triggered_at, Alert.id])).where(
+        Alert.host_id.in_(select(Host.id).where(Host.user_id == current_user.id, Host.deleted_at.is_(None)))
+    )
     
     if host_id:
-        query = query.filter(Alert.host_id == host_id)
+        query = query.where(Alert.host_id == host_id)
     
     if status_filter:
-        query = query.filter(Alert.status == status_filter)
+        query = query.where(Alert.status == status_filter)
     
-    alerts = query.order_by(Alert.triggered_at.desc()).limit(100).all()
+    if cursor:
+        last_triggered_at, last_id = decode_cursor(cursor, datetime, int)
+        query = query.where(
+            tuple_(Alert.triggered_at, Alert.id) < tuple_(last_triggered_at, last_id)
+        )
     
-    return alerts
+    result = await db.execute(
+        query.order_by(Alert.triggered_at.desc(), Alert.id.desc()).limit(limit + 1)
+    )
+    return page_response(result.all(), names, limit, lambda row: encode_cursor(row[-2], row[-1]))
 
 
 @router.post("/", response_model=AlertResponse)
 async def create_alert(
     alert: AlertCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create alert"""
     # Verify host belongs to user
-    host = db.query(Host).filter(
-        Host.id == alert.host_id,
-        Host.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(Host.id).where(Host.id == alert.host_id, Host.user_id == current_user.id, Host.deleted_at.is_(None))
+    )
     
-    if not host:
+    if not result.first():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Host not found"
         )
     
-    new_alert = Alert(
+    # A repeat of an active alert bumps it instead of adding a row
+    stmt = alert_upsert(
+        db,
         host_id=alert.host_id,
+        trigger_id=None,
         title=alert.title,
         message=alert.message,
         level=alert.level,
-        status="active"
-    )
+    ).returning(Alert)
     
-    db.add(new_alert)
-    db.commit()
-    db.refresh(new_alert)
+    result = await db.execute(stmt, execution_options={"populate_existing": True})
+    upserted = result.scalars().first()
+    queue_event(db, alert_event(
+        "opened" if upserted.occurrences == 1 else "updated",
+        AlertResponse.model_validate(upserted).model_dump(),
+    ))
+    await db.commit()
     
-    return new_alert
+    return upserted
@@ -0,0 +1,86 @@
+"""
+API key routes
+"""
+from datetime import datetime
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.db.database import get_async_db
+from api.db.models import ApiKey, Host, User
+from api.schemas import ApiKeyCreate, ApiKeyCreated, ApiKeyResponse
+from api.core.security import api_key_cache, generate_api_key, get_current_user, hash_api_key
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[ApiKeyResponse])
+async def list_api_keys(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """List API keys of the current user; secrets are never returned"""
+    result = await db.execute(
+        select(ApiKey).where(ApiKey.user_id == current_user.id).order_by(ApiKey.id)
+    )
+    return result.scalars().all()
+
+
+@router.post("/", response_model=ApiKeyCreated, status_code=status.HTTP_201_CREATED)
+async def create_api_key(
+    api_key: ApiKeyCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Create an API key, optionally limited to one host; the key is only shown here"""
+    if api_key.host_id is not None:
+        result = await db.execute(
+            select(Host.id).where(Host.id == api_key.host_id, Host.user_id == current_user.id, Host.deleted_at.is_(None))
+        )
+        if not result.first():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Host not found"
+            )
+    
+    prefix, key = generate_api_key()
+    new_key = ApiKey(
+        user_id=current_user.id,
+        host_id=api_key.host_id,
+        name=api_key.name,
+        prefix=prefix,
+        key_hash=hash_api_key(key),
+        expires_at=api_key.expires_at,
+    )
+    
+    db.add(new_key)
+    await db.commit()
+    await db.refresh(new_key)
+    
+    return {**ApiKeyResponse.model_validate(new_key).model_dump(), "key": key}
+
+
+@router.delete("/{key_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_api_key(
+    key_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Revoke an API key"""
+    result = await db.execute(
+        select(ApiKey).where(ApiKey.id == key_id, ApiKey.user_id == current_user.id)
+    )
+    api_key = result.scalars().first()
+    
+    if not api_key:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="API key not found"
+        )
+    
+    if api_key.revoked_at is None:
+        api_key.revoked_at = datetime.utcnow()
+        await db.commit()
+    api_key_cache.revoke(key_id)
+    
+    return None
@@ -2,9 +2,10 @@
 Authentication routes
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
-from api.db.database import get_db
+from api.db.database import get_async_db
 from api.db.models import User
 from api.schemas import LoginRequest, Token, UserCreate, UserResponse
 from api.core.security import (
@@ -19,9 +20,10 @@ router = APIRouter()
 
 
 @router.post("/login", response_model=Token)
-async def login(credentials: LoginRequest, db: Session = Depends(get_db)):
+async def login(credentials: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     """Login endpoint"""
-    user = db.query(User).filter(User.username == credentials.username).first()
+    result = await db.execute(select(User).where(User.username == credentials.username))
+    user = result.scalars().first()
     
     if not user or not verify_password(credentials.password, user.hashed_password):
         raise HTTPException(
@@ -38,10 +40,10 @@ async def login(credentials: LoginRequest, db: Session = Depends(get_db)):
 
 
 @router.post("/register", response_model=UserResponse)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register new user"""
-    db_user = db.query(User).filter(User.username == user_data.username).first()
-    if db_user:
+    result = await db.execute(select(User.id).where(User.username == user_data.username))
+    if result.first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already exists",
@@ -55,8 +57,8 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     return new_user
 
@@ -0,0 +1,122 @@
+"""
+Live event stream
+"""
+import asyncio
+from typing import Optional, Set
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.core.config import settings
+from api.core.security import api_key_host_scope, create_stream_ticket, get_ingest_user, get_stream_user
+from api.db.database import get_async_db
+from api.db.models import Host, User
+from api.schemas import StreamTicket
+from api.services.events import Subscription, event_broker
+
+router = APIRouter()
+
+EVENT_TYPES = {"metrics", "alerts"}
+
+
+def _split(value: Optional[str]) -> Optional[Set[str]]:
+    if not value:
+        return None
+    return {v.strip() for v in value.split(",") if v.strip()} or None
+
+
+async def _stream(request: Request, subscription: Subscription):
+    heartbeat = settings.EVENTS_HEARTBEAT_SECONDS
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                frame = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                # Comment line; keeps proxies from timing out an idle stream
+                yield b": ping\n\n"
+                continue
+            if frame is None:
+                if subscription.dropped:
+                    yield b"event: dropped\ndata: {}\n\n"
+                return
+            yield frame
+    finally:
+        event_broker.unsubscribe(subscription)
+
+
+@router.post("/ticket", response_model=StreamTicket)
+async def issue_stream_ticket(
+    request: Request,
+    current_user: User = Depends(get_ingest_user)
+):
+    """
+    Ticket for `GET /stream?ticket=`.
+
+    Valid for EVENTS_TICKET_SECONDS and only on the stream; fetch a new one
+    for every (re)connect.
+    """
+    return {
+        "ticket": create_stream_ticket(current_user, api_key_host_scope(request)),
+        "expires_in": settings.EVENTS_TICKET_SECONDS,
+    }
+
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    host_ids: str = Query(None, description="Comma-separated host ids, all owned hosts when omitted"),
+    keys: str = Query(None, description="Comma-separated metric keys, all when omitted"),
+    levels: str = Query(None, description="Comma-separated alert levels, all when omitted"),
+    types: str = Query(None, description="metrics and/or alerts, both when omitted"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_stream_user)
+):
+    """
+    Server-Sent Events stream of ingested metrics and alert changes.
+
+    `metrics` events carry the subscriber's share of each written batch,
+    `alert` events an opened, updated or resolved alert. Events come from
+    the write paths after commit, so open streams never query the database.
+    A client that falls behind by EVENTS_QUEUE_SIZE events gets a `dropped`
+    event and is disconnected; EventSource reconnects by itself.
+    """
+    try:
+        wanted = {int(i) for i in _split(host_ids) or ()}
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="host_ids must be comma-separated integers"
+        )
+    type_set = _split(types)
+    if type_set and not type_set <= EVENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"types must be among {', '.join(sorted(EVENT_TYPES))}"
+        )
+
+    # Hosts are resolved once; a reconnect picks up hosts added since
+    query = select(Host.id).where(Host.user_id == current_user.id, Host.deleted_at.is_(None))
+    if wanted:
+        query = query.where(Host.id.in_(wanted))
+    scope = api_key_host_scope(request)
+    if scope is not None:
+        query = query.where(Host.id == scope)
+    owned = set((await db.execute(query)).scalars())
+    # Release the connection now; the stream itself never needs it
+    await db.close()
+
+    subscription = event_broker.subscribe(Subscription(
+        host_ids=owned,
+        keys=_split(keys),
+        levels=_split(levels),
+        types=type_set,
+        maxsize=settings.EVENTS_QUEUE_SIZE,
+    ))
+    return StreamingResponse(
+        _stream(request, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,36 +1,74 @@
 """
 Hosts routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from api.db.database import get_db
-from api.db.models import Host, User
-from api.schemas import HostCreate, HostResponse, HostUpdate
-from api.core.security import get_current_user
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.db.database import dialect_insert, get_async_db
+from api.db.models import Host, PurgeJob, User
+from api.schemas import (
+    HostBulkDelete, HostCreate, HostPage, HostResponse, HostUpdate, HostUpsert, PurgeJobResponse,
+)
+from api.core.security import api_key_host_scope, check_host_scope, get_current_user, get_ingest_user
+from api.core.pagination import encode_cursor, decode_cursor
+from api.core.projection import page_response, projected_columns, response_columns, select_fields
+from api.services.items import item_registry
+from api.services.latest import latest_values
+from api.services.purge import delete_hosts
 
 router = APIRouter()
 
+HOST_COLUMNS = response_columns(Host, HostResponse)
 
-@router.get("/", response_model=List[HostResponse])
+
+async def _get_owned_host(db: AsyncSession, host_id: int, user: User) -> Host:
+    result = await db.execute(
+        select(Host).where(Host.id == host_id, Host.user_id == user.id, Host.deleted_at.is_(None))
+    )
+    host = result.scalars().first()
+
+    if not host:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Host not found"
+        )
+
+    return host
+
+
+@router.get("/", response_model=HostPage, response_class=ORJSONResponse)
 async def list_hosts(
-    db: Session = Depends(get_db),
+    cursor: str = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    fields: str = Query(None, description="Comma-separated fields to return, e.g. id,name,status"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """List all hosts for current user"""
-    hosts = db.query(Host).filter(Host.user_id == current_user.id).all()
-    return hosts
+    """List hosts for current user, one keyset page ordered by id"""
+    names = select_fields(HOST_COLUMNS, fields)
+    query = select(*projected_columns(HOST_COLUMNS, names, [Host.id])).where(
+        Host.user_id == current_user.id, Host.deleted_at.is_(None)
+    )
+    
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.where(Host.id > last_id)
+    
+    result = await db.execute(query.order_by(Host.id).limit(limit + 1))
+    return page_response(result.all(), names, limit, lambda row: encode_cursor(row[-1]))
 
 
 @router.post("/", response_model=HostResponse)
 async def create_host(
     host: HostCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create new host"""
-    db_host = db.query(Host).filter(Host.name == host.name).first()
-    if db_host:
+    result = await db.execute(select(Host.id).where(Host.name == host.name, Host.deleted_at.is_(None)))
+    if result.first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Host already exists",
@@ -45,23 +83,23 @@ async def create_host(
     )
     
     db.add(new_host)
-    db.commit()
-    db.refresh(new_host)
+    await db.commit()
+    await db.refresh(new_host)
     
     return new_host
 
 
-@router.get("/{host_id}", response_model=HostResponse)
-async def get_host(
-    host_id: int,
-    db: Session = Depends(get_db),
+@router.get("/by-name/{name}", response_model=HostResponse)
+async def get_host_by_name(
+    name: str,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get host by ID"""
-    host = db.query(Host).filter(
-        Host.id == host_id,
-        Host.user_id == current_user.id
-    ).first()
+    """Get host by its unique name"""
+    result = await db.execute(
+        select(Host).where(Host.name == name, Host.user_id == current_user.id, Host.deleted_at.is_(None))
+    )
+    host = result.scalars().first()
     
     if not host:
         raise HTTPException(
@@ -72,55 +110,156 @@ async def get_host(
     return host
 
 
+@router.put("/by-name/{name}", response_model=HostResponse)
+async def upsert_host(
+    name: str,
+    host: HostUpsert,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_ingest_user)
+):
+    """
+    Create or update a host by name in one statement.
+    
+    INSERT ... ON CONFLICT (name) DO UPDATE only touches rows owned by the
+    caller; a name taken by another user returns no row and a 409. Names
+    are unique among live hosts, so a deleted host is never revived.
+    Agents register through here, so API keys are accepted; a host-scoped
+    key may only update its own host.
+    """
+    scope = api_key_host_scope(request)
+    if scope is not None:
+        result = await db.execute(
+            select(Host.id).where(Host.name == name, Host.user_id == current_user.id, Host.deleted_at.is_(None))
+        )
+        check_host_scope(request, [result.scalar()])
+    
+    now = datetime.utcnow()
+    stmt = dialect_insert(db, Host).values(
+        name=name,
+        ip_address=host.ip_address,
+        tags=host.tags,
+        user_id=current_user.id,
+        status="online",
+        created_at=now,
+        updated_at=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Host.name],
+        index_where=Host.deleted_at.is_(None),
+        set_={
+            "ip_address": stmt.excluded.ip_address,
+            "tags": stmt.excluded.tags,
+            "status": "online",
+            "updated_at": now,
+        },
+        where=Host.user_id == current_user.id,
+    ).returning(Host)
+    
+    result = await db.execute(stmt, execution_options={"populate_existing": True})
+    upserted = result.scalars().first()
+    
+    if upserted is None:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Host name is registered to another user",
+        )
+    
+    await db.commit()
+    
+    return upserted
+
+
+@router.get("/{host_id}", response_model=HostResponse)
+async def get_host(
+    host_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_ingest_user)
+):
+    """Get host by ID; also used by agents to check their cached host id"""
+    check_host_scope(request, [host_id])
+    return await _get_owned_host(db, host_id, current_user)
+
+
 @router.patch("/{host_id}", response_model=HostResponse)
 async def update_host(
     host_id: int,
     host_update: HostUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Update host"""
-    host = db.query(Host).filter(
-        Host.id == host_id,
-        Host.user_id == current_user.id
-    ).first()
-    
-    if not host:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Host not found"
-        )
+    host = await _get_owned_host(db, host_id, current_user)
     
     update_data = host_update.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(host, field, value)
     
     db.add(host)
-    db.commit()
-    db.refresh(host)
+    await db.commit()
+    await db.refresh(host)
     
     return host
 
 
-@router.delete("/{host_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def _delete(db: AsyncSession, user: User, host_ids) -> PurgeJob:
+    job = await db.run_sync(delete_hosts, user.id, host_ids)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Host not found"
+        )
+    await db.commit()
+    # Other workers drop theirs on the committed hosts_deleted event
+    for host_id in job.host_ids:
+        item_registry.forget_host(host_id)
+        await latest_values.forget_host(host_id)
+    return job
+
+
+@router.delete("/{host_id}", response_model=PurgeJobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def delete_host(
     host_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Delete host.
+
+    The host disappears at once; its metrics, rollups, alerts, triggers and
+    items are deleted in the background. Returns the purge job to poll.
+    """
+    return await _delete(db, current_user, [host_id])
+
+
+@router.post("/bulk-delete", response_model=PurgeJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def bulk_delete_hosts(
+    body: HostBulkDelete,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Delete host"""
-    host = db.query(Host).filter(
-        Host.id == host_id,
-        Host.user_id == current_user.id
-    ).first()
+    """Delete many hosts with one purge job; ids not owned by the caller are skipped"""
+    return await _delete(db, current_user, body.host_ids)
+
+
+@router.get("/purge-jobs/{job_id}", response_model=PurgeJobResponse)
+async def get_purge_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Progress of a host deletion: status and rows deleted so far per table"""
+    result = await db.execute(
+        select(PurgeJob).where(PurgeJob.id == job_id, PurgeJob.user_id == current_user.id)
+    )
+    job = result.scalars().first()
     
-    if not host:
+    if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Host not found"
+            detail="Purge job not found"
         )
     
-    db.delete(host)
-    db.commit()
-    
-    return None
+    return job
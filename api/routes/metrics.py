@@ -0,0 +1,273 @@
+"""
+Metrics routes
+"""
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from typing import List
+from api.db.database import get_async_db
+from api.db.models import Metric, Item, Host, User
+from api.schemas import (
+    MetricCreate,
+    MetricResponse,
+    MetricBatch,
+    MetricBatchResponse,
+    IngestBufferStats,
+    MetricSeriesResponse,
+    MetricSummaryResponse,
+    LatestValuesResponse,
+)
+from api.core.config import settings
+from api.core.security import check_host_scope, get_current_user, get_ingest_user
+from api.core.compression import GzipRoute
+from api.services.buffer import ingest_buffer
+from api.services.ingest import owned_host_ids, write_metrics, metric_rows, after_write, to_naive_utc
+from api.services.items import item_registry
+from api.services.latest import latest_values
+from api.services.rollups import pick_rollup, summarize
+from api.services.downsample import lttb
+
+router = APIRouter(route_class=GzipRoute)
+
+
+@router.get("/", response_model=List[MetricResponse])
+async def list_metrics(
+    host_id: int = Query(None),
+    key: str = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """List latest metrics"""
+    query = select(
+        Metric.id, Item.host_id, Item.key, Metric.value, Metric.timestamp
+    ).join(Item, Metric.item_id == Item.id).where(
+        # Semi-join: newest rows come off the timestamp index, no sort
+        Item.host_id.in_(select(Host.id).where(Host.user_id == current_user.id, Host.deleted_at.is_(None)))
+    )
+
+    if host_id:
+        query = query.where(Item.host_id == host_id)
+
+    if key:
+        query = query.where(Item.key == key)
+
+    result = await db.execute(query.order_by(Metric.timestamp.desc()).limit(limit))
+
+    return result.all()
+
+
+@router.get("/latest", response_model=LatestValuesResponse)
+async def get_latest(
+    host_ids: str = Query(..., description="Comma-separated host ids"),
+    keys: str = Query(None, description="Comma-separated keys, all when omitted"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the current value of every key for many hosts in one call.
+
+    Served from the latest-value cache, never from the metrics table.
+    """
+    try:
+        wanted = {int(i) for i in host_ids.split(",") if i.strip()}
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="host_ids must be comma-separated integers"
+        )
+    if len(wanted) > 1000:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At most 1000 hosts per request"
+        )
+
+    owned = sorted(await db.run_sync(owned_host_ids, current_user.id, wanted))
+    key_list = [k for k in keys.split(",") if k] if keys else None
+
+    return {"hosts": await latest_values.get_many(owned, key_list)}
+
+
+@router.get("/series", response_model=MetricSeriesResponse)
+async def get_series(
+    host_id: int,
+    key: str,
+    start: datetime = Query(None),
+    end: datetime = Query(None),
+    max_points: int = Query(500, ge=3, le=5000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get a time-range series, downsampled server-side to at most max_points.
+
+    Defaults to the last hour. Downsampling uses LTTB so spikes survive.
+    """
+    if not await db.run_sync(owned_host_ids, current_user.id, [host_id]):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Host not found"
+        )
+
+    end = to_naive_utc(end) if end else datetime.utcnow()
+    start = to_naive_utc(start) if start else end - timedelta(hours=1)
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must be before end"
+        )
+
+    item_id = await db.run_sync(item_registry.lookup, host_id, key)
+    rollup = pick_rollup(start, end, max_points)
+    if item_id is None:
+        source, series = "raw", []
+    elif rollup is None:
+        source = "raw"
+        result = await db.execute(
+            select(Metric.timestamp, Metric.value).where(
+                Metric.item_id == item_id,
+                Metric.timestamp >= start,
+                Metric.timestamp < end,
+            ).order_by(Metric.timestamp)
+        )
+        rows = result.all()
+        series = [(row.timestamp, row.value) for row in rows]
+    else:
+        source = rollup.__tablename__
+        result = await db.execute(
+            select(rollup.bucket, rollup.sum, rollup.count).where(
+                rollup.item_id == item_id,
+                rollup.bucket >= start,
+                rollup.bucket < end,
+                rollup.count > 0,
+            ).order_by(rollup.bucket)
+        )
+        rows = result.all()
+        series = [(row.bucket, row.sum / row.count) for row in rows]
+
+    points = lttb(series, max_points)
+
+    return {
+        "host_id": host_id,
+        "key": key,
+        "start": start,
+        "end": end,
+        "source": source,
+        "source_points": len(series),
+        "points": [{"timestamp": t, "value": v} for t, v in points],
+    }
+
+
+@router.get("/summary", response_model=MetricSummaryResponse)
+async def get_summary(
+    host_id: int,
+    key: str,
+    start: datetime = Query(None),
+    end: datetime = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get count, min, max, avg and p50/p95/p99 over a range from the rollups.
+
+    Defaults to the last 24 hours. Ranges longer than two days use hourly
+    buckets; bucket edges are aligned to the rollup width.
+    """
+    if not await db.run_sync(owned_host_ids, current_user.id, [host_id]):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Host not found"
+        )
+
+    end = to_naive_utc(end) if end else datetime.utcnow()
+    start = to_naive_utc(start) if start else end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must be before end"
+        )
+
+    item_id = await db.run_sync(item_registry.lookup, host_id, key)
+    summary = await db.run_sync(summarize, item_id, start, end) if item_id else {
+        "source": "none", "start": start, "count": 0,
+    }
+
+    return {"host_id": host_id, "key": key, "end": end, **summary}
+
+
+@router.post("/", response_model=MetricResponse)
+async def create_metric(
+    metric: MetricCreate,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_ingest_user)
+):
+    """Create metric"""
+    check_host_scope(request, [metric.host_id])
+    if not await db.run_sync(owned_host_ids, current_user.id, [metric.host_id]):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Host not found"
+        )
+
+    rows = await db.run_sync(metric_rows, [metric])
+    row = rows[0]
+    new_metric = Metric(item_id=row["item_id"], value=row["value"], timestamp=row["timestamp"])
+    db.add(new_metric)
+    await db.flush()
+    await db.run_sync(after_write, rows)
+    await db.commit()
+    await latest_values.record(rows)
+
+    return {"id": new_metric.id, **row}
+
+
+@router.post("/batch", response_model=MetricBatchResponse)
+async def create_metrics_batch(
+    batch: MetricBatch,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_ingest_user)
+):
+    """
+    Create many metric points, for any number of hosts and keys.
+
+    Host ownership is checked once per distinct host_id. With the ingestion
+    buffer enabled the points are queued and the response is 202; a full
+    buffer answers 429 with Retry-After. Otherwise all points are written
+    with one multi-row INSERT in a single transaction.
+    """
+    host_ids = {metric.host_id for metric in batch.metrics}
+    check_host_scope(request, host_ids)
+    missing = host_ids - await db.run_sync(owned_host_ids, current_user.id, host_ids)
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Host not found: {', '.join(str(i) for i in sorted(missing))}"
+        )
+
+    if settings.INGEST_BUFFER_ENABLED:
+        if not ingest_buffer.offer(batch.metrics):
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Ingestion buffer full",
+                headers={"Retry-After": str(ingest_buffer.retry_after())},
+            )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"accepted": len(batch.metrics)}
+
+    rows = await db.run_sync(write_metrics, batch.metrics)
+    await db.commit()
+    await latest_values.record(rows)
+
+    return {"accepted": len(rows)}
+
+
+@router.get("/buffer", response_model=IngestBufferStats)
+async def get_buffer_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """Ingestion buffer depth, flush latency and rows per flush"""
+    return ingest_buffer.stats()
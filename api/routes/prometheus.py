@@ -0,0 +1,79 @@
+"""
+Prometheus ingestion routes
+"""
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.db.database import get_async_db
+from api.db.models import User
+from api.schemas import PrometheusIngestResponse
+from api.core.security import api_key_host_scope, get_ingest_user
+from api.core.compression import GzipRoute, snappy_decompress
+from api.services.latest import latest_values
+from api.services.prometheus import ingest_samples, parse_text, parse_write_request
+
+router = APIRouter(route_class=GzipRoute)
+
+
+def _reject_host_scoped_keys(request: Request) -> None:
+    # Prometheus series can name any host, which a host-scoped key may not write
+    if api_key_host_scope(request) is not None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Host-scoped API keys cannot use Prometheus ingestion"
+        )
+
+
+async def _ingest(db: AsyncSession, user: User, samples, default_host=None) -> dict:
+    result = await db.run_sync(ingest_samples, user.id, samples, default_host)
+    await db.commit()
+    await latest_values.record(result.pop("rows"))
+    return result
+
+
+@router.post("/write", response_model=PrometheusIngestResponse)
+async def remote_write(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_ingest_user)
+):
+    """
+    Prometheus remote_write receiver (snappy-compressed protobuf).
+
+    Series are mapped to hosts by PROMETHEUS_HOST_LABEL, missing hosts are
+    created, and the whole request is written in one transaction.
+    """
+    _reject_host_scoped_keys(request)
+    body = await request.body()
+    try:
+        if "snappy" in request.headers.get("content-encoding", "snappy").lower():
+            body = await asyncio.to_thread(snappy_decompress, body)
+        samples = await asyncio.to_thread(parse_write_request, body)
+    except (ValueError, UnicodeDecodeError, IndexError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid remote write body: {e}",
+        )
+
+    return await _ingest(db, current_user, samples)
+
+
+@router.post("/import", response_model=PrometheusIngestResponse)
+async def import_text(
+    request: Request,
+    host: str = Query(None, description="Host for samples without the host label"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_ingest_user)
+):
+    """Ingest a Prometheus text exposition, e.g. an exporter's /metrics output"""
+    _reject_host_scoped_keys(request)
+    body = await request.body()
+    try:
+        samples = await asyncio.to_thread(parse_text, body.decode())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid exposition format: {e}",
+        )
+
+    return await _ingest(db, current_user, samples, host)
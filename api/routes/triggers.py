@@ -1,48 +1,78 @@
 """
 Triggers routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from api.db.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.db.database import get_async_db
 from api.db.models import Trigger, Host, User
-from api.schemas import TriggerCreate, TriggerResponse, TriggerUpdate
+from api.schemas import TriggerCreate, TriggerResponse, TriggerUpdate, TriggerPage
 from api.core.security import get_current_user
+from api.core.pagination import encode_cursor, decode_cursor
+from api.core.projection import page_response, projected_columns, response_columns, select_fields
+from api.services.triggers import trigger_engine
 
 router = APIRouter()
 
+TRIGGER_COLUMNS = response_columns(Trigger, TriggerResponse)
 
-@router.get("/", response_model=List[TriggerResponse])
+
+async def _get_owned_trigger(db: AsyncSession, trigger_id: int, user: User) -> Trigger:
+    result = await db.execute(
+        select(Trigger).join(Host).where(Trigger.id == trigger_id, Host.user_id == user.id, Host.deleted_at.is_(None))
+    )
+    trigger = result.scalars().first()
+
+    if not trigger:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trigger not found"
+        )
+
+    return trigger
+
+
+@router.get("/", response_model=TriggerPage, response_class=ORJSONResponse)
 async def list_triggers(
     host_id: int = None,
-    db: Session = Depends(get_db),
+    cursor: str = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    fields: str = Query(None, description="Comma-separated fields to return, e.g. id,key,enabled"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """List triggers"""
-    query = db.query(Trigger).join(Host).filter(Host.user_id == current_user.id)
+    """List triggers, one keyset page ordered by id"""
+    names = select_fields(TRIGGER_COLUMNS, fields)
+    # Semi-join: walks the primary key in page order, no sort
+    query = select(*projected_columns(TRIGGER_COLUMNS, names, [Trigger.id])).where(
+        Trigger.host_id.in_(select(Host.id).where(Host.user_id == current_user.id, Host.deleted_at.is_(None)))
+    )
     
     if host_id:
-        query = query.filter(Trigger.host_id == host_id)
+        query = query.where(Trigger.host_id == host_id)
     
-    triggers = query.all()
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.where(Trigger.id > last_id)
     
-    return triggers
+    result = await db.execute(query.order_by(Trigger.id).limit(limit + 1))
+    return page_response(result.all(), names, limit, lambda row: encode_cursor(row[-1]))
 
 
 @router.post("/", response_model=TriggerResponse)
 async def create_trigger(
     trigger: TriggerCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create trigger"""
     # Verify host belongs to user
-    host = db.query(Host).filter(
-        Host.id == trigger.host_id,
-        Host.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(Host.id).where(Host.id == trigger.host_id, Host.user_id == current_user.id, Host.deleted_at.is_(None))
+    )
     
-    if not host:
+    if not result.first():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Host not found"
@@ -60,8 +90,10 @@ async def create_trigger(
     )
     
     db.add(new_trigger)
-    db.commit()
-    db.refresh(new_trigger)
+    await db.flush()
+    await db.run_sync(trigger_engine.upsert, new_trigger)
+    await db.commit()
+    await db.refresh(new_trigger)
     
     return new_trigger
 
@@ -69,49 +101,31 @@ async def create_trigger(
 @router.get("/{trigger_id}", response_model=TriggerResponse)
 async def get_trigger(
     trigger_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get trigger by ID"""
-    trigger = db.query(Trigger).join(Host).filter(
-        Trigger.id == trigger_id,
-        Host.user_id == current_user.id
-    ).first()
-    
-    if not trigger:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Trigger not found"
-        )
-    
-    return trigger
+    return await _get_owned_trigger(db, trigger_id, current_user)
 
 
 @router.patch("/{trigger_id}", response_model=TriggerResponse)
 async def update_trigger(
     trigger_id: int,
     trigger_update: TriggerUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Update trigger"""
-    trigger = db.query(Trigger).join(Host).filter(
-        Trigger.id == trigger_id,
-        Host.user_id == current_user.id
-    ).first()
-    
-    if not trigger:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Trigger not found"
-        )
+    trigger = await _get_owned_trigger(db, trigger_id, current_user)
     
     update_data = trigger_update.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(trigger, field, value)
     
     db.add(trigger)
-    db.commit()
-    db.refresh(trigger)
+    await db.flush()
+    await db.run_sync(trigger_engine.upsert, trigger)
+    await db.commit()
+    await db.refresh(trigger)
     
     return trigger
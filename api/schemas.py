@@ -1,9 +1,9 @@
 """
 Pydantic schemas
 """
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 
 # User schemas
@@ -36,6 +36,36 @@ class Token(BaseModel):
     token_type: str = "bearer"
 
 
+class StreamTicket(BaseModel):
+    ticket: str
+    expires_in: int
+
+
+# API key schemas
+class ApiKeyCreate(BaseModel):
+    name: str
+    host_id: Optional[int] = None
+    expires_at: Optional[datetime] = None
+
+
+class ApiKeyResponse(BaseModel):
+    id: int
+    name: Optional[str]
+    prefix: str
+    host_id: Optional[int]
+    created_at: datetime
+    expires_at: Optional[datetime]
+    revoked_at: Optional[datetime]
+
+    class Config:
+        from_attributes = True
+
+
+class ApiKeyCreated(ApiKeyResponse):
+    # Only returned once, at creation
+    key: str
+
+
 # Host schemas
 class HostBase(BaseModel):
     name: str
@@ -47,6 +77,11 @@ class HostCreate(HostBase):
     pass
 
 
+class HostUpsert(BaseModel):
+    ip_address: str
+    tags: Optional[List[str]] = []
+
+
 class HostUpdate(BaseModel):
     name: Optional[str] = None
     ip_address: Optional[str] = None
@@ -65,6 +100,30 @@ class HostResponse(HostBase):
         from_attributes = True
 
 
+class HostPage(BaseModel):
+    items: List[HostResponse]
+    next_cursor: Optional[str] = None
+
+
+class HostBulkDelete(BaseModel):
+    host_ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+
+class PurgeJobResponse(BaseModel):
+    id: int
+    status: str
+    host_ids: List[int]
+    deleted: Dict[str, int] = {}
+    attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 # Item schemas
 class ItemBase(BaseModel):
     key: str
@@ -90,6 +149,69 @@ class MetricCreate(BaseModel):
     item_id: Optional[int] = None
     key: str
     value: float
+    timestamp: Optional[datetime] = None
+
+
+class MetricBatch(BaseModel):
+    metrics: List[MetricCreate] = Field(..., min_length=1, max_length=10000)
+
+
+class MetricBatchResponse(BaseModel):
+    accepted: int
+
+
+class PrometheusIngestResponse(BaseModel):
+    accepted: int
+    rejected: int
+    foreign_hosts: List[str] = []
+
+
+class IngestBufferStats(BaseModel):
+    depth: int
+    capacity: int
+    accepted: int
+    rejected: int
+    dropped: int
+    flushes: int
+    rows_flushed: int
+    last_flush_rows: int
+    last_flush_seconds: float
+    max_flush_seconds: float
+    avg_rows_per_flush: float
+
+
+class SeriesPoint(BaseModel):
+    timestamp: datetime
+    value: float
+
+
+class MetricSeriesResponse(BaseModel):
+    host_id: int
+    key: str
+    start: datetime
+    end: datetime
+    source: str
+    source_points: int
+    points: List[SeriesPoint]
+
+
+class LatestValuesResponse(BaseModel):
+    hosts: Dict[int, Dict[str, SeriesPoint]]
+
+
+class MetricSummaryResponse(BaseModel):
+    host_id: int
+    key: str
+    start: datetime
+    end: datetime
+    source: str
+    count: int
+    min: Optional[float] = None
+    max: Optional[float] = None
+    avg: Optional[float] = None
+    p50: Optional[float] = None
+    p95: Optional[float] = None
+    p99: Optional[float] = None
 
 
 class MetricResponse(BaseModel):
@@ -117,14 +239,22 @@ class AlertCreate(AlertBase):
 class AlertResponse(AlertBase):
     id: int
     host_id: int
+    trigger_id: Optional[int] = None
     status: str
     triggered_at: datetime
     resolved_at: Optional[datetime] = None
+    occurrences: int = 1
+    last_seen_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
 
+class AlertPage(BaseModel):
+    items: List[AlertResponse]
+    next_cursor: Optional[str] = None
+
+
 # Trigger schemas
 class TriggerBase(BaseModel):
     key: str
@@ -157,3 +287,8 @@ class TriggerResponse(TriggerBase):
 
     class Config:
         from_attributes = True
+
+
+class TriggerPage(BaseModel):
+    items: List[TriggerResponse]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,387 @@
+"""
+Production server for the Netmon API
+
+Pre-forked uvicorn workers accepting on one shared socket:
+
+    python -m api.server --workers 4 --host 0.0.0.0 --port 8000
+
+The master applies pending migrations once, loads the trigger index and
+item ids, imports the app and only then forks; workers inherit all of it
+copy-on-write. Each worker opens its database pools before it accepts
+connections. Every worker has its own event loop and interpreter, so
+throughput scales with cores.
+
+Background jobs that must run once (probes, retention, partition upkeep,
+host purges) run in exactly one worker, the job worker: the master passes
+it a flag at fork and every other worker starts with
+BACKGROUND_JOBS_ENABLED off. A job worker that exits is replaced by
+another job worker; on SIGHUP it is stopped before its replacement starts,
+so two never overlap. This covers one server; with several against one
+database, set BACKGROUND_JOBS_ENABLED=false on all but one.
+
+Trigger evaluation is not shared yet: each worker keeps the windows of the
+points it ingested itself, and an agent's batches land on whichever worker
+accepts its connection. With several workers a trigger sees only part of
+its series, so a duration window misses clears seen by another worker and
+an alert is resolved only by the worker that opened it. While
+TRIGGERS_ENABLED is on the server therefore defaults to one worker, and
+warns when given more.
+
+Signals to the master:
+    SIGTERM, SIGINT  graceful shutdown; workers finish in-flight requests
+    SIGHUP           rolling restart, one worker at a time, after applying
+                     pending migrations. With --no-preload the new workers
+                     also load new code.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("api.server")
+
+# A worker that dies sooner than this after starting is not respawned at once
+_MIN_LIFETIME = 1.0
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def warm_caches() -> Tuple[int, int]:
+    """Load the trigger index and every item id; returns (triggers, items)"""
+    from api.core.config import settings
+    from api.db.database import SessionLocal
+    from api.services.items import item_registry
+    from api.services.triggers import trigger_engine
+
+    db = SessionLocal()
+    try:
+        if settings.TRIGGERS_ENABLED:
+            trigger_engine.load(db)
+        items = item_registry.preload(db)
+        db.commit()
+    finally:
+        db.close()
+    return len(trigger_engine), items
+
+
+async def warm_pools() -> None:
+    """Open every pool's base connections so the first requests do not pay for them"""
+    from sqlalchemy import text
+    from api.db.database import async_engine, engine
+
+    if hasattr(engine.pool, "size"):
+        def open_sync():
+            connections = [engine.connect() for _ in range(engine.pool.size())]
+            for connection in connections:
+                connection.execute(text("SELECT 1"))
+                connection.close()
+
+        await asyncio.to_thread(open_sync)
+
+    pool = async_engine.sync_engine.pool
+    if hasattr(pool, "size"):
+        connections = await asyncio.gather(*(async_engine.connect() for _ in range(pool.size())))
+        for connection in connections:
+            await connection.execute(text("SELECT 1"))
+            await connection.close()
+
+
+def run_worker(sock: socket.socket, args, ready_fd: int, jobs: bool) -> None:
+    """Body of a forked worker; never returns. jobs: this is the job worker"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    code = 0
+    try:
+        import uvicorn
+        from api.core.config import settings
+
+        settings.BACKGROUND_JOBS_ENABLED = settings.BACKGROUND_JOBS_ENABLED and jobs
+        if not args.preload and settings.WARMUP_CACHES:
+            warm_caches()
+        from api.main import app
+
+        server = uvicorn.Server(uvicorn.Config(
+            app,
+            lifespan="on",
+            log_level=args.log_level,
+            access_log=args.access_log,
+            proxy_headers=True,
+            timeout_graceful_shutdown=args.graceful_timeout,
+        ))
+
+        async def serve():
+            await warm_pools()
+            # uvicorn runs the app's startup handlers, then starts accepting
+            serving = asyncio.create_task(server.serve(sockets=[sock]))
+            while not server.started and not serving.done():
+                await asyncio.sleep(0.01)
+            if server.started:
+                os.write(ready_fd, b"1")
+            os.close(ready_fd)
+            await serving
+
+        asyncio.run(serve())
+        if not server.started:
+            code = 1
+    except BaseException:
+        logger.exception("Worker %d failed", os.getpid())
+        code = 1
+    finally:
+        logging.shutdown()
+        os._exit(code)
+
+
+class Master:
+    """Forks, watches and restarts workers"""
+
+    def __init__(self, sock: socket.socket, args):
+        self.sock = sock
+        self.args = args
+        self.workers: Dict[int, float] = {}  # pid -> start time
+        self.jobs_pid: Optional[int] = None
+        self.stopping = False
+        self.reload_requested = False
+
+    def spawn(self) -> Tuple[int, int]:
+        """
+        Fork a worker; returns its pid and the read end of its ready pipe.
+
+        The worker runs the background jobs if no other worker does.
+        """
+        jobs = self.jobs_pid is None
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            run_worker(self.sock, self.args, write_fd, jobs)
+        os.close(write_fd)
+        self.workers[pid] = time.monotonic()
+        if jobs:
+            self.jobs_pid = pid
+        return pid, read_fd
+
+    def forget(self, pid: int) -> Optional[float]:
+        """Drop an exited worker; returns its start time if it was known"""
+        if pid == self.jobs_pid:
+            self.jobs_pid = None
+        return self.workers.pop(pid, None)
+
+    def wait_ready(self, started: List[Tuple[int, int]]) -> List[int]:
+        """Wait for workers to report ready; returns the pids that did"""
+        pending = {fd: pid for pid, fd in started}
+        ready = []
+        deadline = time.monotonic() + self.args.ready_timeout
+        while pending and time.monotonic() < deadline:
+            readable, _, _ = select.select(list(pending), [], [], max(0.0, deadline - time.monotonic()))
+            for fd in readable:
+                pid = pending.pop(fd)
+                if os.read(fd, 1):
+                    ready.append(pid)
+                os.close(fd)
+        for fd, pid in pending.items():
+            os.close(fd)
+            logger.error("Worker %d not ready after %ss", pid, self.args.ready_timeout)
+        return ready
+
+    def stop_workers(self, pids: List[int], timeout: float) -> None:
+        """SIGTERM workers and wait for them; SIGKILL whatever is left after timeout"""
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        remaining = set(pids)
+        deadline = time.monotonic() + timeout
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    remaining.discard(pid)
+                    self.forget(pid)
+            time.sleep(0.05)
+        for pid in remaining:
+            logger.warning("Worker %d did not stop in %ss, killing it", pid, timeout)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.forget(pid)
+
+    def reap(self) -> None:
+        """Collect exited workers and replace them"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            started = self.forget(pid)
+            if started is None or self.stopping:
+                continue
+            logger.warning("Worker %d exited with status %d; starting a new one", pid, status)
+            if time.monotonic() - started < _MIN_LIFETIME:
+                time.sleep(_MIN_LIFETIME)
+            self.wait_ready([self.spawn()])
+
+    def rolling_restart(self) -> None:
+        """Replace workers one at a time, keeping the others serving"""
+        if self.args.migrate:
+            # A fresh interpreter, so newly deployed migrations are found
+            result = subprocess.run([sys.executable, "-m", "api.db.migrate"])
+            if result.returncode != 0:
+                logger.error("Migrations failed; keeping the current workers")
+                return
+        for old in list(self.workers):
+            if self.stopping:
+                return
+            if old == self.jobs_pid:
+                # Never two job workers: this one stops before its replacement starts
+                self.stop_workers([old], self.args.graceful_timeout + 5)
+                if not self.wait_ready([self.spawn()]):
+                    logger.error("Replacement job worker failed; rolling restart aborted")
+                    return
+                continue
+            new, fd = self.spawn()
+            if not self.wait_ready([(new, fd)]):
+                logger.error("Replacement worker failed; rolling restart aborted")
+                self.stop_workers([new], 0)
+                return
+            self.stop_workers([old], self.args.graceful_timeout + 5)
+        logger.info("Rolling restart complete")
+
+    def shutdown(self) -> None:
+        self.stopping = True
+        self.stop_workers(list(self.workers), self.args.graceful_timeout + 5)
+
+    def run(self) -> int:
+        def on_stop(signum, frame):
+            self.stopping = True
+
+        def on_reload(signum, frame):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+        signal.signal(signal.SIGHUP, on_reload)
+
+        started = time.monotonic()
+        ready = self.wait_ready([self.spawn() for _ in range(self.args.workers)])
+        if len(ready) < self.args.workers:
+            logger.error("Only %d of %d workers started", len(ready), self.args.workers)
+            self.shutdown()
+            return 1
+        logger.info(
+            "Serving on %s:%d with %d workers (ready in %.2fs)",
+            self.args.host, self.args.port, len(ready), time.monotonic() - started,
+        )
+
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_restart()
+            self.reap()
+            time.sleep(0.2)
+
+        logger.info("Shutting down")
+        self.shutdown()
+        return 0
+
+
+def prepare(args) -> None:
+    """Everything done once in the master before forking"""
+    from api.core.config import settings
+    from api.db.database import engine
+
+    if args.migrate:
+        from api.db.migrate import upgrade
+
+        from api.services.partitions import setup_partitioning
+
+        applied = upgrade(engine)
+        if applied:
+            logger.info("Applied migrations %s", ", ".join(applied))
+        if setup_partitioning(engine):
+            logger.info("Converted metrics to a partitioned table")
+    if args.preload:
+        if settings.WARMUP_CACHES:
+            triggers, items = warm_caches()
+            logger.info("Loaded %d triggers and %d items", triggers, items)
+    # No connection may be shared with the children
+    engine.dispose()
+    if args.preload:
+        import api.main  # noqa: F401
+
+
+def default_workers(settings) -> int:
+    """WEB_CONCURRENCY, else one per CPU, but only one while triggers are evaluated"""
+    if settings.WEB_CONCURRENCY:
+        return settings.WEB_CONCURRENCY
+    if settings.TRIGGERS_ENABLED:
+        return 1
+    return os.cpu_count() or 1
+
+
+def parse_args(argv=None):
+    from api.core.config import settings
+
+    parser = argparse.ArgumentParser(description="Run the Netmon API with pre-forked workers")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers(settings))
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--graceful-timeout", type=int, default=settings.GRACEFUL_TIMEOUT_SECONDS,
+                        help="Seconds a stopping worker may spend on in-flight requests")
+    parser.add_argument("--ready-timeout", type=float, default=60.0,
+                        help="Seconds a new worker may take to start accepting")
+    parser.add_argument("--no-migrate", dest="migrate", action="store_false",
+                        help="Do not apply pending migrations at startup and on SIGHUP")
+    parser.add_argument("--no-preload", dest="preload", action="store_false",
+                        help="Import the app in each worker, so SIGHUP also loads new code")
+    parser.add_argument("--no-access-log", dest="access_log", action="store_false")
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    from api.core.config import settings
+
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=args.log_level.upper(),
+        format="%(asctime)s [%(process)d] %(levelname)s %(name)s: %(message)s",
+    )
+    if settings.TRIGGERS_ENABLED and args.workers > 1:
+        logger.warning(
+            "Triggers are evaluated per worker; with %d workers each sees only part of a series "
+            "and may fire or resolve alerts wrongly. Use one worker or TRIGGERS_ENABLED=false",
+            args.workers,
+        )
+    prepare(args)
+    sock = bind_socket(args.host, args.port, args.backlog)
+    return Master(sock, args).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""
+Alert deduplication
+"""
+import hashlib
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.orm import Session
+from api.db.database import dialect_insert
+from api.db.models import Alert
+
+
+def alert_fingerprint(host_id: int, trigger_id: Optional[int], level: str, title: str) -> str:
+    """
+    Identity of an incident: host, trigger and level.
+
+    Manual alerts have no trigger, so their title stands in for it; two
+    different manual alerts on one host never merge.
+    """
+    source = trigger_id if trigger_id is not None else f"-:{title}"
+    raw = f"{host_id}:{source}:{level}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def alert_upsert(
+    db: Session,
+    host_id: int,
+    trigger_id: Optional[int],
+    title: str,
+    message: str,
+    level: str,
+    ts: Optional[datetime] = None,
+):
+    """
+    INSERT of an active alert, or a bump of the open one with its fingerprint.
+
+    ON CONFLICT targets the partial unique index over active alerts, so a
+    repeat adds to `occurrences` and moves `last_seen_at` instead of adding
+    a row. Resolved alerts are outside the index; the next firing opens a
+    new one. Add `.returning(...)` as needed.
+    """
+    now = datetime.utcnow()
+    ts = ts or now
+    stmt = dialect_insert(db, Alert).values(
+        host_id=host_id,
+        trigger_id=trigger_id,
+        title=title,
+        message=message,
+        level=level,
+        status="active",
+        fingerprint=alert_fingerprint(host_id, trigger_id, level, title),
+        occurrences=1,
+        triggered_at=ts,
+        last_seen_at=ts,
+        created_at=now,
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[Alert.fingerprint],
+        index_where=Alert.status == "active",
+        set_={
+            "occurrences": Alert.occurrences + 1,
+            "last_seen_at": stmt.excluded.last_seen_at,
+            "title": stmt.excluded.title,
+            "message": stmt.excluded.message,
+        },
+    )
@@ -0,0 +1,202 @@
+"""
+Write-behind ingestion buffer
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from sqlalchemy.exc import OperationalError
+from api.core.config import settings
+from api.db.database import SessionLocal
+from api.schemas import MetricCreate
+from api.services.ingest import write_metrics
+from api.services.latest import latest_values
+
+logger = logging.getLogger(__name__)
+
+
+def _write(points: List[MetricCreate]) -> List[dict]:
+    db = SessionLocal()
+    try:
+        rows = write_metrics(db, points)
+        db.commit()
+        return rows
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class IngestBuffer:
+    """
+    Bounded in-process queue of accepted metric points.
+
+    Requests only append, so their latency does not depend on the database.
+    Flusher tasks drain the queue in large transactions once `flush_rows`
+    points are waiting or `flush_ms` has passed. A full buffer refuses new
+    points, letting the route answer 429 instead of growing memory.
+
+    While the database is unavailable points stay queued. A chunk that
+    fails otherwise is written again host by host, so only the points of
+    hosts that still fail are dropped and counted.
+    """
+
+    def __init__(self, capacity: int, flush_rows: int, flush_ms: int, max_flush_rows: int, flushers: int = 1):
+        self.capacity = capacity
+        self.flush_rows = flush_rows
+        self.flush_ms = flush_ms
+        self.max_flush_rows = max_flush_rows
+        self.flushers = flushers
+        self._queue: Deque[MetricCreate] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._closing = False
+        # Stats
+        self.accepted = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.last_flush_rows = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self._rows_per_second = 0.0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def offer(self, points: List[MetricCreate]) -> bool:
+        """Queue points unless that would exceed capacity"""
+        if len(self._queue) + len(points) > self.capacity:
+            self.rejected += len(points)
+            return False
+        self._queue.extend(points)
+        self.accepted += len(points)
+        if self._wakeup is not None and len(self._queue) >= self.flush_rows:
+            self._wakeup.set()
+        return True
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained"""
+        if self._rows_per_second <= 0:
+            return 1
+        return min(60, max(1, math.ceil(len(self._queue) / self._rows_per_second)))
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self._queue),
+            "capacity": self.capacity,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "rows_flushed": self.rows_flushed,
+            "last_flush_rows": self.last_flush_rows,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+            "avg_rows_per_flush": self.rows_flushed / self.flushes if self.flushes else 0.0,
+        }
+
+    def start(self) -> None:
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.flushers)]
+
+    async def stop(self) -> None:
+        """Flush everything still queued, then stop the flushers"""
+        self._closing = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self) -> None:
+        while True:
+            if len(self._queue) < self.flush_rows and not self._closing:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_ms / 1000)
+                except asyncio.TimeoutError:
+                    pass
+            if not self._queue:
+                if self._closing:
+                    return
+                continue
+            try:
+                await self.flush_once()
+            except Exception:
+                # A flusher that exits leaves the buffer to fill up and every
+                # request answered 429, so it keeps going whatever failed
+                logger.exception("Ingest flush failed")
+                await asyncio.sleep(1)
+
+    async def _unavailable(self, points: List[MetricCreate], exc: Exception) -> None:
+        """Requeue points the database could not take, and back off; drop them on shutdown"""
+        if self._closing:
+            self.dropped += len(points)
+            logger.error("Dropped %d buffered points on shutdown: %s", len(points), exc)
+            return
+        self._queue.extendleft(reversed(points))
+        logger.warning("Ingest flush failed, retrying: %s", exc)
+        await asyncio.sleep(1)
+
+    async def _write_by_host(self, chunk: List[MetricCreate]) -> List[dict]:
+        """Write a failed chunk again, one transaction per host"""
+        by_host: Dict[int, List[MetricCreate]] = {}
+        for point in chunk:
+            by_host.setdefault(point.host_id, []).append(point)
+        hosts = list(by_host.items())
+        rows: List[dict] = []
+        for i, (host_id, points) in enumerate(hosts):
+            try:
+                rows.extend(await asyncio.to_thread(_write, points))
+            except OperationalError as exc:
+                await self._unavailable([p for _, rest in hosts[i:] for p in rest], exc)
+                break
+            except Exception:
+                self.dropped += len(points)
+                logger.exception("Dropped %d buffered points of host %d", len(points), host_id)
+        return rows
+
+    async def flush_once(self) -> int:
+        """Write one chunk of queued points in a single transaction"""
+        queue = self._queue
+        chunk = [queue.popleft() for _ in range(min(len(queue), self.max_flush_rows))]
+        if not chunk:
+            return 0
+
+        started = time.perf_counter()
+        try:
+            rows = await asyncio.to_thread(_write, chunk)
+        except OperationalError as exc:
+            # Database unavailable: keep the points and back off
+            await self._unavailable(chunk, exc)
+            return 0
+        except Exception:
+            # E.g. a host purged since its points were accepted
+            logger.warning("Ingest flush of %d points failed, writing them host by host", len(chunk), exc_info=True)
+            rows = await self._write_by_host(chunk)
+        elapsed = time.perf_counter() - started
+
+        self.flushes += 1
+        self.rows_flushed += len(rows)
+        self.last_flush_rows = len(rows)
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        rate = len(rows) / elapsed if elapsed > 0 else 0.0
+        self._rows_per_second = rate if not self._rows_per_second else 0.8 * self._rows_per_second + 0.2 * rate
+
+        await latest_values.record(rows)
+        return len(rows)
+
+
+ingest_buffer = IngestBuffer(
+    capacity=settings.INGEST_BUFFER_MAX_ROWS,
+    flush_rows=settings.INGEST_FLUSH_ROWS,
+    flush_ms=settings.INGEST_FLUSH_MS,
+    max_flush_rows=settings.INGEST_FLUSH_MAX_ROWS,
+    flushers=settings.INGEST_FLUSHERS,
+)
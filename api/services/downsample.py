@@ -0,0 +1,54 @@
+"""
+Series downsampling
+"""
+from datetime import datetime, timezone
+from typing import List, Sequence, Tuple
+
+Point = Tuple[datetime, float]
+
+
+def lttb(points: Sequence[Point], threshold: int) -> List[Point]:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, for every bucket in between, the
+    point forming the largest triangle with the previously kept point and
+    the average of the next bucket. Peaks and troughs survive, so the shape
+    of the series is preserved with at most `threshold` points.
+    """
+    length = len(points)
+    if threshold >= length or threshold < 3:
+        return list(points)
+
+    xs = [p[0].replace(tzinfo=timezone.utc).timestamp() for p in points]
+    ys = [p[1] for p in points]
+
+    sampled = [points[0]]
+    every = (length - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket, used as the third triangle vertex
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, length)
+        span = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+
+        max_area = -1.0
+        chosen = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                chosen = j
+
+        sampled.append(points[chosen])
+        a = chosen
+
+    sampled.append(points[-1])
+    return sampled
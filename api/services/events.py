@@ -0,0 +1,297 @@
+"""
+Live event fan-out for streaming clients
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Set
+import orjson
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from api.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "netmon:events"
+
+# Events waiting in a session until its transaction commits
+_PENDING = "netmon_events"
+
+
+def queue_event(db, payload: dict) -> None:
+    """Publish payload once the session's current transaction commits"""
+    if not event_broker.idle:
+        db.info.setdefault(_PENDING, []).append(payload)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session: Session) -> None:
+    events = session.info.pop(_PENDING, None)
+    if events:
+        event_broker.publish_threadsafe(events)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop(_PENDING, None)
+
+
+def metric_event(rows: Iterable[dict]) -> dict:
+    """One event for a written batch; subscribers receive their share of it"""
+    return {
+        "type": "metrics",
+        "points": [
+            {"host_id": r["host_id"], "key": r["key"], "value": r["value"], "timestamp": r["timestamp"]}
+            for r in rows
+        ],
+    }
+
+
+def alert_event(action: str, alert: dict) -> dict:
+    """`action` is opened, updated or resolved; alert needs at least id, host_id and level"""
+    return {"type": "alert", "action": action, "alert": alert}
+
+
+def hosts_deleted_event(host_ids: Iterable[int]) -> dict:
+    """Tells every worker to drop its caches of these hosts; never sent to clients"""
+    return {"type": "hosts_deleted", "host_ids": list(host_ids)}
+
+
+class Subscription:
+    """
+    One streaming client: its filters and a bounded queue of SSE frames.
+
+    A client that lets its queue fill up is dropped rather than slowing
+    down publishers or buffering without bound.
+    """
+
+    def __init__(
+        self,
+        host_ids: Set[int],
+        keys: Optional[Set[str]] = None,
+        levels: Optional[Set[str]] = None,
+        types: Optional[Set[str]] = None,
+        maxsize: int = 256,
+    ):
+        self.host_ids = host_ids
+        self.keys = keys
+        self.levels = levels
+        self.types = types
+        self.queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue(maxsize)
+        self.dropped = False
+
+    def offer(self, frame: bytes) -> bool:
+        """Queue a frame; False once the client has been dropped"""
+        if self.dropped:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            self.dropped = True
+            self.close()
+            return False
+
+    def close(self) -> None:
+        """End the stream; queued frames are discarded to make room for the marker"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+def sse_frame(name: str, data: dict) -> bytes:
+    return b"event: " + name.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+class EventBroker:
+    """
+    Fans committed events out to this worker's subscribers.
+
+    Publishing costs nothing while nobody is listening and the Redis relay
+    is off. With the relay on, every event is also published on one Redis
+    channel and events from other workers are fanned out here, so a client
+    sees everything whichever worker it is connected to. Subscribers are
+    indexed by host id; each event touches only the clients of its hosts.
+    Handlers registered with on() also see every event, local or relayed,
+    e.g. to invalidate per-worker caches.
+    """
+
+    def __init__(self, url: str, retry_after: float = 30.0):
+        self._url = url
+        self._client = None
+        self._retry_after = retry_after
+        self._down_until = 0.0
+        self._origin = uuid.uuid4().hex
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._by_host: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._subscribers: Set[Subscription] = set()
+        self._relay: Optional[asyncio.Task] = None
+        self._handlers: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.redis_errors = 0
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    @property
+    def idle(self) -> bool:
+        return not self._subscribers and self._relay is None
+
+    def on(self, event_type: str, handler: Callable[[dict], None]) -> None:
+        """Call handler(event) in the event loop for every event of event_type"""
+        self._handlers[event_type].append(handler)
+
+    def subscribe(self, subscription: Subscription) -> Subscription:
+        self._loop = asyncio.get_running_loop()
+        self._subscribers.add(subscription)
+        for host_id in subscription.host_ids:
+            self._by_host[host_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+        for host_id in subscription.host_ids:
+            subscribers = self._by_host.get(host_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._by_host[host_id]
+
+    def publish_threadsafe(self, events: List[dict]) -> None:
+        """Hand events to the event loop; callable from any thread"""
+        loop = self._loop
+        if self.idle or loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self.publish, events)
+        except RuntimeError:
+            # Loop shut down in the meantime
+            pass
+
+    def publish(self, events: List[dict]) -> None:
+        """Deliver events locally and relay them to other workers"""
+        self.published += len(events)
+        self._fan_out(events)
+        if self._relay is not None and time.monotonic() >= self._down_until:
+            payload = orjson.dumps({"origin": self._origin, "events": events})
+            asyncio.ensure_future(self._send(payload))
+
+    def _fan_out(self, events: List[dict]) -> None:
+        for item in events:
+            for handler in self._handlers.get(item["type"], ()):
+                try:
+                    handler(item)
+                except Exception:
+                    logger.exception("Event handler for %s failed", item["type"])
+        if not self._subscribers:
+            return
+        for item in events:
+            if item["type"] == "metrics":
+                self._fan_out_metrics(item["points"])
+            elif item["type"] == "alert":
+                self._fan_out_alert(item)
+
+    def _deliver(self, subscription: Subscription, frame: bytes) -> None:
+        if subscription.offer(frame):
+            self.delivered += 1
+        elif subscription.dropped and subscription in self._subscribers:
+            self.dropped += 1
+            self.unsubscribe(subscription)
+
+    def _fan_out_metrics(self, points: List[dict]) -> None:
+        by_host: Dict[int, List[dict]] = defaultdict(list)
+        for point in points:
+            if point["host_id"] in self._by_host:
+                by_host[point["host_id"]].append(point)
+        if not by_host:
+            return
+        wanted: Dict[Subscription, List[dict]] = defaultdict(list)
+        for host_id, host_points in by_host.items():
+            for subscription in self._by_host.get(host_id, ()):
+                if subscription.types and "metrics" not in subscription.types:
+                    continue
+                if subscription.keys:
+                    wanted[subscription].extend(p for p in host_points if p["key"] in subscription.keys)
+                else:
+                    wanted[subscription].extend(host_points)
+        for subscription, selected in wanted.items():
+            if selected:
+                self._deliver(subscription, sse_frame("metrics", {"points": selected}))
+
+    def _fan_out_alert(self, item: dict) -> None:
+        alert = item["alert"]
+        frame = None
+        for subscription in tuple(self._by_host.get(alert["host_id"], ())):
+            if subscription.types and "alerts" not in subscription.types:
+                continue
+            if subscription.levels and alert.get("level") not in subscription.levels:
+                continue
+            if frame is None:
+                frame = sse_frame("alert", {"action": item["action"], "alert": alert})
+            self._deliver(subscription, frame)
+
+    # Redis relay
+
+    def _mark_down(self, exc: Exception) -> None:
+        self.redis_errors += 1
+        self._down_until = time.monotonic() + self._retry_after
+        logger.warning("Redis event relay unavailable: %s", exc)
+
+    async def _send(self, payload: bytes) -> None:
+        try:
+            await self._client.publish(CHANNEL, payload)
+        except (RedisError, OSError) as exc:
+            self._mark_down(exc)
+
+    def _receive(self, payload: bytes) -> None:
+        message = orjson.loads(payload)
+        if message.get("origin") == self._origin:
+            return
+        self._fan_out(message["events"])
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(CHANNEL)
+                self._down_until = 0.0
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        try:
+                            self._receive(message["data"])
+                        except Exception:
+                            logger.exception("Dropping malformed relayed event")
+            except (RedisError, OSError) as exc:
+                self._mark_down(exc)
+            finally:
+                try:
+                    await pubsub.close()
+                except (RedisError, OSError):
+                    pass
+            await asyncio.sleep(self._retry_after)
+
+    def start(self) -> None:
+        """Relay events between workers through Redis pub/sub"""
+        self._loop = asyncio.get_running_loop()
+        if self._relay is None:
+            self._client = redis.Redis.from_url(self._url, socket_connect_timeout=0.5)
+            self._relay = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        for subscription in tuple(self._subscribers):
+            subscription.close()
+            self.unsubscribe(subscription)
+        if self._relay is not None:
+            self._relay.cancel()
+            await asyncio.gather(self._relay, return_exceptions=True)
+            self._relay = None
+            await self._client.close()
+
+
+event_broker = EventBroker(settings.REDIS_URL)
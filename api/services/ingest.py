@@ -0,0 +1,98 @@
+"""
+Metric ingestion
+"""
+from datetime import datetime, timezone
+from typing import Iterable, List, Set
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from api.core.config import settings
+from api.db.models import Host, Metric
+from api.schemas import MetricCreate
+from api.services.events import event_broker, metric_event, queue_event
+from api.services.items import item_registry
+from api.services.rollups import update_rollups
+from api.services.triggers import trigger_engine
+
+
+class IngestStats:
+    """Process-wide ingestion counters"""
+
+    def __init__(self):
+        self.rows = 0
+        self.writes = 0
+
+
+ingest_stats = IngestStats()
+
+
+def owned_host_ids(db: Session, user_id: int, host_ids: Iterable[int]) -> Set[int]:
+    """Return the subset of host_ids owned by user_id, in one query"""
+    wanted = set(host_ids)
+    if not wanted:
+        return set()
+    rows = db.query(Host.id).filter(Host.id.in_(wanted), Host.user_id == user_id, Host.deleted_at.is_(None)).all()
+    return {row.id for row in rows}
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """Convert aware datetimes to naive UTC, matching the TIMESTAMP columns"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def metric_rows(db: Session, points: List[MetricCreate]) -> List[dict]:
+    """
+    Resolved rows for metric points, defaulting the timestamp to now.
+
+    Rows carry host_id and key for the derived-state consumers; only
+    item_id, value and timestamp are stored.
+    """
+    now = datetime.utcnow()
+    item_ids = item_registry.resolve(db, ((p.host_id, p.key) for p in points))
+    return [
+        {
+            "item_id": item_ids[(point.host_id, point.key)],
+            "host_id": point.host_id,
+            "key": point.key,
+            "value": point.value,
+            "timestamp": to_naive_utc(point.timestamp) if point.timestamp else now,
+        }
+        for point in points
+    ]
+
+
+def after_write(db: Session, rows: List[dict]) -> None:
+    """Derived state maintained from every ingested row"""
+    ingest_stats.rows += len(rows)
+    ingest_stats.writes += 1
+    update_rollups(db, rows)
+    if settings.TRIGGERS_ENABLED:
+        trigger_engine.ensure_loaded(db)
+        trigger_engine.evaluate(db, rows)
+    if not event_broker.idle:
+        queue_event(db, metric_event(rows))
+
+
+def insert_rows(db: Session, rows: List[dict]) -> None:
+    """Single multi-row INSERT of resolved metric rows"""
+    db.execute(
+        insert(Metric),
+        [{"item_id": r["item_id"], "value": r["value"], "timestamp": r["timestamp"]} for r in rows],
+    )
+
+
+def write_metrics(db: Session, points: List[MetricCreate]) -> List[dict]:
+    """
+    Insert metric points with a single multi-row INSERT.
+
+    The caller owns the transaction; nothing is committed here. Returns the
+    resolved rows for post-commit consumers.
+    """
+    if not points:
+        return []
+
+    rows = metric_rows(db, points)
+    insert_rows(db, rows)
+    after_write(db, rows)
+    return rows
@@ -0,0 +1,113 @@
+"""
+Item registry
+"""
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from api.db.database import dialect_insert, on_commit, staged_value, tuple_in
+from api.db.models import Item
+
+# Bound on the number of row-value tuples per IN (...) clause
+_IN_CHUNK = 500
+
+ItemKey = Tuple[int, str]
+
+
+class ItemRegistry:
+    """
+    Process-wide (host_id, key) -> item_id map.
+
+    Hits are a dict lookup. Misses are created with INSERT ... ON CONFLICT
+    DO NOTHING on the (host_id, key) unique index and read back in one
+    query, so concurrent workers converge on the same id. Items created
+    by a transaction are cached once it commits; until then only that
+    transaction sees them.
+    """
+
+    def __init__(self):
+        self._ids: Dict[ItemKey, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def resolve(self, db: Session, keys: Iterable[ItemKey]) -> Dict[ItemKey, int]:
+        """item_id for every (host_id, key), creating missing items"""
+        wanted = set(keys)
+        ids = self._ids
+        found = {k: ids[k] for k in wanted if k in ids}
+        missing = wanted - found.keys()
+        if missing:
+            created = on_commit(db, self, dict, self._remember)
+            found.update({k: created[k] for k in missing if k in created})
+            missing = sorted(missing - found.keys())
+        self.hits += len(found)
+        self.misses += len(missing)
+        if missing:
+            rows = db.execute(
+                dialect_insert(db, Item).on_conflict_do_nothing().returning(Item.id, Item.host_id, Item.key),
+                [{"host_id": h, "key": k, "value_type": "numeric"} for h, k in missing],
+            )
+            new = {(row.host_id, row.key): row.id for row in rows}
+            created.update(new)
+            found.update(new)
+            existing = [k for k in missing if k not in new]
+            if existing:
+                found.update(self._load(db, existing))
+        return found
+
+    def lookup(self, db: Session, host_id: int, key: str) -> Optional[int]:
+        """item_id of an existing item, without creating it"""
+        item_id = self._ids.get((host_id, key))
+        if item_id is None:
+            item_id = (staged_value(db, self) or {}).get((host_id, key))
+        if item_id is None:
+            item_id = self._load(db, [(host_id, key)]).get((host_id, key))
+        return item_id
+
+    def _load(self, db: Session, keys) -> Dict[ItemKey, int]:
+        """Read committed items; this transaction's own new items are staged instead"""
+        loaded = {}
+        for i in range(0, len(keys), _IN_CHUNK):
+            chunk = keys[i:i + _IN_CHUNK]
+            rows = db.execute(
+                select(Item.id, Item.host_id, Item.key).where(
+                    tuple_in(db, (Item.host_id, Item.key), chunk)
+                )
+            )
+            for row in rows:
+                loaded[(row.host_id, row.key)] = row.id
+        self._remember(loaded)
+        return loaded
+
+    def _remember(self, ids: Dict[ItemKey, int]) -> None:
+        with self._lock:
+            self._ids.update(ids)
+
+    def preload(self, db: Session) -> int:
+        """Cache every existing item, e.g. before forking workers; returns the cache size"""
+        loaded = {}
+        rows = db.execute(
+            select(Item.id, Item.host_id, Item.key).execution_options(yield_per=10_000)
+        )
+        for row in rows:
+            loaded[(row.host_id, row.key)] = row.id
+        with self._lock:
+            self._ids.update(loaded)
+        return len(self._ids)
+
+    def forget_host(self, host_id: int) -> None:
+        """Drop cached items of a deleted host"""
+        with self._lock:
+            for k in [k for k in self._ids if k[0] == host_id]:
+                del self._ids[k]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+
+
+item_registry = ItemRegistry()
@@ -0,0 +1,144 @@
+"""
+Latest value per (host_id, key)
+"""
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+from api.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Sets each field only when its timestamp is not older than the stored one,
+# so replayed or late batches never roll a value back.
+# KEYS[1] = hash, ARGV[1] = ttl, then (field, epoch, value) triples
+_SET_NEWER = """
+for i = 2, #ARGV, 3 do
+  local cur = redis.call('HGET', KEYS[1], ARGV[i])
+  if (not cur) or tonumber(string.match(cur, '^[^|]+')) <= tonumber(ARGV[i + 1]) then
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1] .. '|' .. ARGV[i + 2])
+  end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+Latest = Tuple[float, float]
+
+
+def _hash_key(host_id: int) -> str:
+    return f"netmon:latest:{host_id}"
+
+
+def _from_epoch(epoch: float) -> datetime:
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None)
+
+
+class LatestValues:
+    """
+    Last value of every series, kept in one Redis hash per host.
+
+    Ingestion writes all hosts of a batch in one pipeline and readers fetch
+    many hosts in one round trip. Every worker also keeps the values it
+    ingested itself in memory; that copy answers reads while Redis is down.
+    """
+
+    def __init__(self, url: str, ttl: int, retry_after: float = 30.0):
+        self._client = redis.Redis.from_url(
+            url, socket_connect_timeout=0.5, socket_timeout=0.5
+        )
+        self._script = self._client.register_script(_SET_NEWER)
+        self._ttl = ttl
+        self._retry_after = retry_after
+        self._down_until = 0.0
+        self._local: Dict[int, Dict[str, Latest]] = {}
+        self.redis_errors = 0
+
+    def _available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _mark_down(self, exc: Exception) -> None:
+        self.redis_errors += 1
+        self._down_until = time.monotonic() + self._retry_after
+        logger.warning("Redis unavailable, using in-process latest values: %s", exc)
+
+    async def record(self, rows: Iterable[dict]) -> None:
+        """Store the newest value per (host_id, key) from ingested rows"""
+        newest: Dict[int, Dict[str, Latest]] = {}
+        for row in rows:
+            epoch = row["timestamp"].replace(tzinfo=timezone.utc).timestamp()
+            fields = newest.setdefault(row["host_id"], {})
+            current = fields.get(row["key"])
+            if current is None or current[0] <= epoch:
+                fields[row["key"]] = (epoch, row["value"])
+
+        for host_id, fields in newest.items():
+            local = self._local.setdefault(host_id, {})
+            for key, latest in fields.items():
+                current = local.get(key)
+                if current is None or current[0] <= latest[0]:
+                    local[key] = latest
+
+        if not newest or not self._available():
+            return
+        try:
+            async with self._client.pipeline(transaction=False) as pipe:
+                for host_id, fields in newest.items():
+                    args: List = [self._ttl]
+                    for key, (epoch, value) in fields.items():
+                        args.extend((key, repr(epoch), repr(value)))
+                    await self._script(keys=[_hash_key(host_id)], args=args, client=pipe)
+                await pipe.execute()
+        except (RedisError, OSError) as exc:
+            self._mark_down(exc)
+
+    async def get_many(
+        self, host_ids: List[int], keys: Optional[List[str]] = None
+    ) -> Dict[int, Dict[str, dict]]:
+        """Latest values for many hosts in one round trip"""
+        raw: Dict[int, Dict[str, Latest]] = {}
+        if self._available():
+            try:
+                async with self._client.pipeline(transaction=False) as pipe:
+                    for host_id in host_ids:
+                        pipe.hgetall(_hash_key(host_id))
+                    results = await pipe.execute()
+                for host_id, fields in zip(host_ids, results):
+                    raw[host_id] = {}
+                    for key, packed in fields.items():
+                        epoch, _, value = packed.decode().partition("|")
+                        raw[host_id][key.decode()] = (float(epoch), float(value))
+            except (RedisError, OSError) as exc:
+                self._mark_down(exc)
+                raw = {}
+        if not raw:
+            raw = {host_id: dict(self._local.get(host_id, {})) for host_id in host_ids}
+
+        wanted = set(keys) if keys else None
+        return {
+            host_id: {
+                key: {"timestamp": _from_epoch(epoch), "value": value}
+                for key, (epoch, value) in fields.items()
+                if wanted is None or key in wanted
+            }
+            for host_id, fields in raw.items()
+        }
+
+    def forget_local(self, host_id: int) -> None:
+        """Drop this worker's in-memory values of a host"""
+        self._local.pop(host_id, None)
+
+    async def forget_host(self, host_id: int) -> None:
+        """Drop the values of a deleted host"""
+        self.forget_local(host_id)
+        if not self._available():
+            return
+        try:
+            await self._client.delete(_hash_key(host_id))
+        except (RedisError, OSError) as exc:
+            self._mark_down(exc)
+
+
+latest_values = LatestValues(settings.REDIS_URL, ttl=settings.LATEST_VALUES_TTL_SECONDS)
@@ -0,0 +1,248 @@
+"""
+Metrics table partition maintenance
+
+With METRICS_PARTITIONING=day|week, `python -m api.db.migrate` (and so
+api.server at startup) partitions metrics before anything writes to it.
+An existing table is converted in place, without copying: it becomes the
+default partition, keeping every row. Maintenance then creates a partition
+per period, moving that period's rows out of the default partition, and
+retention deletes the rows older than every partition in chunks.
+"""
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from api.core.config import settings
+from api.db.database import SessionLocal
+from api.db.migrate import run_ddl
+
+logger = logging.getLogger(__name__)
+
+PARENT = "metrics"
+DEFAULT_PARTITION = "metrics_default"
+PERIODS = {"day": timedelta(days=1), "week": timedelta(weeks=1)}
+
+_NAME = re.compile(r"^metrics_([dw])(\d{8})$")
+
+
+def partition_bounds(ts: datetime, period: str) -> Tuple[datetime, datetime]:
+    """[start, end) of the partition holding ts; weeks start on Monday"""
+    start = datetime(ts.year, ts.month, ts.day)
+    if period == "week":
+        start -= timedelta(days=start.weekday())
+    return start, start + PERIODS[period]
+
+
+def partition_name(start: datetime, period: str) -> str:
+    return f"{PARENT}_{period[0]}{start:%Y%m%d}"
+
+
+def parse_partition_name(name: str) -> Optional[Tuple[datetime, datetime]]:
+    """Bounds encoded in a partition name, None for other tables"""
+    match = _NAME.match(name)
+    if not match:
+        return None
+    period = "day" if match.group(1) == "d" else "week"
+    start = datetime.strptime(match.group(2), "%Y%m%d")
+    return start, start + PERIODS[period]
+
+
+def wanted_partitions(now: datetime, period: str, ahead: int, retention_days: int) -> List[Tuple[datetime, datetime]]:
+    """Partitions from the retention horizon through `ahead` future periods"""
+    step = PERIODS[period]
+    first = now - timedelta(days=retention_days) if retention_days > 0 else now
+    start, _ = partition_bounds(first, period)
+    last, _ = partition_bounds(now + step * ahead, period)
+    bounds = []
+    while start <= last:
+        bounds.append((start, start + step))
+        start += step
+    return bounds
+
+
+def is_partitioned(db: Session) -> bool:
+    return db.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+        ),
+        {"name": PARENT},
+    ).first() is not None
+
+
+def existing_partitions(db: Session) -> List[str]:
+    return list(db.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :name AND pg_table_is_visible(p.oid)"
+        ),
+        {"name": PARENT},
+    ).scalars())
+
+
+def create_partition(db: Session, start: datetime, end: datetime, period: str) -> str:
+    """
+    Create and attach one range partition.
+
+    Rows that already landed in the default partition for this range are
+    moved first, otherwise attaching would fail its constraint check.
+    """
+    name = partition_name(start, period)
+    bounds = {"start": start, "end": end}
+    db.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} "
+        f"(LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    ))
+    db.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+        f"WHERE timestamp >= :start AND timestamp < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), bounds)
+    db.execute(text(
+        f"ALTER TABLE {PARENT} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    return name
+
+
+def ensure_partitions(db: Session, now: Optional[datetime] = None) -> List[str]:
+    """Create missing partitions for the retention window and upcoming periods"""
+    period = settings.METRICS_PARTITIONING
+    now = now or datetime.utcnow()
+    db.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+    existing = set(existing_partitions(db))
+    created = []
+    for start, end in wanted_partitions(
+        now, period, settings.METRICS_PARTITIONS_AHEAD, settings.METRICS_RAW_RETENTION_DAYS
+    ):
+        if partition_name(start, period) not in existing:
+            created.append(create_partition(db, start, end, period))
+            db.commit()
+    return created
+
+
+def expire_partitions(db: Session, cutoff: datetime) -> List[str]:
+    """
+    Drop (or detach) every partition that ends at or before cutoff.
+
+    Expiring a period is a catalog change; no rows are scanned.
+    """
+    expired = []
+    for name in existing_partitions(db):
+        bounds = parse_partition_name(name)
+        if bounds is None or bounds[1] > cutoff:
+            continue
+        if settings.METRICS_PARTITION_DETACH:
+            db.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        else:
+            db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+        expired.append(name)
+    return expired
+
+
+PARTITIONED_METRICS = """
+CREATE TABLE metrics (
+    id BIGINT NOT NULL DEFAULT nextval('{sequence}'),
+    item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+    value FLOAT NOT NULL,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+ALTER SEQUENCE {sequence} OWNED BY metrics.id;
+ALTER TABLE metrics ATTACH PARTITION metrics_default DEFAULT;
+CREATE INDEX ix_metrics_item_id_timestamp ON metrics (item_id, timestamp) INCLUDE (value);
+CREATE INDEX ix_metrics_timestamp ON metrics (timestamp)
+"""
+
+
+def convert_to_partitioned(conn: Connection) -> None:
+    """
+    Turn the unpartitioned metrics table into the default partition of a
+    new partitioned one.
+
+    Nothing is copied. Under an exclusive lock, timestamp is made NOT NULL
+    and the (id, timestamp) primary key index is built, one pass over the
+    table each; the existing indexes are renamed and reused.
+    """
+    sequence = conn.execute(text("SELECT pg_get_serial_sequence(:name, 'id')"), {"name": PARENT}).scalar()
+    if sequence is None:
+        raise RuntimeError(f"{PARENT}.id has no sequence")
+    conn.execute(text(f"LOCK TABLE {PARENT} IN ACCESS EXCLUSIVE MODE"))
+    conn.execute(text(f"ALTER TABLE {PARENT} RENAME TO {DEFAULT_PARTITION}"))
+    inspector = inspect(conn)
+    # Names the partitioned table's own indexes and primary key take over
+    for index in inspector.get_indexes(DEFAULT_PARTITION):
+        suffix = re.sub(r"^(ix|idx)_metrics_", "", index["name"])
+        conn.execute(text(f'ALTER INDEX "{index["name"]}" RENAME TO {DEFAULT_PARTITION}_{suffix}'))
+    primary_key = inspector.get_pk_constraint(DEFAULT_PARTITION)["name"]
+    if primary_key:
+        conn.execute(text(f'ALTER TABLE {DEFAULT_PARTITION} DROP CONSTRAINT "{primary_key}"'))
+    conn.execute(text(f"ALTER TABLE {DEFAULT_PARTITION} ALTER COLUMN timestamp SET NOT NULL"))
+    run_ddl(conn, PARTITIONED_METRICS.format(sequence=sequence))
+
+
+def ensure_partitioned(conn: Connection) -> bool:
+    """
+    Make metrics a partitioned table with a default partition; returns
+    whether an unpartitioned table was converted.
+
+    With the default partition in place, inserts work before maintenance
+    has created any period's partition.
+    """
+    if not inspect(conn).has_table(PARENT):
+        return False
+    converted = not is_partitioned(conn)
+    if converted:
+        logger.info("Converting %s to a partitioned table; its rows stay in %s", PARENT, DEFAULT_PARTITION)
+        convert_to_partitioned(conn)
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+    return converted
+
+
+def setup_partitioning(engine: Engine) -> bool:
+    """ensure_partitioned when METRICS_PARTITIONING asks for it, in one transaction"""
+    if settings.METRICS_PARTITIONING not in PERIODS or engine.dialect.name != "postgresql":
+        return False
+    with engine.begin() as conn:
+        return ensure_partitioned(conn)
+
+
+def partitioning_active(db: Session) -> bool:
+    """Whether partition maintenance applies to this database"""
+    return (
+        settings.METRICS_PARTITIONING in PERIODS
+        and db.get_bind().dialect.name == "postgresql"
+        and is_partitioned(db)
+    )
+
+
+def run_partition_maintenance() -> List[str]:
+    db = SessionLocal()
+    try:
+        if not partitioning_active(db):
+            logger.warning("METRICS_PARTITIONING is set but %s is not a partitioned table", PARENT)
+            return []
+        created = ensure_partitions(db)
+        db.commit()
+        return created
+    finally:
+        db.close()
+
+
+async def partition_loop() -> None:
+    """Keep upcoming metrics partitions created ahead of time"""
+    while True:
+        try:
+            created = await asyncio.to_thread(run_partition_maintenance)
+            if created:
+                logger.info("Created metrics partitions %s", created)
+        except Exception:
+            logger.exception("Partition maintenance failed")
+        await asyncio.sleep(settings.PARTITION_MAINTENANCE_SECONDS)
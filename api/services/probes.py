@@ -0,0 +1,330 @@
+"""
+Active host probes
+"""
+import asyncio
+import logging
+import socket
+import ssl
+import struct
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import select, update
+from api.core.config import settings
+from api.db.database import SessionLocal
+from api.db.models import Host
+from api.schemas import MetricCreate
+from api.services.ingest import write_metrics
+from api.services.latest import latest_values
+
+logger = logging.getLogger(__name__)
+
+# Status updates are issued per state in IN lists of this size
+_IN_CHUNK = 500
+
+
+class ProbeSpec(NamedTuple):
+    kind: str  # "icmp", "tcp", "http" or "https"
+    port: Optional[int] = None
+    path: str = "/"
+
+    @property
+    def name(self) -> str:
+        """Metric key prefix, e.g. `probe.tcp_22`"""
+        return f"probe.{self.kind}" if self.port is None else f"probe.{self.kind}_{self.port}"
+
+
+def parse_probe_tag(tag: str) -> Optional[ProbeSpec]:
+    """`probe:icmp`, `probe:tcp:22`, `probe:http:8080/health` or `probe:https:443`"""
+    if not tag.startswith("probe:"):
+        return None
+    kind, _, target = tag[6:].partition(":")
+    if kind == "icmp":
+        return ProbeSpec("icmp")
+    if kind not in ("tcp", "http", "https"):
+        return None
+    port, slash, path = target.partition("/")
+    if not port.isdigit():
+        return None
+    return ProbeSpec(kind, int(port), slash + path or "/")
+
+
+def host_probes(tags: Optional[List[str]]) -> List[ProbeSpec]:
+    """Probes of a host: its `probe:` tags, else PROBE_DEFAULTS"""
+    specs = [spec for spec in map(parse_probe_tag, tags or []) if spec]
+    if specs:
+        return specs
+    return [spec for spec in map(parse_probe_tag, settings.PROBE_DEFAULTS) if spec]
+
+
+def start_offset(host_id: int, interval: float) -> float:
+    """Stable per-host offset within the interval, so probes are spread out"""
+    return (zlib.crc32(str(host_id).encode()) % 10_000) / 10_000 * interval
+
+
+async def tcp_probe(ip: str, port: int) -> float:
+    """Seconds to complete a TCP handshake"""
+    started = time.perf_counter()
+    _, writer = await asyncio.open_connection(ip, port)
+    elapsed = time.perf_counter() - started
+    writer.close()
+    return elapsed
+
+
+_INSECURE_TLS = ssl.create_default_context()
+_INSECURE_TLS.check_hostname = False
+_INSECURE_TLS.verify_mode = ssl.CERT_NONE
+
+
+async def http_probe(ip: str, port: int, path: str = "/", tls: bool = False) -> float:
+    """
+    Seconds until the status line of `GET path` arrives.
+
+    Reachability only: certificates are not verified, and 5xx counts as down.
+    """
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection(ip, port, ssl=_INSECURE_TLS if tls else None)
+    try:
+        writer.write(
+            f"GET {path} HTTP/1.0\r\nHost: {ip}\r\nUser-Agent: netmon-probe\r\n"
+            f"Connection: close\r\n\r\n".encode()
+        )
+        line = await reader.readline()
+        elapsed = time.perf_counter() - started
+    finally:
+        writer.close()
+    status = int(line.split()[1])
+    if status >= 500:
+        raise ValueError(f"HTTP {status}")
+    return elapsed
+
+
+def _checksum(packet: bytes) -> int:
+    if len(packet) % 2:
+        packet += b"\0"
+    total = sum(struct.unpack(f"!{len(packet) // 2}H", packet))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+async def icmp_probe(ip: str, sequence: int = 1) -> float:
+    """
+    Echo round trip over an unprivileged ICMP datagram socket.
+
+    Needs the process group inside net.ipv4.ping_group_range; the kernel
+    picks the identifier and routes replies back to this socket only.
+    """
+    v6 = ":" in ip
+    family, proto = (socket.AF_INET6, socket.IPPROTO_ICMPV6) if v6 else (socket.AF_INET, socket.IPPROTO_ICMP)
+    request, reply = (128, 129) if v6 else (8, 0)
+    sock = socket.socket(family, socket.SOCK_DGRAM, proto)
+    try:
+        sock.setblocking(False)
+        header = struct.pack("!BBHHH", request, 0, 0, 0, sequence & 0xFFFF)
+        payload = b"netmon-probe"
+        packet = header + payload
+        if not v6:
+            packet = struct.pack("!BBHHH", request, 0, _checksum(packet), 0, sequence & 0xFFFF) + payload
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        sock.sendto(packet, (ip, 0))
+        while True:
+            data = await loop.sock_recv(sock, 1024)
+            if data and data[0] == reply:
+                return time.perf_counter() - started
+    finally:
+        sock.close()
+
+
+class ProbeScheduler:
+    """
+    Probes every host once per interval from one event loop.
+
+    Each host starts at a stable offset inside the interval, at most
+    `concurrency` probes run at once, and every probe has a timeout.
+    Results are collected in memory; `flush()` writes them as metrics and
+    applies host status changes in one transaction.
+    """
+
+    def __init__(self, interval: float, concurrency: int, timeout: float):
+        self.interval = interval
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._max_pending = concurrency * 4
+        self._pending: set = set()
+        self._points: List[MetricCreate] = []
+        self._status: Dict[int, str] = {}
+        self._changed: Dict[int, str] = {}
+        self._icmp_available = True
+        self._sequence = 0
+        self.probes = 0
+        self.failures = 0
+        self.skipped = 0
+
+    async def _run_probe(self, ip: str, spec: ProbeSpec) -> Optional[float]:
+        if spec.kind == "icmp":
+            if not self._icmp_available:
+                return None
+            self._sequence += 1
+            coro = icmp_probe(ip, self._sequence)
+        elif spec.kind == "tcp":
+            coro = tcp_probe(ip, spec.port)
+        else:
+            coro = http_probe(ip, spec.port, spec.path, tls=spec.kind == "https")
+        try:
+            return await asyncio.wait_for(coro, self.timeout)
+        except PermissionError:
+            if spec.kind == "icmp":
+                self._icmp_available = False
+                logger.warning("Unprivileged ICMP sockets are not permitted; ICMP probes disabled")
+                return None
+            raise
+
+    async def probe_host(self, host_id: int, ip: str, specs: List[ProbeSpec]) -> None:
+        """Run a host's probes concurrently and record the results"""
+        async with self._semaphore:
+            results = await asyncio.gather(
+                *(self._run_probe(ip, spec) for spec in specs), return_exceptions=True
+            )
+        now = datetime.utcnow()
+        ran = up = False
+        for spec, result in zip(specs, results):
+            if result is None:
+                continue
+            ran = True
+            self.probes += 1
+            ok = not isinstance(result, BaseException)
+            if ok:
+                up = True
+                self._points.append(MetricCreate.model_construct(
+                    host_id=host_id, key=f"{spec.name}.latency_ms", value=result * 1000.0, timestamp=now
+                ))
+            else:
+                self.failures += 1
+            self._points.append(MetricCreate.model_construct(
+                host_id=host_id, key=f"{spec.name}.up", value=1.0 if ok else 0.0, timestamp=now
+            ))
+        if not ran:
+            return
+        status = "online" if up else "offline"
+        if self._status.get(host_id) != status:
+            self._status[host_id] = status
+            self._changed[host_id] = status
+
+    def _launch(self, host_id: int, ip: str, specs: List[ProbeSpec]) -> None:
+        if len(self._pending) >= self._max_pending:
+            # Probes are falling behind; skip rather than queue without bound
+            self.skipped += 1
+            return
+        task = asyncio.create_task(self.probe_host(host_id, ip, specs))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def run_cycle(self, hosts: List[Tuple[int, str, List[str], str]], spread: bool = True) -> None:
+        """Start one probe round over (id, ip, tags, status) rows"""
+        for host_id, _, _, status in hosts:
+            self._status.setdefault(host_id, status)
+        schedule = sorted(
+            (start_offset(host_id, self.interval) if spread else 0.0, host_id, ip, host_probes(tags))
+            for host_id, ip, tags, _ in hosts
+        )
+        started = time.monotonic()
+        for offset, host_id, ip, specs in schedule:
+            delay = started + offset - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._launch(host_id, ip, specs)
+
+    async def drain(self) -> None:
+        """Wait for probes that are still running"""
+        if self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    async def flush(self) -> None:
+        """Write collected results and status changes"""
+        points, self._points = self._points, []
+        changed, self._changed = self._changed, {}
+        if not points and not changed:
+            return
+        try:
+            rows = await asyncio.to_thread(_write_results, points, changed)
+        except Exception:
+            logger.exception("Writing probe results failed")
+            # Retry the status changes next time; samples are dropped
+            for host_id, status in changed.items():
+                self._changed.setdefault(host_id, status)
+            return
+        await latest_values.record(rows)
+
+    async def run(self) -> None:
+        """Probe forever, flushing every PROBE_FLUSH_SECONDS"""
+        flusher = asyncio.create_task(self._flush_loop())
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    hosts = await asyncio.to_thread(_load_hosts)
+                    await self.run_cycle(hosts)
+                except Exception:
+                    logger.exception("Probe cycle failed")
+                await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+        finally:
+            flusher.cancel()
+            await self.drain()
+            await self.flush()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.PROBE_FLUSH_SECONDS)
+            await self.flush()
+
+
+def _load_hosts() -> List[Tuple[int, str, List[str], str]]:
+    db = SessionLocal()
+    try:
+        rows = db.execute(select(Host.id, Host.ip_address, Host.tags, Host.status).where(Host.deleted_at.is_(None)))
+        return [(row.id, row.ip_address, row.tags, row.status) for row in rows if row.ip_address]
+    finally:
+        db.close()
+
+
+def _write_results(points: List[MetricCreate], changed: Dict[int, str]) -> List[dict]:
+    db = SessionLocal()
+    try:
+        # Hosts deleted since the round started are skipped
+        wanted = {p.host_id for p in points} | set(changed)
+        existing = set()
+        ids = sorted(wanted)
+        for i in range(0, len(ids), _IN_CHUNK):
+            existing.update(db.execute(
+                select(Host.id).where(Host.id.in_(ids[i:i + _IN_CHUNK]), Host.deleted_at.is_(None))
+            ).scalars())
+        rows = write_metrics(db, [p for p in points if p.host_id in existing])
+
+        by_status: Dict[str, List[int]] = {}
+        for host_id, status in changed.items():
+            if host_id in existing:
+                by_status.setdefault(status, []).append(host_id)
+        for status, host_ids in by_status.items():
+            for i in range(0, len(host_ids), _IN_CHUNK):
+                db.execute(
+                    update(Host).where(Host.id.in_(host_ids[i:i + _IN_CHUNK])).values(status=status)
+                )
+        db.commit()
+        return rows
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def probe_loop() -> None:
+    scheduler = ProbeScheduler(
+        interval=settings.PROBE_INTERVAL_SECONDS,
+        concurrency=settings.PROBE_CONCURRENCY,
+        timeout=settings.PROBE_TIMEOUT_SECONDS,
+    )
+    await scheduler.run()
@@ -0,0 +1,233 @@
+"""
+Prometheus text-format and remote_write ingestion
+"""
+import math
+import struct
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from api.core.compression import read_varint
+from api.core.config import settings
+from api.db.database import dialect_insert
+from api.db.models import Host
+from api.schemas import MetricCreate
+from api.services.ingest import write_metrics
+
+# (metric name, labels, value, timestamp in ms or None)
+Sample = Tuple[str, Dict[str, str], float, Optional[int]]
+
+_DOUBLE = struct.Struct("<d")
+
+
+# Protobuf (prometheus.WriteRequest) decoding
+
+def _fields(data: bytes, pos: int, end: int):
+    """Yield (field number, value) of one protobuf message; LEN fields yield (start, end)"""
+    while pos < end:
+        key, pos = read_varint(data, pos)
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = read_varint(data, pos)
+        elif wire == 1:
+            value = data[pos:pos + 8]
+            pos += 8
+        elif wire == 2:
+            size, pos = read_varint(data, pos)
+            value = (pos, pos + size)
+            pos += size
+        elif wire == 5:
+            value = data[pos:pos + 4]
+            pos += 4
+        else:
+            raise ValueError(f"unsupported wire type {wire}")
+        if pos > end:
+            raise ValueError("field runs past message")
+        yield field, value
+
+
+def parse_write_request(data: bytes) -> List[Sample]:
+    """
+    Samples of a remote_write WriteRequest.
+
+    Only labels and float samples are read; metadata, exemplars and native
+    histograms are skipped.
+    """
+    samples: List[Sample] = []
+    for field, span in _fields(data, 0, len(data)):
+        if field != 1:
+            continue
+        labels: Dict[str, str] = {}
+        points = []
+        for ts_field, ts_span in _fields(data, *span):
+            if ts_field == 1:
+                label = {}
+                for label_field, (start, stop) in _fields(data, *ts_span):
+                    label[label_field] = data[start:stop].decode()
+                labels[label.get(1, "")] = label.get(2, "")
+            elif ts_field == 2:
+                value, timestamp = 0.0, 0
+                for sample_field, raw in _fields(data, *ts_span):
+                    if sample_field == 1:
+                        value = _DOUBLE.unpack(raw)[0]
+                    elif sample_field == 2:
+                        # int64 is encoded as two's complement
+                        timestamp = raw - (1 << 64) if raw >= 1 << 63 else raw
+                points.append((value, timestamp))
+        name = labels.pop("__name__", "")
+        for value, timestamp in points:
+            samples.append((name, labels, value, timestamp))
+    return samples
+
+
+# Text exposition format parsing
+
+def _parse_labels(line: str, pos: int) -> Tuple[Dict[str, str], int]:
+    labels: Dict[str, str] = {}
+    while True:
+        while line[pos] in " ,":
+            pos += 1
+        if line[pos] == "}":
+            return labels, pos + 1
+        eq = line.index("=", pos)
+        name = line[pos:eq].strip()
+        pos = line.index('"', eq) + 1
+        value = []
+        while line[pos] != '"':
+            if line[pos] == "\\":
+                pos += 1
+                value.append("\n" if line[pos] == "n" else line[pos])
+            else:
+                value.append(line[pos])
+            pos += 1
+        labels[name] = "".join(value)
+        pos += 1
+
+
+def parse_text(body: str) -> List[Sample]:
+    """Samples of a Prometheus text exposition; comments and blank lines are skipped"""
+    samples: List[Sample] = []
+    for number, raw in enumerate(body.splitlines(), 1):
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            brace = line.find("{")
+            space = line.find(" ")
+            if brace != -1 and (space == -1 or brace < space):
+                name = line[:brace]
+                labels, pos = _parse_labels(line, brace + 1)
+                rest = line[pos:].split()
+            else:
+                name, *rest = line.split()
+                labels = {}
+            value = float(rest[0])
+            timestamp = int(rest[1]) if len(rest) > 1 else None
+        except (ValueError, IndexError):
+            raise ValueError(f"line {number}: cannot parse {raw[:80]!r}")
+        samples.append((name, labels, value, timestamp))
+    return samples
+
+
+# Mapping onto hosts and items
+
+def series_key(name: str, labels: Dict[str, str]) -> str:
+    """Item key for a series: the metric name plus its remaining labels, sorted"""
+    if not labels:
+        return name
+    inner = ",".join(f'{k}="{labels[k]}"' for k in sorted(labels))
+    return f"{name}{{{inner}}}"
+
+
+def host_name(instance: str) -> str:
+    """Host part of an instance label such as `node1:9100` or `[::1]:9100`"""
+    if not settings.PROMETHEUS_STRIP_PORT:
+        return instance
+    if instance.startswith("["):
+        return instance[1:instance.find("]")] if "]" in instance else instance
+    head, sep, port = instance.rpartition(":")
+    return head if sep and port.isdigit() and ":" not in head else instance
+
+
+def map_samples(samples: Iterable[Sample], default_host: Optional[str] = None):
+    """
+    (host name, item key, value, timestamp) for each usable sample.
+
+    The host comes from PROMETHEUS_HOST_LABEL, else default_host. Labels in
+    PROMETHEUS_DROP_LABELS are not part of the key. Non-finite values and
+    series without a host are skipped and counted.
+    """
+    host_label = settings.PROMETHEUS_HOST_LABEL
+    dropped = set(settings.PROMETHEUS_DROP_LABELS) | {host_label}
+    now = datetime.utcnow()
+    mapped = []
+    skipped = 0
+    for name, labels, value, timestamp in samples:
+        instance = labels.get(host_label)
+        host = host_name(instance) if instance else default_host
+        if not host or not name or not math.isfinite(value):
+            skipped += 1
+            continue
+        key = series_key(name, {k: v for k, v in labels.items() if k not in dropped})
+        ts = datetime.utcfromtimestamp(timestamp / 1000) if timestamp is not None else now
+        mapped.append((host, key, value, ts))
+    return mapped, skipped
+
+
+def resolve_hosts(db: Session, user_id: int, names: Set[str]) -> Tuple[Dict[str, int], Set[str]]:
+    """
+    Host ids for names, creating hosts the user does not have yet.
+
+    Returns the owned ids and the names registered to another user.
+    """
+    if not names:
+        return {}, set()
+    now = datetime.utcnow()
+    db.execute(
+        dialect_insert(db, Host).on_conflict_do_nothing(
+            index_elements=[Host.name], index_where=Host.deleted_at.is_(None)
+        ),
+        [
+            {
+                "name": name,
+                "ip_address": name,
+                "tags": ["prometheus"],
+                "user_id": user_id,
+                "status": "online",
+                "created_at": now,
+                "updated_at": now,
+            }
+            for name in sorted(names)
+        ],
+    )
+    owned: Dict[str, int] = {}
+    foreign: Set[str] = set()
+    rows = db.execute(select(Host.id, Host.name, Host.user_id).where(Host.name.in_(names), Host.deleted_at.is_(None)))
+    for row in rows:
+        if row.user_id == user_id:
+            owned[row.name] = row.id
+        else:
+            foreign.add(row.name)
+    return owned, foreign
+
+
+def ingest_samples(db: Session, user_id: int, samples: List[Sample], default_host: Optional[str] = None) -> dict:
+    """
+    Write samples in the caller's transaction with one multi-row INSERT.
+
+    Returns accepted/rejected counts and the written rows.
+    """
+    mapped, skipped = map_samples(samples, default_host)
+    host_ids, foreign = resolve_hosts(db, user_id, {m[0] for m in mapped})
+    points = [
+        MetricCreate.model_construct(host_id=host_ids[host], key=key, value=value, timestamp=ts)
+        for host, key, value, ts in mapped
+        if host in host_ids
+    ]
+    rows = write_metrics(db, points)
+    return {
+        "accepted": len(rows),
+        "rejected": skipped + len(mapped) - len(points),
+        "foreign_hosts": sorted(foreign),
+        "rows": rows,
+    }
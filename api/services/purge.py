@@ -0,0 +1,216 @@
+"""
+Host deletion: soft delete now, chunked purge in the background
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, delete, func, select, update
+from sqlalchemy.orm import Session
+from api.core.config import settings
+from api.db.database import SessionLocal
+from api.db.models import (
+    Alert, ApiKey, Host, Item, Metric, MetricRollup1h, MetricRollup1m, PurgeJob, Trigger,
+)
+from api.services.events import event_broker, hosts_deleted_event, queue_event
+from api.services.items import item_registry
+from api.services.latest import latest_values
+from api.services.retention import delete_chunked
+
+logger = logging.getLogger(__name__)
+
+
+def delete_hosts(db: Session, user_id: int, host_ids: Iterable[int]) -> Optional[PurgeJob]:
+    """
+    Soft-delete the caller's live hosts among host_ids and queue their purge.
+
+    Deleted hosts disappear from every query at once. Their triggers are
+    disabled so every worker's trigger engine drops them on its next
+    refresh, and on commit a hosts_deleted event has every worker drop
+    its cached items and latest values. Returns None when none of the
+    hosts could be deleted; the caller owns the transaction.
+    """
+    now = datetime.utcnow()
+    deleted = sorted(db.execute(
+        update(Host)
+        .where(Host.id.in_(set(host_ids)), Host.user_id == user_id, Host.deleted_at.is_(None))
+        .values(deleted_at=now, updated_at=now)
+        .returning(Host.id)
+    ).scalars())
+    if not deleted:
+        return None
+    db.execute(
+        update(Trigger)
+        .where(Trigger.host_id.in_(deleted), Trigger.enabled.is_(True))
+        .values(enabled=False, updated_at=now)
+    )
+    job = PurgeJob(
+        user_id=user_id, host_ids=deleted, status="pending", deleted={},
+        created_at=now, updated_at=now,
+    )
+    db.add(job)
+    db.flush()
+    queue_event(db, hosts_deleted_event(deleted))
+    return job
+
+
+def _forget_hosts(event: dict) -> None:
+    # Every worker, including the deleting one; shared Redis values are
+    # deleted by the deleting worker
+    for host_id in event["host_ids"]:
+        item_registry.forget_host(host_id)
+        latest_values.forget_local(host_id)
+
+
+event_broker.on("hosts_deleted", _forget_hosts)
+
+
+def purge_steps(host_id: int) -> List[Tuple[object, object]]:
+    """(model, condition) pairs for the bulky rows of a host, children first"""
+    items = select(Item.id).where(Item.host_id == host_id)
+    return [
+        (Metric, Metric.item_id.in_(items)),
+        (MetricRollup1m, MetricRollup1m.item_id.in_(items)),
+        (MetricRollup1h, MetricRollup1h.item_id.in_(items)),
+        (Alert, Alert.host_id == host_id),
+        (Trigger, Trigger.host_id == host_id),
+        (Item, Item.host_id == host_id),
+    ]
+
+
+def _claimable(now: datetime):
+    """
+    Pending jobs untouched for the start delay, which is also the wait
+    before a failed job is retried, then running jobs that stopped moving
+    """
+    ready = now - timedelta(seconds=settings.PURGE_DELAY_SECONDS)
+    stale = now - timedelta(seconds=settings.PURGE_STALE_SECONDS)
+    return (
+        and_(PurgeJob.status == "pending", PurgeJob.updated_at <= ready),
+        and_(PurgeJob.status == "running", PurgeJob.updated_at < stale),
+    )
+
+
+def claim_job() -> Optional[int]:
+    """
+    Mark the oldest claimable job running; returns its id.
+
+    The UPDATE repeats the selecting condition, so when several workers
+    race for a job exactly one of them gets it.
+    """
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        for condition in _claimable(now):
+            job_id = db.execute(
+                select(PurgeJob.id).where(condition).order_by(PurgeJob.id).limit(1)
+            ).scalar()
+            if job_id is None:
+                continue
+            claimed = db.execute(
+                update(PurgeJob).where(PurgeJob.id == job_id, condition).values(
+                    status="running",
+                    started_at=func.coalesce(PurgeJob.started_at, now),
+                    updated_at=now,
+                    attempts=PurgeJob.attempts + 1,
+                )
+            )
+            db.commit()
+            if claimed.rowcount:
+                return job_id
+        return None
+    finally:
+        db.close()
+
+
+def _finish(job_id: int, **values) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(update(PurgeJob).where(PurgeJob.id == job_id).values(updated_at=datetime.utcnow(), **values))
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_job(job_id: int) -> bool:
+    """
+    Delete everything of the job's hosts, chunk by chunk; True when done.
+
+    Progress is written in each chunk's own transaction, so it is exact
+    even if the worker dies. Every step is idempotent: a job taken over or
+    retried continues where the last committed chunk left off.
+    """
+    db = SessionLocal()
+    try:
+        job = db.get(PurgeJob, job_id)
+        attempts = job.attempts
+        deleted: Dict[str, int] = dict(job.deleted or {})
+        # Never a live host, whatever the job says
+        host_ids = db.execute(
+            select(Host.id).where(Host.id.in_(job.host_ids), Host.deleted_at.isnot(None)).order_by(Host.id)
+        ).scalars().all()
+    finally:
+        db.close()
+
+    def progress(table: str):
+        def record(chunk_db: Session, count: int) -> None:
+            deleted[table] = deleted.get(table, 0) + count
+            chunk_db.execute(
+                update(PurgeJob).where(PurgeJob.id == job_id).values(
+                    deleted=dict(deleted), updated_at=datetime.utcnow()
+                )
+            )
+        return record
+
+    try:
+        for host_id in host_ids:
+            for model, condition in purge_steps(host_id):
+                delete_chunked(
+                    model,
+                    condition,
+                    settings.PURGE_CHUNK_SIZE,
+                    settings.PURGE_CHUNK_PAUSE_SECONDS,
+                    progress(model.__tablename__),
+                )
+        # A host row and its few API keys need no chunks
+        db = SessionLocal()
+        try:
+            steps = [(ApiKey, ApiKey.host_id == host_id) for host_id in host_ids]
+            steps.append((Host, Host.id.in_(host_ids)))
+            for model, condition in steps:
+                removed = db.execute(delete(model).where(condition)).rowcount
+                if removed:
+                    progress(model.__tablename__)(db, removed)
+            db.commit()
+        finally:
+            db.close()
+    except Exception as exc:
+        # Retried until it succeeds; the hosts are already gone for users
+        logger.exception("Purge job %d failed (attempt %d)", job_id, attempts)
+        _finish(job_id, status="pending", error=str(exc)[:1000])
+        return False
+
+    _finish(job_id, status="done", error=None, finished_at=datetime.utcnow())
+    logger.info("Purge job %d deleted %s", job_id, deleted)
+    return True
+
+
+def run_purge_jobs() -> int:
+    """Run claimable jobs until none is left; returns how many finished"""
+    finished = 0
+    while True:
+        job_id = claim_job()
+        # A failed job is retried on the next poll, not in a tight loop
+        if job_id is None or not run_job(job_id):
+            return finished
+        finished += 1
+
+
+async def purge_loop() -> None:
+    """Pick up purge jobs in a worker thread; jobs are claimed, so a second runner is harmless"""
+    while True:
+        try:
+            await asyncio.to_thread(run_purge_jobs)
+        except Exception:
+            logger.exception("Purge run failed")
+        await asyncio.sleep(settings.PURGE_POLL_SECONDS)
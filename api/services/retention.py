@@ -0,0 +1,110 @@
+"""
+Metric retention
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.orm import Session
+from api.core.config import settings
+from api.db.database import SessionLocal
+from api.db.models import Metric, MetricRollup1m, MetricRollup1h
+from api.services.partitions import expire_partitions, partition_bounds, partitioning_active
+
+logger = logging.getLogger(__name__)
+
+
+def delete_chunked(
+    model,
+    condition,
+    chunk_size: int,
+    pause: float = 0.0,
+    on_chunk: Optional[Callable[[Session, int], None]] = None,
+) -> int:
+    """
+    Delete rows matching condition in chunks of at most chunk_size rows.
+
+    Each chunk is its own short transaction, so locks and WAL stay bounded
+    no matter how many rows match. on_chunk runs inside each chunk's
+    transaction with the rows it deleted, e.g. to record progress.
+    """
+    pk = tuple_(*model.__table__.primary_key.columns)
+    deleted = 0
+    while True:
+        db = SessionLocal()
+        try:
+            victims = select(*model.__table__.primary_key.columns).where(condition).limit(chunk_size)
+            result = db.execute(delete(model).where(pk.in_(victims)))
+            if on_chunk is not None and result.rowcount:
+                on_chunk(db, result.rowcount)
+            db.commit()
+        finally:
+            db.close()
+        deleted += result.rowcount
+        if result.rowcount < chunk_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def purge_chunked(model, time_column, cutoff: datetime, chunk_size: int, pause: float = 0.0) -> int:
+    """Delete rows older than cutoff in chunks of at most chunk_size rows"""
+    return delete_chunked(model, time_column < cutoff, chunk_size, pause)
+
+
+def expire_metric_partitions(cutoff: datetime) -> datetime:
+    """
+    Drop whole expired partitions when metrics is partitioned.
+
+    Returns the cutoff left for row deletes: the start of the partition
+    holding cutoff, so only stray rows in the default partition are
+    deleted one by one.
+    """
+    db = SessionLocal()
+    try:
+        if not partitioning_active(db):
+            return cutoff
+        expired = expire_partitions(db, cutoff)
+        if expired:
+            logger.info("Expired metrics partitions %s", expired)
+    finally:
+        db.close()
+    return partition_bounds(cutoff, settings.METRICS_PARTITIONING)[0]
+
+
+def run_retention() -> dict:
+    """Apply every retention policy once"""
+    now = datetime.utcnow()
+    policies = (
+        (Metric, Metric.timestamp, settings.METRICS_RAW_RETENTION_DAYS),
+        (MetricRollup1m, MetricRollup1m.bucket, settings.METRICS_1M_RETENTION_DAYS),
+        (MetricRollup1h, MetricRollup1h.bucket, settings.METRICS_1H_RETENTION_DAYS),
+    )
+    results = {}
+    for model, column, days in policies:
+        if days <= 0:
+            continue
+        cutoff = now - timedelta(days=days)
+        if model is Metric:
+            cutoff = expire_metric_partitions(cutoff)
+        results[model.__tablename__] = purge_chunked(
+            model,
+            column,
+            cutoff,
+            settings.RETENTION_CHUNK_SIZE,
+            settings.RETENTION_CHUNK_PAUSE_SECONDS,
+        )
+    return results
+
+
+async def retention_loop() -> None:
+    """Run retention periodically in a worker thread"""
+    while True:
+        try:
+            results = await asyncio.to_thread(run_retention)
+            logger.info("Retention purged %s", results)
+        except Exception:
+            logger.exception("Retention run failed")
+        await asyncio.sleep(settings.RETENTION_INTERVAL_SECONDS)
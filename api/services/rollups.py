@@ -0,0 +1,143 @@
+"""
+Continuous metric rollups
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+from sqlalchemy.orm import Session
+from api.db.database import dialect_insert, tuple_in
+from api.db.models import MetricRollup1m, MetricRollup1h
+from api.services.sketch import QuantileSketch
+
+# Bound on the number of row-value tuples per IN (...) clause
+_IN_CHUNK = 500
+
+
+def _minute(ts: datetime) -> datetime:
+    return ts.replace(second=0, microsecond=0)
+
+
+def _hour(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+# (model, bucket width, truncation) from finest to coarsest
+ROLLUPS = (
+    (MetricRollup1m, timedelta(minutes=1), _minute),
+    (MetricRollup1h, timedelta(hours=1), _hour),
+)
+
+
+class _Partial:
+    __slots__ = ("count", "sum", "min", "max", "sketch")
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch()
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.sketch.add(value)
+
+
+def update_rollups(db: Session, rows: List[dict]) -> None:
+    """
+    Fold freshly inserted metric rows into every rollup table.
+
+    Rows are pre-aggregated in memory per (item_id, bucket), so a batch
+    touches each rollup row once. Missing rows are created first and then
+    locked, which keeps concurrent writers from losing each other's counts.
+    """
+    for model, _, truncate in ROLLUPS:
+        partials: Dict[Tuple[int, datetime], _Partial] = {}
+        for row in rows:
+            bucket_key = (row["item_id"], truncate(row["timestamp"]))
+            partial = partials.get(bucket_key)
+            if partial is None:
+                partial = partials[bucket_key] = _Partial()
+            partial.add(row["value"])
+        _merge(db, model, partials)
+
+
+def _merge(db: Session, model, partials: Dict[Tuple[int, datetime], _Partial]) -> None:
+    keys = sorted(partials)
+    db.execute(
+        dialect_insert(db, model).on_conflict_do_nothing(),
+        [
+            {"item_id": item_id, "bucket": bucket, "count": 0, "sum": 0.0}
+            for item_id, bucket in keys
+        ],
+    )
+
+    for i in range(0, len(keys), _IN_CHUNK):
+        chunk = keys[i:i + _IN_CHUNK]
+        existing = db.query(model).filter(
+            tuple_in(db, (model.item_id, model.bucket), chunk)
+        ).with_for_update().all()
+        for rollup in existing:
+            partial = partials[(rollup.item_id, rollup.bucket)]
+            rollup.count = (rollup.count or 0) + partial.count
+            rollup.sum = (rollup.sum or 0.0) + partial.sum
+            rollup.min = partial.min if rollup.min is None else min(rollup.min, partial.min)
+            rollup.max = partial.max if rollup.max is None else max(rollup.max, partial.max)
+            rollup.sketch = QuantileSketch.from_dict(rollup.sketch).merge(partial.sketch).to_dict()
+    db.flush()
+
+
+def pick_rollup(start: datetime, end: datetime, max_points: int):
+    """
+    Coarsest-needed source for a range: None for raw rows, else a rollup model.
+
+    A rollup is used once each requested point would cover at least one of
+    its buckets, so long ranges never scan raw rows.
+    """
+    step = (end - start) / max_points
+    chosen = None
+    for model, width, _ in ROLLUPS:
+        if step >= width:
+            chosen = model
+    return chosen
+
+
+def summarize(db: Session, item_id: int, start: datetime, end: datetime) -> dict:
+    """
+    Merge the rollup buckets of a range into count/min/max/avg/quantiles.
+
+    Ranges longer than two days read hourly buckets, shorter ones minute
+    buckets; start is aligned down to the bucket width.
+    """
+    if end - start > timedelta(days=2):
+        model, start = MetricRollup1h, _hour(start)
+    else:
+        model, start = MetricRollup1m, _minute(start)
+
+    rows = db.query(model).filter(
+        model.item_id == item_id,
+        model.bucket >= start,
+        model.bucket < end,
+    ).all()
+
+    count = sum(r.count for r in rows)
+    total = sum(r.sum for r in rows)
+    sketch = QuantileSketch()
+    for row in rows:
+        sketch.merge(QuantileSketch.from_dict(row.sketch))
+
+    mins = [r.min for r in rows if r.min is not None]
+    maxs = [r.max for r in rows if r.max is not None]
+    return {
+        "source": model.__tablename__,
+        "start": start,
+        "count": count,
+        "min": min(mins) if mins else None,
+        "max": max(maxs) if maxs else None,
+        "avg": total / count if count else None,
+        "p50": sketch.quantile(0.50),
+        "p95": sketch.quantile(0.95),
+        "p99": sketch.quantile(0.99),
+    }
@@ -0,0 +1,112 @@
+"""
+Mergeable quantile sketch
+"""
+import math
+from typing import Dict, Iterable, Optional
+
+# Relative accuracy of quantile estimates
+RELATIVE_ACCURACY = 0.01
+# Bins kept per sign before the lowest ones are collapsed together
+MAX_BINS = 1024
+# Magnitudes below this are counted as zero
+MIN_VALUE = 1e-9
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+
+class QuantileSketch:
+    """
+    DDSketch-style log-bucketed histogram.
+
+    Each value falls into bin ceil(log_gamma(|v|)), so every quantile
+    estimate is within RELATIVE_ACCURACY of the true value. Two sketches
+    merge by adding their bin counts, which makes the sketch safe to keep
+    per rollup bucket and combine across buckets at query time.
+    """
+
+    __slots__ = ("positive", "negative", "zero")
+
+    def __init__(self):
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero = 0
+
+    @property
+    def count(self) -> int:
+        return self.zero + sum(self.positive.values()) + sum(self.negative.values())
+
+    def add(self, value: float) -> None:
+        magnitude = abs(value)
+        if magnitude < MIN_VALUE:
+            self.zero += 1
+            return
+        bins = self.positive if value > 0 else self.negative
+        index = math.ceil(math.log(magnitude) / _LOG_GAMMA)
+        bins[index] = bins.get(index, 0) + 1
+        if len(bins) > MAX_BINS:
+            _collapse(bins)
+
+    def update(self, values: Iterable[float]) -> "QuantileSketch":
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        self.zero += other.zero
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in theirs.items():
+                mine[index] = mine.get(index, 0) + count
+            if len(mine) > MAX_BINS:
+                _collapse(mine)
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+
+        seen = 0
+        # Most negative values first: the largest negative bins
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -_bin_value(index)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return _bin_value(index)
+        return _bin_value(max(self.positive)) if self.positive else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "p": {str(k): v for k, v in self.positive.items()},
+            "n": {str(k): v for k, v in self.negative.items()},
+            "z": self.zero,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "QuantileSketch":
+        sketch = cls()
+        if data:
+            sketch.positive = {int(k): v for k, v in data.get("p", {}).items()}
+            sketch.negative = {int(k): v for k, v in data.get("n", {}).items()}
+            sketch.zero = data.get("z", 0)
+        return sketch
+
+
+def _bin_value(index: int) -> float:
+    return 2 * _GAMMA ** index / (_GAMMA + 1)
+
+
+def _collapse(bins: Dict[int, int]) -> None:
+    """Fold the smallest-magnitude bins into one so at most MAX_BINS remain"""
+    ordered = sorted(bins)
+    excess = ordered[:len(ordered) - MAX_BINS + 1]
+    target = excess[-1]
+    folded = sum(bins.pop(index) for index in excess)
+    bins[target] = folded
@@ -0,0 +1,424 @@
+"""
+Streaming trigger evaluation
+"""
+import asyncio
+import logging
+import operator
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from api.core.config import settings
+from api.db.database import SessionLocal, on_commit
+from api.db.models import Alert, Trigger
+from api.services.alerts import alert_upsert
+from api.services.events import alert_event, queue_event
+
+logger = logging.getLogger(__name__)
+
+CONDITIONS = {
+    ">": operator.gt,
+    "<": operator.lt,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+class _Rule:
+    __slots__ = ("trigger_id", "host_id", "key", "condition", "check", "threshold",
+                 "duration", "alert_level")
+
+    def __init__(self, trigger: Trigger):
+        self.trigger_id = trigger.id
+        self.host_id = trigger.host_id
+        self.key = trigger.key
+        self.condition = trigger.condition
+        self.check = CONDITIONS[trigger.condition]
+        self.threshold = trigger.threshold
+        self.duration = trigger.duration or 0
+        self.alert_level = trigger.alert_level
+
+    def definition(self) -> tuple:
+        return (self.host_id, self.key, self.condition, self.threshold, self.duration, self.alert_level)
+
+
+class _State:
+    """
+    Per-trigger window state.
+
+    ok -> pending (condition holds, `since` set) -> firing (held for
+    `duration` seconds, `alert_id` set) -> clearing (`cleared_since` set)
+    -> ok once the clear held for ALERT_RESOLVE_SECONDS. Breaching again
+    while clearing returns to firing as another occurrence of the same
+    alert. `changes` holds recent firing/clearing transition times for
+    flap detection; `repeats` are occurrences not written yet.
+    """
+
+    __slots__ = ("since", "alert_id", "last_seen", "cleared_since", "changes", "repeats")
+
+    def __init__(self, alert_id: Optional[int] = None):
+        self.since: Optional[datetime] = None
+        self.alert_id = alert_id
+        self.last_seen: Optional[datetime] = None
+        self.cleared_since: Optional[datetime] = None
+        self.changes: Deque[datetime] = deque(maxlen=max(settings.ALERT_FLAP_CHANGES, 1))
+        self.repeats = 0
+
+    def copy(self) -> "_State":
+        state = _State(self.alert_id)
+        state.since = self.since
+        state.last_seen = self.last_seen
+        state.cleared_since = self.cleared_since
+        state.changes = deque(self.changes, maxlen=self.changes.maxlen)
+        state.repeats = self.repeats
+        return state
+
+    def flapping(self, ts: datetime) -> bool:
+        """ALERT_FLAP_CHANGES transitions within the flap window up to ts"""
+        if settings.ALERT_FLAP_CHANGES <= 0:
+            return False
+        horizon = ts - timedelta(seconds=settings.ALERT_FLAP_WINDOW_SECONDS)
+        changes = self.changes
+        while changes and changes[0] < horizon:
+            changes.popleft()
+        return len(changes) >= settings.ALERT_FLAP_CHANGES
+
+
+class _Staged:
+    """
+    One transaction's view of the engine: working copies of the states it
+    stepped, the version each copy was taken at, index changes, and the
+    newest updated_at a refresh read
+    """
+
+    __slots__ = ("states", "bases", "rules", "watermark")
+
+    def __init__(self):
+        # None drops the trigger's state at commit
+        self.states: Dict[int, Optional[_State]] = {}
+        self.bases: Dict[int, Tuple[int, int]] = {}
+        # None removes the trigger from the index at commit
+        self.rules: Dict[int, Optional[_Rule]] = {}
+        self.watermark: Optional[datetime] = None
+
+
+class TriggerEngine:
+    """
+    In-process trigger evaluator fed by the ingestion path.
+
+    Enabled triggers are indexed by (host_id, key), so each ingested point
+    costs one dict lookup plus the triggers that actually match it. The
+    metrics table is never polled.
+
+    A transaction steps its own copies of the states it touches and writes
+    alerts in its own session; the copies and any index changes replace
+    the shared ones only once it commits, and vanish if it does not.
+    Evaluations of one trigger are serialized by commit: a transaction
+    whose copy is older than the committed state gives it up, and the
+    trigger's state is rebuilt from its open alert. The lock only guards
+    the dicts and is never held across a query, so callers on the event
+    loop never wait for a thread's I/O.
+    """
+
+    def __init__(self):
+        self._index: Dict[Tuple[int, str], Dict[int, _Rule]] = {}
+        self._rules: Dict[int, _Rule] = {}
+        self._states: Dict[int, _State] = {}
+        # Bumped on every committed change of a trigger's state
+        self._versions: Dict[int, int] = {}
+        self._generation = 0
+        # States given up after a conflict, reloaded from the open alert
+        self._stale: Set[int] = set()
+        self._lock = threading.Lock()
+        self._watermark: Optional[datetime] = None
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def load(self, db: Session) -> None:
+        """Build the index from all enabled triggers and their open alerts"""
+        rules, watermark = [], None
+        for trigger in db.query(Trigger).filter(Trigger.enabled.is_(True)).yield_per(1000):
+            if trigger.condition in CONDITIONS:
+                rules.append(_Rule(trigger))
+            if trigger.updated_at and (watermark is None or trigger.updated_at > watermark):
+                watermark = trigger.updated_at
+        open_alerts = db.query(Alert.trigger_id, Alert.id).filter(
+            Alert.trigger_id.isnot(None), Alert.status == "active"
+        ).all()
+        with self._lock:
+            self._generation += 1
+            self._index.clear()
+            self._rules.clear()
+            self._states.clear()
+            self._versions.clear()
+            self._stale.clear()
+            for rule in rules:
+                self._add(rule)
+            for trigger_id, alert_id in open_alerts:
+                if trigger_id in self._rules:
+                    self._states[trigger_id] = _State(alert_id)
+            self._watermark = watermark
+            self.loaded = True
+
+    def ensure_loaded(self, db: Session) -> None:
+        if not self.loaded:
+            self.load(db)
+
+    def refresh(self, db: Session) -> int:
+        """
+        Re-index triggers changed since the last refresh; returns how many
+        were read.
+
+        Only the updated_at values read here move the watermark, never a
+        local upsert, and the last TRIGGER_REFRESH_OVERLAP_SECONDS before it
+        are read again: updated_at comes from the writer's clock, so another
+        worker's edit can commit after a newer one or carry an older time.
+        Reading a trigger again is a no-op unless it changed. Applied when
+        the caller commits.
+        """
+        watermark = self._watermark
+        query = db.query(Trigger)
+        if watermark is not None:
+            overlap = timedelta(seconds=settings.TRIGGER_REFRESH_OVERLAP_SECONDS)
+            query = query.filter(Trigger.updated_at > watermark - overlap)
+        changed = query.all()
+        staged = self._staged(db)
+        for trigger in changed:
+            self.upsert(db, trigger)
+            if trigger.updated_at and (staged.watermark is None or trigger.updated_at > staged.watermark):
+                staged.watermark = trigger.updated_at
+        return len(changed)
+
+    def _add(self, rule: _Rule) -> None:
+        self._rules[rule.trigger_id] = rule
+        self._index.setdefault((rule.host_id, rule.key), {})[rule.trigger_id] = rule
+
+    def _drop(self, trigger_id: int) -> None:
+        rule = self._rules.pop(trigger_id, None)
+        if rule is None:
+            return
+        series = self._index.get((rule.host_id, rule.key))
+        if series is not None:
+            series.pop(trigger_id, None)
+            if not series:
+                del self._index[(rule.host_id, rule.key)]
+
+    def _version(self, trigger_id: int) -> Tuple[int, int]:
+        return self._generation, self._versions.get(trigger_id, 0)
+
+    def _staged(self, db: Session) -> _Staged:
+        return on_commit(db, self, _Staged, self._apply)
+
+    def _working(self, db: Session, staged: _Staged, trigger_ids) -> Dict[int, _State]:
+        """The transaction's copies of these triggers' states, made on first use"""
+        reload = []
+        with self._lock:
+            for trigger_id in trigger_ids:
+                if trigger_id in staged.bases:
+                    continue
+                staged.bases[trigger_id] = self._version(trigger_id)
+                state = self._states.get(trigger_id)
+                if state is not None:
+                    staged.states[trigger_id] = state.copy()
+                elif trigger_id in self._stale:
+                    reload.append(trigger_id)
+                else:
+                    staged.states[trigger_id] = None
+        if reload:
+            open_alerts = dict(db.query(Alert.trigger_id, Alert.id).filter(
+                Alert.trigger_id.in_(reload), Alert.status == "active"
+            ))
+            for trigger_id in reload:
+                staged.states[trigger_id] = _State(open_alerts.get(trigger_id))
+        working = {}
+        for trigger_id in trigger_ids:
+            state = staged.states.get(trigger_id)
+            if state is None:
+                state = staged.states[trigger_id] = _State()
+            working[trigger_id] = state
+        return working
+
+    def _apply(self, staged: _Staged) -> None:
+        """Install a committed transaction's index changes and states"""
+        with self._lock:
+            for trigger_id, rule in staged.rules.items():
+                self._drop(trigger_id)
+                if rule is not None:
+                    self._add(rule)
+            for trigger_id, state in staged.states.items():
+                if staged.bases[trigger_id] != self._version(trigger_id):
+                    # Another transaction committed this trigger meanwhile
+                    self._states.pop(trigger_id, None)
+                    self._stale.add(trigger_id)
+                elif state is None or trigger_id not in self._rules:
+                    self._states.pop(trigger_id, None)
+                    self._stale.discard(trigger_id)
+                else:
+                    self._states[trigger_id] = state
+                    self._stale.discard(trigger_id)
+                self._versions[trigger_id] = self._versions.get(trigger_id, 0) + 1
+            if staged.watermark and (self._watermark is None or staged.watermark > self._watermark):
+                self._watermark = staged.watermark
+
+    def upsert(self, db: Session, trigger: Trigger) -> None:
+        """
+        Apply a created or updated trigger to the index once the caller commits.
+
+        Pending windows restart if the rule changed; an unchanged trigger
+        is left alone. Disabling a trigger resolves its open alert in the
+        caller's session.
+        """
+        staged = self._staged(db)
+        rule = _Rule(trigger) if trigger.enabled and trigger.condition in CONDITIONS else None
+        with self._lock:
+            current = staged.rules[trigger.id] if trigger.id in staged.rules else self._rules.get(trigger.id)
+        if (rule is None and current is None) or (
+            rule is not None and current is not None and rule.definition() == current.definition()
+        ):
+            return
+        state = self._working(db, staged, [trigger.id])[trigger.id]
+        if rule is not None:
+            staged.rules[trigger.id] = rule
+            staged.states[trigger.id] = _State(state.alert_id) if state.alert_id else None
+            return
+        staged.rules[trigger.id] = None
+        staged.states[trigger.id] = None
+        if state.alert_id:
+            self._resolve(db, _Rule(trigger), state.alert_id, datetime.utcnow(), state.repeats)
+
+    def evaluate(self, db: Session, rows: List[dict]) -> None:
+        """Run the matching triggers over freshly ingested metric rows"""
+        index = self._index
+        if not index:
+            return
+        matched = [row for row in rows if (row["host_id"], row["key"]) in index]
+        if not matched:
+            return
+        matched.sort(key=lambda row: row["timestamp"])
+        with self._lock:
+            work = [(row, tuple(index.get((row["host_id"], row["key"]), {}).values())) for row in matched]
+        states = self._working(db, self._staged(db), {rule.trigger_id for _, rules in work for rule in rules})
+        for row, rules in work:
+            for rule in rules:
+                self._step(db, rule, states[rule.trigger_id], row["value"], row["timestamp"])
+
+    def _step(self, db: Session, rule: _Rule, state: _State, value: float, ts: datetime) -> None:
+        if state.last_seen is not None and ts < state.last_seen:
+            # Late point; the window has already moved past it
+            return
+        state.last_seen = ts
+
+        if rule.check(value, rule.threshold):
+            if state.alert_id is not None:
+                if state.cleared_since is not None:
+                    # Breached again before the clear held: same incident
+                    state.cleared_since = None
+                    state.changes.append(ts)
+                    state.repeats += 1
+                    if not state.flapping(ts):
+                        self._bump(db, rule, state, ts)
+                return
+            if state.since is None:
+                state.since = ts
+            if (ts - state.since).total_seconds() >= rule.duration:
+                state.changes.append(ts)
+                state.alert_id = self._open(db, rule, value, ts)
+        else:
+            state.since = None
+            if state.alert_id is None:
+                return
+            if state.cleared_since is None:
+                state.cleared_since = ts
+                state.changes.append(ts)
+            held = (ts - state.cleared_since).total_seconds()
+            # While flapping the alert stays open until the series settles
+            if held >= settings.ALERT_RESOLVE_SECONDS and not state.flapping(ts):
+                self._resolve(db, rule, state.alert_id, ts, state.repeats)
+                state.alert_id = None
+                state.cleared_since = None
+                state.repeats = 0
+
+    def _open(self, db: Session, rule: _Rule, value: float, ts: datetime) -> int:
+        # Bumps the active alert instead if another worker already opened it
+        stmt = alert_upsert(
+            db,
+            host_id=rule.host_id,
+            trigger_id=rule.trigger_id,
+            title=f"{rule.key} {rule.condition} {rule.threshold:g}",
+            message=(
+                f"{rule.key} is {value:g} ({rule.condition} {rule.threshold:g}) "
+                f"for at least {rule.duration}s"
+            ),
+            level=rule.alert_level,
+            ts=ts,
+        )
+        alert_id, occurrences = db.execute(stmt.returning(Alert.id, Alert.occurrences)).one()
+        self._notify(db, "opened" if occurrences == 1 else "updated", rule, alert_id, "active", ts)
+        return alert_id
+
+    def _bump(self, db: Session, rule: _Rule, state: _State, ts: datetime) -> None:
+        db.query(Alert).filter(Alert.id == state.alert_id).update(
+            {Alert.occurrences: Alert.occurrences + state.repeats, Alert.last_seen_at: ts},
+            synchronize_session=False,
+        )
+        state.repeats = 0
+        self._notify(db, "updated", rule, state.alert_id, "active", ts)
+
+    def _resolve(self, db: Session, rule: _Rule, alert_id: int, ts: datetime, repeats: int = 0) -> None:
+        values = {Alert.status: "resolved", Alert.resolved_at: ts}
+        if repeats:
+            values[Alert.occurrences] = Alert.occurrences + repeats
+            values[Alert.last_seen_at] = ts
+        db.query(Alert).filter(Alert.id == alert_id, Alert.status == "active").update(
+            values, synchronize_session=False,
+        )
+        self._notify(db, "resolved", rule, alert_id, "resolved", ts)
+
+    def _notify(self, db: Session, action: str, rule: _Rule, alert_id: int, status: str, ts: datetime) -> None:
+        alert = {
+            "id": alert_id,
+            "host_id": rule.host_id,
+            "trigger_id": rule.trigger_id,
+            "title": f"{rule.key} {rule.condition} {rule.threshold:g}",
+            "level": rule.alert_level,
+            "status": status,
+            "last_seen_at": ts,
+        }
+        if action == "opened":
+            alert["triggered_at"] = ts
+        elif action == "resolved":
+            alert["resolved_at"] = ts
+        queue_event(db, alert_event(action, alert))
+
+
+trigger_engine = TriggerEngine()
+
+
+def _sync_engine() -> None:
+    db = SessionLocal()
+    try:
+        if trigger_engine.loaded:
+            trigger_engine.refresh(db)
+        else:
+            trigger_engine.load(db)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def trigger_refresh_loop() -> None:
+    """
+    Keep this worker's index in step with trigger edits made elsewhere.
+
+    Only rows updated since the last seen updated_at, less the overlap, are
+    read.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(_sync_engine)
+        except Exception:
+            logger.exception("Trigger refresh failed")
+        await asyncio.sleep(settings.TRIGGER_REFRESH_SECONDS)
@@ -0,0 +1,59 @@
+"""
+Shared test fixtures
+"""
+import os
+import uuid
+import pytest
+
+# Metric writes are synchronous in tests unless a test enables the buffer
+os.environ.setdefault("INGEST_BUFFER_ENABLED", "false")
+# Tables straight from the models; migrations have their own tests
+os.environ.setdefault("DB_CREATE_ALL", "true")
+# TestClient runs every request in a new event loop
+os.environ.setdefault("DB_ASYNC_POOL", "false")
+
+from api.core.security import create_access_token, get_password_hash
+from api.db.database import SessionLocal
+from api.db.models import Host, User
+
+
+@pytest.fixture
+def user():
+    """Create a throwaway user"""
+    db = SessionLocal()
+    name = f"user-{uuid.uuid4().hex[:12]}"
+    user = User(
+        username=name,
+        email=f"{name}@example.com",
+        hashed_password=get_password_hash("password123"),
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    db.close()
+    return user
+
+
+@pytest.fixture
+def auth_headers(user):
+    """Bearer headers for the throwaway user"""
+    token = create_access_token(data={"sub": user.username})
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def host(user):
+    """Create a host owned by the throwaway user"""
+    db = SessionLocal()
+    host = Host(
+        name=f"host-{uuid.uuid4().hex[:12]}",
+        ip_address="127.0.0.1",
+        tags=[],
+        user_id=user.id,
+        status="online",
+    )
+    db.add(host)
+    db.commit()
+    db.refresh(host)
+    db.close()
+    return host
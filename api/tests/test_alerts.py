@@ -0,0 +1,40 @@
+"""
+Tests for alerts routes
+"""
+from fastapi.testclient import TestClient
+from api.main import app
+
+client = TestClient(app)
+
+
+def test_repeated_alert_is_deduplicated(auth_headers, host):
+    """Test the same host, title and level bump one active alert"""
+    body = {"host_id": host.id, "title": "Disk full", "message": "98%", "level": "critical"}
+    first = client.post("/api/v1/alerts/", json=body, headers=auth_headers).json()
+    second = client.post("/api/v1/alerts/", json=dict(body, message="99%"), headers=auth_headers).json()
+
+    assert second["id"] == first["id"]
+    assert second["occurrences"] == 2
+    assert second["message"] == "99%"
+    assert second["last_seen_at"] >= first["last_seen_at"]
+
+    other = client.post("/api/v1/alerts/", json=dict(body, level="warning"), headers=auth_headers).json()
+    assert other["id"] != first["id"]
+
+    page = client.get("/api/v1/alerts/", params={"host_id": host.id}, headers=auth_headers).json()
+    assert len(page["items"]) == 2
+
+
+def test_different_manual_alerts_stay_apart(auth_headers, host):
+    """Test manual alerts with different titles on one host and level do not merge"""
+    disk = {"host_id": host.id, "title": "Disk full", "message": "98%", "level": "warning"}
+    backup = {"host_id": host.id, "title": "Backup failed", "message": "exit 1", "level": "warning"}
+    first = client.post("/api/v1/alerts/", json=disk, headers=auth_headers).json()
+    second = client.post("/api/v1/alerts/", json=backup, headers=auth_headers).json()
+
+    assert second["id"] != first["id"]
+    assert (first["title"], second["title"]) == ("Disk full", "Backup failed")
+    assert second["occurrences"] == 1
+
+    page = client.get("/api/v1/alerts/", params={"host_id": host.id}, headers=auth_headers).json()
+    assert sorted(a["title"] for a in page["items"]) == ["Backup failed", "Disk full"]
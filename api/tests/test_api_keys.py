@@ -0,0 +1,106 @@
+"""
+Tests for API key authentication
+"""
+import uuid
+from fastapi.testclient import TestClient
+from api.main import app
+from api.core.security import api_key_cache
+from api.db.database import SessionLocal
+from api.db.models import Host
+
+client = TestClient(app)
+
+
+def _create_key(auth_headers, **body):
+    response = client.post("/api/v1/api-keys/", json={"name": "agent", **body}, headers=auth_headers)
+    assert response.status_code == 201
+    return response.json()
+
+
+def _ingest(key_headers, host_id):
+    return client.post(
+        "/api/v1/metrics/batch",
+        json={"metrics": [{"host_id": host_id, "key": "cpu_usage", "value": 1.0}]},
+        headers=key_headers,
+    )
+
+
+def test_api_key_authenticates_until_revoked(auth_headers, host):
+    """Test a key works, is served from the cache, and stops after revocation"""
+    created = _create_key(auth_headers)
+    assert created["key"].startswith(f"nm_{created['prefix']}_")
+    key_headers = {"Authorization": f"Bearer {created['key']}"}
+
+    assert _ingest(key_headers, host.id).status_code == 200
+    hits = api_key_cache.hits
+    assert _ingest(key_headers, host.id).status_code == 200
+    assert api_key_cache.hits == hits + 1
+
+    listed = client.get("/api/v1/api-keys/", headers=auth_headers).json()
+    assert [k["prefix"] for k in listed] == [created["prefix"]]
+    assert "key" not in listed[0]
+
+    assert client.delete(f"/api/v1/api-keys/{created['id']}", headers=auth_headers).status_code == 204
+    assert _ingest(key_headers, host.id).status_code == 401
+
+
+def test_wrong_secret_is_rejected(auth_headers, host):
+    """Test a known prefix with a different secret does not authenticate"""
+    created = _create_key(auth_headers)
+    forged = f"nm_{created['prefix']}_{'x' * 43}"
+    assert _ingest({"Authorization": f"Bearer {forged}"}, host.id).status_code == 401
+
+
+def test_host_scoped_key(auth_headers, host):
+    """Test a host-scoped key may only ingest for its host"""
+    created = _create_key(auth_headers, host_id=host.id)
+    key_headers = {"Authorization": f"Bearer {created['key']}"}
+
+    assert _ingest(key_headers, host.id).status_code == 200
+    assert _ingest(key_headers, host.id + 1).status_code == 403
+
+
+def test_api_key_cannot_manage(auth_headers, user, host):
+    """Test a key cannot mint keys, delete hosts or reach other management routes"""
+    db = SessionLocal()
+    other = Host(name=f"host-{uuid.uuid4().hex[:12]}", ip_address="127.0.0.2", tags=[], user_id=user.id)
+    db.add(other)
+    db.commit()
+    other_id = other.id
+    db.close()
+
+    for created in (_create_key(auth_headers), _create_key(auth_headers, host_id=host.id)):
+        key_headers = {"Authorization": f"Bearer {created['key']}"}
+        minted = client.post("/api/v1/api-keys/", json={"name": "escalated"}, headers=key_headers)
+        assert minted.status_code == 403
+        assert client.get("/api/v1/api-keys/", headers=key_headers).status_code == 403
+        assert client.delete(f"/api/v1/api-keys/{created['id']}", headers=key_headers).status_code == 403
+        assert client.delete(f"/api/v1/hosts/{other_id}", headers=key_headers).status_code == 403
+        assert client.post(
+            "/api/v1/hosts/bulk-delete", json={"host_ids": [other_id]}, headers=key_headers
+        ).status_code == 403
+        assert client.get("/api/v1/hosts/", headers=key_headers).status_code == 403
+        assert client.get("/api/v1/triggers/", headers=key_headers).status_code == 403
+        assert client.get("/api/v1/alerts/", headers=key_headers).status_code == 403
+        assert client.get("/api/v1/auth/me", headers=key_headers).status_code == 403
+
+    assert len(client.get("/api/v1/api-keys/", headers=auth_headers).json()) == 2
+    assert client.get(f"/api/v1/hosts/{other_id}", headers=auth_headers).status_code == 200
+
+
+def test_host_scoped_key_registers_own_host(auth_headers, host):
+    """Test the agent's registration routes honour the key's host scope"""
+    created = _create_key(auth_headers, host_id=host.id)
+    key_headers = {"Authorization": f"Bearer {created['key']}"}
+    body = {"ip_address": "10.0.0.9", "tags": ["agent"]}
+
+    assert client.get(f"/api/v1/hosts/{host.id}", headers=key_headers).json()["name"] == host.name
+    assert client.get(f"/api/v1/hosts/{host.id + 1}", headers=key_headers).status_code == 403
+    upserted = client.put(f"/api/v1/hosts/by-name/{host.name}", json=body, headers=key_headers)
+    assert upserted.status_code == 200 and upserted.json()["id"] == host.id
+    new_name = f"host-{uuid.uuid4().hex[:12]}"
+    assert client.put(f"/api/v1/hosts/by-name/{new_name}", json=body, headers=key_headers).status_code == 403
+
+    # An unscoped key may register a new host, as a fresh agent does
+    unscoped = {"Authorization": f"Bearer {_create_key(auth_headers)['key']}"}
+    assert client.put(f"/api/v1/hosts/by-name/{new_name}", json=body, headers=unscoped).status_code == 200
@@ -4,7 +4,7 @@ Tests for authentication
 import pytest
 from fastapi.testclient import TestClient
 from api.main import app
-from api.core.security import get_password_hash
+from api.core.security import get_password_hash, principal_cache
 from api.db.models import User
 from api.db.database import SessionLocal
 
@@ -65,3 +65,22 @@ def test_invalid_login(db):
         }
     )
     assert response.status_code == 401
+
+
+def test_principal_cache_hit(auth_headers):
+    """Test repeated requests with one token reuse the cached user"""
+    assert client.get("/api/v1/auth/me", headers=auth_headers).status_code == 200
+    hits = principal_cache.hits
+    assert client.get("/api/v1/auth/me", headers=auth_headers).status_code == 200
+    assert principal_cache.hits == hits + 1
+
+
+def test_principal_cache_invalidated_on_deactivation(db, user, auth_headers):
+    """Test deactivating a user takes effect immediately"""
+    assert client.get("/api/v1/auth/me", headers=auth_headers).status_code == 200
+
+    db_user = db.query(User).filter(User.id == user.id).first()
+    db_user.is_active = False
+    db.commit()
+
+    assert client.get("/api/v1/auth/me", headers=auth_headers).status_code == 401
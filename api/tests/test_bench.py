@@ -0,0 +1,30 @@
+"""
+Tests for benchmark result comparison
+"""
+from api.bench.compare import compare
+from api.bench.run import percentile
+
+
+def _result(pps, p95):
+    stats = {"p50_ms": 1.0, "p95_ms": p95, "p99_ms": p95}
+    return {"ingest": {"points_per_second": pps}, "routes": {"POST /metrics/batch": stats}}
+
+
+def test_percentile_nearest_rank():
+    """Test nearest-rank percentiles"""
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 95) == 0.0
+
+
+def test_compare_flags_regressions():
+    """Test slower p95 and lower throughput beyond the threshold are flagged"""
+    rows = compare(_result(1000, 10.0), _result(850, 12.0), threshold=0.10)
+    regressed = {name for name, _, _, _, flag in rows if flag}
+    assert regressed == {
+        "ingest points/s", "POST /metrics/batch p95_ms", "POST /metrics/batch p99_ms",
+    }
+
+    rows = compare(_result(1000, 10.0), _result(990, 10.5), threshold=0.10)
+    assert not any(row[4] for row in rows)
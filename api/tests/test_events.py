@@ -0,0 +1,154 @@
+"""
+Tests for the live event stream
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+import orjson
+from jose import jwt
+from fastapi.testclient import TestClient
+from api.main import app
+from api.core.config import settings
+from api.core.security import STREAM_TICKET_PURPOSE, create_access_token
+from api.db.database import SessionLocal
+from api.schemas import MetricCreate
+from api.services.events import EventBroker, Subscription, alert_event, event_broker, metric_event
+from api.services.ingest import write_metrics
+
+client = TestClient(app)
+
+
+def _payload(frame):
+    return orjson.loads(frame.split(b"data: ", 1)[1])
+
+
+def test_filters_by_host_key_and_level():
+    """Test each subscriber receives only its hosts, keys and levels"""
+    async def run():
+        broker = EventBroker("redis://unused")
+        cpu = broker.subscribe(Subscription({1, 2}, keys={"cpu_usage"}, types={"metrics"}))
+        host2 = broker.subscribe(Subscription({2}))
+        critical = broker.subscribe(Subscription({1}, levels={"critical"}, types={"alerts"}))
+
+        now = datetime(2026, 6, 1)
+        broker.publish([
+            metric_event([
+                {"host_id": 1, "key": "cpu_usage", "value": 1.0, "timestamp": now},
+                {"host_id": 1, "key": "memory_usage", "value": 2.0, "timestamp": now},
+                {"host_id": 2, "key": "memory_usage", "value": 3.0, "timestamp": now},
+                {"host_id": 3, "key": "cpu_usage", "value": 4.0, "timestamp": now},
+            ]),
+            alert_event("opened", {"id": 7, "host_id": 1, "level": "warning"}),
+            alert_event("opened", {"id": 8, "host_id": 1, "level": "critical"}),
+        ])
+
+        assert [p["value"] for p in _payload(cpu.queue.get_nowait())["points"]] == [1.0]
+        assert [p["value"] for p in _payload(host2.queue.get_nowait())["points"]] == [3.0]
+        assert _payload(critical.queue.get_nowait())["alert"]["id"] == 8
+        assert cpu.queue.qsize() == critical.queue.qsize() == 0
+        # No type filter: host 2 gets no alerts because both were for host 1
+        assert host2.queue.qsize() == 0
+
+    asyncio.run(run())
+
+
+def test_slow_subscriber_is_dropped():
+    """Test a full queue ends that client's stream without affecting others"""
+    async def run():
+        broker = EventBroker("redis://unused")
+        slow = broker.subscribe(Subscription({1}, maxsize=2))
+        fast = broker.subscribe(Subscription({1}, maxsize=100))
+        for i in range(5):
+            broker.publish([alert_event("updated", {"id": i, "host_id": 1, "level": "info"})])
+            fast.queue.get_nowait()
+
+        assert slow.dropped
+        assert slow.queue.get_nowait() is None
+        assert len(broker) == 1
+        assert broker.dropped == 1
+
+    asyncio.run(run())
+
+
+def test_relayed_events_skip_own_origin():
+    """Test events from other workers are fanned out and our own echoes are not"""
+    async def run():
+        broker = EventBroker("redis://unused")
+        subscription = broker.subscribe(Subscription({1}))
+        events = [alert_event("opened", {"id": 1, "host_id": 1, "level": "info"})]
+        broker._receive(orjson.dumps({"origin": broker._origin, "events": events}))
+        assert subscription.queue.empty()
+        broker._receive(orjson.dumps({"origin": "other-worker", "events": events}))
+        assert _payload(subscription.queue.get_nowait())["alert"]["id"] == 1
+
+    asyncio.run(run())
+
+
+def test_committed_writes_are_published(host):
+    """Test ingestion publishes after commit, from a worker thread"""
+    def write(commit):
+        db = SessionLocal()
+        try:
+            write_metrics(db, [MetricCreate(host_id=host.id, key="cpu_usage", value=42.0)])
+            db.commit() if commit else db.rollback()
+        finally:
+            db.close()
+
+    async def run():
+        subscription = event_broker.subscribe(Subscription({host.id}))
+        try:
+            await asyncio.to_thread(write, False)
+            await asyncio.to_thread(write, True)
+            frame = await asyncio.wait_for(subscription.queue.get(), 1)
+            assert subscription.queue.empty()
+            return _payload(frame)
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    assert [p["value"] for p in asyncio.run(run())["points"]] == [42.0]
+
+
+def _ticket(headers):
+    response = client.post("/api/v1/events/ticket", headers=headers)
+    assert response.status_code == 200
+    return response.json()["ticket"]
+
+
+def test_stream_requires_credentials():
+    """Test the stream rejects anonymous and malformed requests before streaming"""
+    assert client.get("/api/v1/events/stream").status_code == 401
+    assert client.get("/api/v1/events/stream", params={"ticket": "garbage"}).status_code == 401
+    assert client.post("/api/v1/events/ticket").status_code in (401, 403)
+
+
+def test_stream_validates_types(auth_headers):
+    """Test unknown event types are a client error"""
+    response = client.get("/api/v1/events/stream", params={"ticket": _ticket(auth_headers), "types": "logs"})
+    assert response.status_code == 400
+
+
+def test_stream_ticket_is_single_purpose(auth_headers, user):
+    """Test only tickets are accepted in the query, and tickets nowhere else"""
+    token = auth_headers["Authorization"].split()[1]
+    for params in ({"ticket": token}, {"token": token}):
+        assert client.get("/api/v1/events/stream", params=dict(params, types="logs")).status_code == 401
+
+    ticket = _ticket(auth_headers)
+    assert client.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {ticket}"}).status_code == 401
+    assert client.post("/api/v1/events/ticket", headers={"Authorization": f"Bearer {ticket}"}).status_code == 401
+
+    expired = create_access_token(
+        {"sub": user.username, "purpose": STREAM_TICKET_PURPOSE}, timedelta(seconds=-1)
+    )
+    assert client.get("/api/v1/events/stream", params={"ticket": expired, "types": "logs"}).status_code == 401
+
+
+def test_stream_ticket_keeps_key_scope(auth_headers, host):
+    """Test a ticket issued to a host-scoped API key is limited to that host"""
+    created = client.post(
+        "/api/v1/api-keys/", json={"name": "agent", "host_id": host.id}, headers=auth_headers
+    ).json()
+    ticket = _ticket({"Authorization": f"Bearer {created['key']}"})
+    claims = jwt.decode(ticket, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    assert claims["host_id"] == host.id
+    assert claims["exp"] - time.time() <= settings.EVENTS_TICKET_SECONDS
@@ -0,0 +1,50 @@
+"""
+Tests for hosts endpoints
+"""
+import uuid
+from fastapi.testclient import TestClient
+from api.main import app
+from api.core.security import create_access_token
+from api.db.database import SessionLocal
+from api.db.models import User
+
+client = TestClient(app)
+
+
+def test_upsert_host_by_name(auth_headers):
+    """Test the upsert creates once and then updates the same host"""
+    name = f"upsert-{uuid.uuid4().hex[:12]}"
+    url = f"/api/v1/hosts/by-name/{name}"
+
+    assert client.get(url, headers=auth_headers).status_code == 404
+
+    created = client.put(url, json={"ip_address": "10.0.0.1"}, headers=auth_headers)
+    assert created.status_code == 200
+    assert created.json()["name"] == name
+
+    updated = client.put(url, json={"ip_address": "10.0.0.2", "tags": ["agent"]}, headers=auth_headers)
+    assert updated.status_code == 200
+    assert updated.json()["id"] == created.json()["id"]
+    assert updated.json()["ip_address"] == "10.0.0.2"
+
+    found = client.get(url, headers=auth_headers)
+    assert found.json()["id"] == created.json()["id"]
+    assert found.json()["tags"] == ["agent"]
+
+
+def test_upsert_host_owned_by_other_user(host, auth_headers):
+    """Test a name registered to another user is a conflict"""
+    db = SessionLocal()
+    name = f"user-{uuid.uuid4().hex[:12]}"
+    other = User(username=name, email=f"{name}@example.com", hashed_password="x")
+    db.add(other)
+    db.commit()
+    db.close()
+    other_headers = {"Authorization": f"Bearer {create_access_token(data={'sub': name})}"}
+    url = f"/api/v1/hosts/by-name/{host.name}"
+
+    response = client.put(url, json={"ip_address": "10.0.0.9"}, headers=other_headers)
+    assert response.status_code == 409
+
+    owned = client.get(url, headers=auth_headers).json()
+    assert owned["ip_address"] == "127.0.0.1"
@@ -0,0 +1,30 @@
+"""
+Tests for the Prometheus endpoint
+"""
+from fastapi.testclient import TestClient
+from api.main import app
+from api.core.instrumentation import Histogram
+
+client = TestClient(app)
+
+
+def test_requests_labelled_by_route_template(auth_headers, host):
+    """Test requests are counted per route template, not raw path"""
+    client.get(f"/api/v1/hosts/{host.id}", headers=auth_headers)
+    body = client.get("/metrics").text
+
+    assert 'route="/api/v1/hosts/{host_id}",status="200"' in body
+    assert f"/api/v1/hosts/{host.id}\"" not in body
+    assert "netmon_db_pool_wait_seconds_count" in body
+    assert 'netmon_cache_hits_total{cache="principal"}' in body
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test rendered buckets accumulate and end with +Inf"""
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value)
+    out = []
+    histogram.render("h", 'a="b"', out)
+    assert out[:3] == ['h_bucket{a="b",le="0.1"} 1', 'h_bucket{a="b",le="1"} 3', 'h_bucket{a="b",le="+Inf"} 4']
+    assert out[-1] == 'h_count{a="b"} 4'
@@ -0,0 +1,302 @@
+"""
+Tests for metric ingestion
+"""
+import asyncio
+import gzip
+import json
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from api.main import app
+from api.db.database import SessionLocal
+from api.db.models import Item, Metric
+from api.core.config import settings
+from api.schemas import MetricCreate
+from api.services.buffer import IngestBuffer, ingest_buffer
+from api.services.ingest import write_metrics
+from api.services.items import item_registry
+from api.services.retention import purge_chunked
+
+client = TestClient(app)
+
+
+def test_create_metric(auth_headers, host):
+    """Test single metric ingestion"""
+    response = client.post(
+        "/api/v1/metrics/",
+        json={"host_id": host.id, "key": "cpu_usage", "value": 12.5},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["key"] == "cpu_usage"
+
+
+def test_batch_ingestion(auth_headers, host):
+    """Test batch ingestion writes every point"""
+    points = [
+        {"host_id": host.id, "key": f"key_{i % 5}", "value": float(i)}
+        for i in range(50)
+    ]
+    response = client.post(
+        "/api/v1/metrics/batch", json={"metrics": points}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 50
+
+    db = SessionLocal()
+    assert db.query(Metric).join(Item).filter(Item.host_id == host.id).count() == 50
+    db.close()
+
+
+def test_batch_rejects_foreign_host(auth_headers, host):
+    """Test batch is rejected as a whole when a host is not owned"""
+    points = [
+        {"host_id": host.id, "key": "cpu_usage", "value": 1.0},
+        {"host_id": host.id + 100000, "key": "cpu_usage", "value": 1.0},
+    ]
+    response = client.post(
+        "/api/v1/metrics/batch", json={"metrics": points}, headers=auth_headers
+    )
+    assert response.status_code == 404
+
+    db = SessionLocal()
+    assert db.query(Metric).join(Item).filter(Item.host_id == host.id).count() == 0
+    db.close()
+
+
+def test_batch_accepts_gzip(auth_headers, host):
+    """Test gzip-compressed batch bodies are inflated"""
+    points = [{"host_id": host.id, "key": "cpu_usage", "value": 1.0}] * 10
+    body = gzip.compress(json.dumps({"metrics": points}).encode())
+    response = client.post(
+        "/api/v1/metrics/batch",
+        content=body,
+        headers={
+            **auth_headers,
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 10
+
+
+def test_series_is_downsampled(auth_headers, host):
+    """Test series are bounded by max_points and keep the range ends"""
+    start = datetime(2026, 1, 1)
+    points = [
+        {
+            "host_id": host.id,
+            "key": "cpu_usage",
+            "value": 100.0 if i == 500 else float(i % 10),
+            "timestamp": (start + timedelta(seconds=10 * i)).isoformat(),
+        }
+        for i in range(1000)
+    ]
+    client.post("/api/v1/metrics/batch", json={"metrics": points}, headers=auth_headers)
+
+    response = client.get(
+        "/api/v1/metrics/series",
+        params={
+            "host_id": host.id,
+            "key": "cpu_usage",
+            "start": start.isoformat(),
+            "end": (start + timedelta(hours=3)).isoformat(),
+            "max_points": 200,
+        },
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["source"] == "raw"
+    assert data["source_points"] == 1000
+    assert len(data["points"]) == 200
+    assert data["points"][0]["value"] == 0.0
+    assert max(p["value"] for p in data["points"]) == 100.0
+
+
+def test_rollups_serve_long_ranges(auth_headers, host):
+    """Test wide ranges read the rollups and summaries merge them"""
+    start = datetime(2026, 2, 1)
+    points = [
+        {
+            "host_id": host.id,
+            "key": "memory_usage",
+            "value": float(i % 100),
+            "timestamp": (start + timedelta(seconds=6 * i)).isoformat(),
+        }
+        for i in range(2000)
+    ]
+    # Two batches hitting the same buckets must merge, not overwrite
+    client.post("/api/v1/metrics/batch", json={"metrics": points[:1000]}, headers=auth_headers)
+    client.post("/api/v1/metrics/batch", json={"metrics": points[1000:]}, headers=auth_headers)
+
+    params = {
+        "host_id": host.id,
+        "key": "memory_usage",
+        "start": start.isoformat(),
+        "end": (start + timedelta(days=1)).isoformat(),
+    }
+    series = client.get(
+        "/api/v1/metrics/series", params={**params, "max_points": 50}, headers=auth_headers
+    ).json()
+    assert series["source"] == "metric_rollups_1m"
+    assert series["source_points"] == 200
+
+    summary = client.get("/api/v1/metrics/summary", params=params, headers=auth_headers).json()
+    assert summary["count"] == 2000
+    assert summary["min"] == 0.0
+    assert summary["max"] == 99.0
+    assert abs(summary["avg"] - 49.5) < 1e-6
+    assert abs(summary["p95"] - 95) <= 95 * 0.02
+
+
+def test_retention_purges_in_chunks(auth_headers, host):
+    """Test expired raw rows are deleted across several bounded chunks"""
+    old = datetime(2020, 1, 1)
+    points = [
+        {"host_id": host.id, "key": "disk_usage", "value": 1.0,
+         "timestamp": (old + timedelta(seconds=i)).isoformat()}
+        for i in range(25)
+    ]
+    points.append({"host_id": host.id, "key": "disk_usage", "value": 2.0})
+    client.post("/api/v1/metrics/batch", json={"metrics": points}, headers=auth_headers)
+
+    deleted = purge_chunked(Metric, Metric.timestamp, datetime(2021, 1, 1), chunk_size=10)
+    assert deleted >= 25
+
+    db = SessionLocal()
+    remaining = db.query(Metric).join(Item).filter(Item.host_id == host.id).all()
+    db.close()
+    assert [m.value for m in remaining] == [2.0]
+
+
+def test_rolled_back_item_is_not_cached(host):
+    """Test an item created in a rolled-back transaction is created again on the next write"""
+    point = MetricCreate(host_id=host.id, key="fresh_key", value=1.0)
+    db = SessionLocal()
+    write_metrics(db, [point])
+    db.rollback()
+    db.close()
+    assert (host.id, "fresh_key") not in item_registry._ids
+
+    db = SessionLocal()
+    write_metrics(db, [point])
+    db.commit()
+    stored = db.query(Metric.value).join(Item).filter(Item.host_id == host.id, Item.key == "fresh_key").all()
+    db.close()
+    assert [row.value for row in stored] == [1.0]
+    assert (host.id, "fresh_key") in item_registry._ids
+
+
+def test_latest_values(auth_headers, host):
+    """Test the newest point per key wins, even when sent out of order"""
+    newer = datetime(2026, 5, 1, 12, 0, 0)
+    older = newer - timedelta(minutes=5)
+    client.post("/api/v1/metrics/batch", json={"metrics": [
+        {"host_id": host.id, "key": "cpu_usage", "value": 42.0, "timestamp": newer.isoformat()},
+        {"host_id": host.id, "key": "cpu_usage", "value": 7.0, "timestamp": older.isoformat()},
+        {"host_id": host.id, "key": "disk_usage", "value": 80.0, "timestamp": older.isoformat()},
+    ]}, headers=auth_headers)
+
+    response = client.get(
+        "/api/v1/metrics/latest", params={"host_ids": f"{host.id},999999"}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    hosts = response.json()["hosts"]
+    assert list(hosts) == [str(host.id)]
+    assert hosts[str(host.id)]["cpu_usage"]["value"] == 42.0
+    assert hosts[str(host.id)]["cpu_usage"]["timestamp"] == newer.isoformat()
+    assert hosts[str(host.id)]["disk_usage"]["value"] == 80.0
+
+
+def test_buffered_batch_backpressure(auth_headers, host, monkeypatch):
+    """Test buffered batches return 202 and a full buffer returns 429"""
+    monkeypatch.setattr(settings, "INGEST_BUFFER_ENABLED", True)
+    monkeypatch.setattr(ingest_buffer, "capacity", len(ingest_buffer) + 5)
+    points = [{"host_id": host.id, "key": "cpu_usage", "value": 1.0}] * 4
+
+    accepted = client.post("/api/v1/metrics/batch", json={"metrics": points}, headers=auth_headers)
+    assert accepted.status_code == 202
+
+    rejected = client.post("/api/v1/metrics/batch", json={"metrics": points}, headers=auth_headers)
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 1
+
+    stats = client.get("/api/v1/metrics/buffer", headers=auth_headers).json()
+    assert stats["rejected"] >= 4
+    asyncio.run(ingest_buffer.flush_once())
+
+
+def test_buffer_flushes_on_stop(host):
+    """Test flushers drain by size, and stop() writes what is left"""
+    buffer = IngestBuffer(capacity=1000, flush_rows=10, flush_ms=60000, max_flush_rows=10)
+    points = [MetricCreate(host_id=host.id, key="mem", value=float(i)) for i in range(25)]
+
+    async def run():
+        buffer.start()
+        buffer.offer(points)
+        await asyncio.sleep(0.5)
+        flushed_before_stop = buffer.rows_flushed
+        await buffer.stop()
+        return flushed_before_stop
+
+    assert asyncio.run(run()) == 20
+    assert buffer.rows_flushed == 25
+    assert len(buffer) == 0
+    assert buffer.stats()["avg_rows_per_flush"] == 25 / 3
+
+    db = SessionLocal()
+    assert db.query(Metric).join(Item).filter(Item.host_id == host.id).count() == 25
+    db.close()
+
+
+def test_buffer_drops_only_failing_hosts(host, monkeypatch):
+    """Test a chunk that fails is written host by host, dropping only the failing host's points"""
+    from api.services import buffer as buffer_module
+
+    def write(db, points):
+        if any(p.host_id == 999999 for p in points):
+            raise ValueError("bad point")
+        return write_metrics(db, points)
+
+    monkeypatch.setattr(buffer_module, "write_metrics", write)
+    buffer = IngestBuffer(capacity=1000, flush_rows=10, flush_ms=60000, max_flush_rows=100)
+    buffer.offer([MetricCreate(host_id=host.id, key="net", value=float(i)) for i in range(5)])
+    buffer.offer([MetricCreate(host_id=999999, key="net", value=1.0)] * 3)
+
+    assert asyncio.run(buffer.flush_once()) == 5
+    assert buffer.dropped == 3
+    assert len(buffer) == 0
+
+    db = SessionLocal()
+    assert db.query(Metric).join(Item).filter(Item.host_id == host.id, Item.key == "net").count() == 5
+    db.close()
+
+
+def test_buffer_flusher_survives_unexpected_errors(host, monkeypatch):
+    """Test an exception escaping a flush does not stop the flusher"""
+    from api.services import buffer as buffer_module
+
+    failures = iter([RuntimeError("cache down")])
+
+    async def record(rows):
+        failure = next(failures, None)
+        if failure is not None:
+            raise failure
+
+    monkeypatch.setattr(buffer_module.latest_values, "record", record)
+    buffer = IngestBuffer(capacity=1000, flush_rows=5, flush_ms=60000, max_flush_rows=5)
+
+    async def run():
+        buffer.start()
+        buffer.offer([MetricCreate(host_id=host.id, key="io", value=1.0)] * 5)
+        # Past the flusher's one-second back-off
+        await asyncio.sleep(1.3)
+        buffer.offer([MetricCreate(host_id=host.id, key="io", value=2.0)] * 5)
+        await asyncio.sleep(0.3)
+        alive = not any(task.done() for task in buffer._tasks)
+        await buffer.stop()
+        return alive
+
+    assert asyncio.run(run())
+    assert buffer.rows_flushed == 10
@@ -0,0 +1,203 @@
+"""
+Tests for schema migrations and the pre-fork server
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import create_engine, func, inspect, select, text
+from sqlalchemy.orm import Session
+from api.db.migrate import discover, pending, run_ddl, upgrade
+from api.db.models import ApiKey, Base, Item, Metric, MetricRollup1m
+from api.core.config import settings
+from api.server import Master, default_workers
+
+
+INIT_SQL_0_1_0 = Path(__file__).resolve().parent / "data" / "init-0.1.0.sql"
+
+
+def _schema(engine):
+    """Columns and index/named-constraint names per table"""
+    inspector = inspect(engine)
+    schema = {}
+    for table in inspector.get_table_names():
+        if table == "schema_migrations":
+            continue
+        indexes = {i["name"] for i in inspector.get_indexes(table)}
+        # SQLite cannot add constraints later; a unique index stands in
+        indexes |= {c["name"] for c in inspector.get_unique_constraints(table) if c["name"]}
+        schema[table] = ({c["name"] for c in inspector.get_columns(table)}, indexes)
+    return schema
+
+
+def _model_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'models.db'}")
+    Base.metadata.create_all(engine)
+    return _schema(engine)
+
+
+def test_upgrade_applies_each_version_once(tmp_path):
+    """Test a fresh database gets every migration and the models' schema, and a second run is a no-op"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    versions = [m.version for m in discover()]
+
+    assert upgrade(engine) == versions
+    assert upgrade(engine) == []
+    assert pending(engine) == []
+    assert _schema(engine) == _model_schema(tmp_path)
+
+
+def test_upgrade_from_released_init_sql(tmp_path):
+    """Test a database created by the 0.1.0 infra/init.sql, with data, migrates to the models"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'released.db'}")
+    with engine.begin() as conn:
+        run_ddl(conn, INIT_SQL_0_1_0.read_text())
+        conn.execute(text(
+            "INSERT INTO hosts (id, name, ip_address, user_id) VALUES (1, 'web', '10.0.0.1', 1), "
+            "(2, 'db', '10.0.0.2', 1)"
+        ))
+        # A stray duplicate item, referenced by a trigger
+        conn.execute(text("INSERT INTO items (id, host_id, key) VALUES (7, 1, 'cpu'), (8, 1, 'cpu')"))
+        conn.execute(text(
+            "INSERT INTO triggers (host_id, item_id, key, condition, threshold) VALUES (1, 8, 'cpu', '>', 90)"
+        ))
+        conn.execute(text(
+            "INSERT INTO metrics (host_id, key, value, timestamp) VALUES "
+            "(1, 'cpu', 1.0, '2025-11-01 00:00:00'), (1, 'cpu', 2.0, '2025-11-01 00:01:00'), "
+            "(1, 'mem', 3.0, '2025-11-01 00:00:00'), (2, 'cpu', 4.0, '2025-11-01 00:00:00')"
+        ))
+        conn.execute(text("INSERT INTO alerts (host_id, title, message) VALUES (1, 'Disk full', '98%')"))
+
+    assert upgrade(engine) == [m.version for m in discover()]
+    assert _schema(engine) == _model_schema(tmp_path)
+
+    with engine.connect() as conn:
+        samples = conn.execute(text(
+            "SELECT i.host_id, i.key, m.value FROM metrics m JOIN items i ON i.id = m.item_id ORDER BY m.id"
+        )).all()
+        assert samples == [(1, "cpu", 1.0), (1, "cpu", 2.0), (1, "mem", 3.0), (2, "cpu", 4.0)]
+        items = conn.execute(text("SELECT host_id, key, id FROM items ORDER BY host_id, key")).all()
+        assert [(h, k) for h, k, _ in items] == [(1, "cpu"), (1, "mem"), (2, "cpu")]
+        assert items[0][2] == 7
+        assert conn.execute(text("SELECT item_id FROM triggers")).scalar() == 7
+        alert = conn.execute(text("SELECT trigger_id, occurrences FROM alerts")).one()
+        assert alert == (None, 1)
+        assert conn.execute(text("SELECT username FROM users")).scalar() == "demo"
+
+    # The app's own writes work on the migrated tables
+    with Session(engine) as db:
+        item = Item(host_id=2, key="mem")
+        db.add(item)
+        db.flush()
+        db.add(Metric(item_id=item.id, value=5.0))
+        db.add(MetricRollup1m(item_id=item.id, bucket=datetime(2025, 11, 1), count=1, sum=5.0))
+        db.add(ApiKey(user_id=1, prefix="abc", key_hash="x"))
+        db.commit()
+        assert db.execute(select(func.count()).select_from(Metric)).scalar() == 5
+
+
+def _fake_master(monkeypatch, workers):
+    """A Master whose forks, readiness and stops are recorded instead of real"""
+    pids = iter(range(1000, 2000))
+    monkeypatch.setattr(os, "fork", lambda: next(pids))
+    master = Master(None, argparse.Namespace(workers=workers, migrate=False, graceful_timeout=0, ready_timeout=1))
+    events = []
+    spawn = master.spawn
+
+    def spawn_recorded():
+        pid, fd = spawn()
+        events.append(("spawn", pid == master.jobs_pid))
+        return pid, fd
+
+    def stop(pids, timeout):
+        for pid in pids:
+            events.append(("stop", pid == master.jobs_pid))
+            master.forget(pid)
+
+    monkeypatch.setattr(master, "spawn", spawn_recorded)
+    monkeypatch.setattr(master, "wait_ready", lambda started: [os.close(fd) or pid for pid, fd in started])
+    monkeypatch.setattr(master, "stop_workers", stop)
+    return master, events
+
+
+def test_one_worker_runs_background_jobs(monkeypatch):
+    """Test exactly one worker gets the jobs, through rolling restarts and crashes"""
+    master, events = _fake_master(monkeypatch, workers=3)
+    master.wait_ready([master.spawn() for _ in range(3)])
+    assert events == [("spawn", True), ("spawn", False), ("spawn", False)]
+
+    events.clear()
+    master.rolling_restart()
+    # The job worker stops before its replacement starts, never alongside it
+    assert events[:2] == [("stop", True), ("spawn", True)]
+    assert events.count(("spawn", True)) == 1
+    assert len(master.workers) == 3 and master.jobs_pid in master.workers
+
+    crashed = master.jobs_pid
+    exits = iter([(crashed, 256)])
+    monkeypatch.setattr(os, "waitpid", lambda pid, options: next(exits, (0, 0)))
+    monkeypatch.setattr("api.server._MIN_LIFETIME", 0)
+    master.reap()
+    assert master.jobs_pid not in (None, crashed)
+    assert len(master.workers) == 3
+
+
+def test_default_workers(monkeypatch):
+    """Test the server defaults to one worker while triggers are evaluated in-process"""
+    monkeypatch.setattr(settings, "WEB_CONCURRENCY", 0)
+    monkeypatch.setattr(settings, "TRIGGERS_ENABLED", True)
+    assert default_workers(settings) == 1
+    monkeypatch.setattr(settings, "TRIGGERS_ENABLED", False)
+    assert default_workers(settings) == (os.cpu_count() or 1)
+    monkeypatch.setattr(settings, "WEB_CONCURRENCY", 3)
+    assert default_workers(settings) == 3
+
+
+def _get(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.status
+
+
+def test_server_rolling_restart(tmp_path):
+    """Test the pre-fork server migrates, serves, restarts workers on SIGHUP and stops cleanly"""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    env = dict(
+        os.environ,
+        SQLALCHEMY_DATABASE_URL=f"sqlite:///{tmp_path / 'server.db'}",
+        DB_CREATE_ALL="false",
+        EVENTS_RELAY_ENABLED="false",
+        RETENTION_ENABLED="false",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "api.server", "--workers", "2", "--host", "127.0.0.1",
+         "--port", str(port), "--no-access-log", "--graceful-timeout", "5"],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}/health"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                assert _get(url) == 200
+                break
+            except OSError:
+                assert time.monotonic() < deadline and server.poll() is None
+                time.sleep(0.2)
+
+        server.send_signal(signal.SIGHUP)
+        for _ in range(20):
+            assert _get(url) == 200
+            time.sleep(0.1)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
@@ -0,0 +1,93 @@
+"""
+Tests for keyset pagination
+"""
+import uuid
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from api.main import app
+from api.db.database import SessionLocal
+from api.db.models import Alert
+
+client = TestClient(app)
+
+
+def _collect(url, headers, **params):
+    items, cursor = [], None
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        page = client.get(url, params=query, headers=headers).json()
+        items.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items
+
+
+def test_hosts_pages(auth_headers):
+    """Test walking host pages returns every host exactly once"""
+    for i in range(7):
+        client.post(
+            "/api/v1/hosts/",
+            json={"name": f"page-host-{uuid.uuid4().hex[:12]}", "ip_address": "10.0.0.1"},
+            headers=auth_headers,
+        )
+
+    first = client.get("/api/v1/hosts/", params={"limit": 3}, headers=auth_headers).json()
+    assert len(first["items"]) == 3
+    assert first["next_cursor"]
+
+    hosts = _collect("/api/v1/hosts/", auth_headers, limit=3)
+    ids = [h["id"] for h in hosts]
+    assert len(ids) == 7
+    assert ids == sorted(set(ids))
+
+
+def test_alerts_pages_with_equal_timestamps(auth_headers, host):
+    """Test the (triggered_at, id) key splits ties between pages"""
+    db = SessionLocal()
+    moment = datetime(2026, 4, 1)
+    for i in range(5):
+        db.add(Alert(host_id=host.id, title=f"a{i}", message="", triggered_at=moment))
+    db.add(Alert(host_id=host.id, title="older", message="", triggered_at=moment - timedelta(hours=1)))
+    db.commit()
+    db.close()
+
+    alerts = _collect("/api/v1/alerts/", auth_headers, limit=2)
+    assert len(alerts) == 6
+    assert len({a["id"] for a in alerts}) == 6
+    assert alerts[-1]["title"] == "older"
+
+
+def test_invalid_cursor(auth_headers):
+    """Test a garbled cursor is a client error"""
+    response = client.get("/api/v1/hosts/", params={"cursor": "!!"}, headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_list_items_match_detail_responses(auth_headers, host):
+    """Test the column-projected list path serializes like the response models"""
+    trigger = client.post(
+        "/api/v1/triggers/",
+        json={"host_id": host.id, "key": "cpu_usage", "condition": ">", "threshold": 90.5},
+        headers=auth_headers,
+    ).json()
+
+    hosts = _collect("/api/v1/hosts/", auth_headers)
+    assert client.get(f"/api/v1/hosts/{host.id}", headers=auth_headers).json() in hosts
+    triggers = _collect("/api/v1/triggers/", auth_headers, host_id=host.id)
+    assert client.get(f"/api/v1/triggers/{trigger['id']}", headers=auth_headers).json() in triggers
+
+
+def test_fields_projection(auth_headers, host):
+    """Test fields= limits each item while cursors keep working"""
+    db = SessionLocal()
+    for i in range(3):
+        db.add(Alert(host_id=host.id, title=f"p{i}", message="", triggered_at=datetime(2026, 5, 1, 0, i)))
+    db.commit()
+    db.close()
+
+    alerts = _collect("/api/v1/alerts/", auth_headers, limit=1, host_id=host.id, fields="title,id")
+    assert [a["title"] for a in alerts] == ["p2", "p1", "p0"]
+    assert all(set(a) == {"title", "id"} for a in alerts)
+
+    response = client.get("/api/v1/hosts/", params={"fields": "id,password"}, headers=auth_headers)
+    assert response.status_code == 400
@@ -0,0 +1,145 @@
+"""
+Tests for metrics partitioning
+"""
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from api.core.config import settings
+from api.db.database import engine
+from api.db.migrate import run_ddl
+from api.services.partitions import (
+    ensure_partitioned, ensure_partitions, existing_partitions, expire_partitions, is_partitioned,
+    parse_partition_name, partition_bounds, partition_name, wanted_partitions,
+)
+
+# metrics as migration 0002 leaves it on PostgreSQL
+UNPARTITIONED = """
+CREATE TABLE items (id SERIAL PRIMARY KEY);
+CREATE TABLE metrics (
+    id BIGSERIAL PRIMARY KEY,
+    item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+    value FLOAT NOT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX ix_metrics_item_id_timestamp ON metrics (item_id, timestamp) INCLUDE (value);
+CREATE INDEX ix_metrics_timestamp ON metrics (timestamp)
+"""
+
+
+def test_day_and_week_bounds():
+    """Test days start at midnight and weeks on Monday"""
+    ts = datetime(2026, 10, 15, 13, 45)  # a Thursday
+    assert partition_bounds(ts, "day") == (datetime(2026, 10, 15), datetime(2026, 10, 16))
+    assert partition_bounds(ts, "week") == (datetime(2026, 10, 12), datetime(2026, 10, 19))
+
+
+def test_partition_name_round_trip():
+    """Test names encode the bounds they were created with"""
+    start, end = partition_bounds(datetime(2026, 10, 15), "week")
+    name = partition_name(start, "week")
+    assert name == "metrics_w20261012"
+    assert parse_partition_name(name) == (start, end)
+    assert parse_partition_name("metrics_default") is None
+
+
+def test_wanted_partitions_cover_retention_and_lookahead():
+    """Test partitions span the retention window through future periods"""
+    bounds = wanted_partitions(datetime(2026, 10, 15, 12), "day", ahead=3, retention_days=7)
+    assert bounds[0][0] == datetime(2026, 10, 8)
+    assert bounds[-1][0] == datetime(2026, 10, 18)
+    assert all(a[1] == b[0] for a, b in zip(bounds, bounds[1:]))
+
+
+@pytest.fixture
+def scratch():
+    """A connection whose search_path is a throwaway schema with an unpartitioned metrics table"""
+    if engine.dialect.name != "postgresql":
+        pytest.skip("metrics partitioning needs PostgreSQL")
+    schema = f"partitions_{uuid.uuid4().hex[:12]}"
+    with engine.connect() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+        conn.execute(text(f"SET search_path TO {schema}"))
+        run_ddl(conn, UNPARTITIONED)
+        conn.commit()
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+            conn.execute(text("RESET search_path"))
+            conn.commit()
+
+
+def _count(conn, table):
+    return conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+
+
+def test_existing_table_is_partitioned_in_place(scratch, monkeypatch):
+    """Test an existing table keeps its rows, then partitions are created and expired around them"""
+    monkeypatch.setattr(settings, "METRICS_PARTITIONING", "day")
+    monkeypatch.setattr(settings, "METRICS_PARTITIONS_AHEAD", 1)
+    monkeypatch.setattr(settings, "METRICS_RAW_RETENTION_DAYS", 3)
+    monkeypatch.setattr(settings, "METRICS_PARTITION_DETACH", False)
+    now = datetime(2026, 10, 15, 12)
+    item_id = scratch.execute(text("INSERT INTO items DEFAULT VALUES RETURNING id")).scalar()
+    for days in (10, 2, 1, 0):
+        scratch.execute(
+            text("INSERT INTO metrics (item_id, value, timestamp) VALUES (:item, 1.0, :ts)"),
+            {"item": item_id, "ts": now - timedelta(days=days)},
+        )
+    scratch.commit()
+
+    assert ensure_partitioned(scratch) is True
+    scratch.commit()
+    assert is_partitioned(scratch)
+    assert existing_partitions(scratch) == ["metrics_default"]
+    assert _count(scratch, "metrics") == 4
+    # Already partitioned: nothing to do
+    assert ensure_partitioned(scratch) is False
+    scratch.commit()
+
+    db = Session(bind=scratch)
+    created = ensure_partitions(db, now=now)
+    db.commit()
+    assert created == [partition_name(datetime(2026, 10, day), "day") for day in range(12, 17)]
+    # Rows of the retained days moved to their partitions; the older one stays behind
+    assert _count(scratch, "metrics_default") == 1
+    assert _count(scratch, "metrics_d20261013") == 1
+    assert _count(scratch, "metrics") == 4
+
+    # New rows get ids from the same sequence and land in their day's partition
+    new_id = scratch.execute(
+        text("INSERT INTO metrics (item_id, value, timestamp) VALUES (:item, 2.0, :ts) RETURNING id"),
+        {"item": item_id, "ts": now},
+    ).scalar()
+    assert new_id == 5
+    assert _count(scratch, "metrics_d20261015") == 2
+
+    expired = expire_partitions(db, datetime(2026, 10, 14))
+    db.commit()
+    assert sorted(expired) == ["metrics_d20261012", "metrics_d20261013"]
+    assert _count(scratch, "metrics") == 4
+    db.close()
+
+
+def test_partitioned_table_gets_a_default_partition(scratch):
+    """Test a partitioned table created without one (create_all) accepts inserts at once"""
+    run_ddl(scratch, """
+        DROP TABLE metrics;
+        CREATE TABLE metrics (
+            id BIGSERIAL,
+            item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+            value FLOAT NOT NULL,
+            timestamp TIMESTAMP NOT NULL,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    assert ensure_partitioned(scratch) is False
+    item_id = scratch.execute(text("INSERT INTO items DEFAULT VALUES RETURNING id")).scalar()
+    scratch.execute(
+        text("INSERT INTO metrics (item_id, value, timestamp) VALUES (:item, 1.0, :ts)"),
+        {"item": item_id, "ts": datetime(2026, 10, 15)},
+    )
+    assert _count(scratch, "metrics_default") == 1
@@ -0,0 +1,101 @@
+"""
+Tests for active host probes
+"""
+import asyncio
+import socket
+from api.db.database import SessionLocal
+from api.db.models import Host, Item, Metric
+from api.services.probes import ProbeScheduler, ProbeSpec, http_probe, parse_probe_tag, tcp_probe
+
+
+def _closed_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+async def _http_server(status_line):
+    async def handle(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(f"HTTP/1.0 {status_line}\r\nContent-Length: 0\r\n\r\n".encode())
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_parse_probe_tags():
+    """Test probe tags map to probe specs"""
+    assert parse_probe_tag("probe:tcp:22") == ProbeSpec("tcp", 22)
+    assert parse_probe_tag("probe:http:8080/health") == ProbeSpec("http", 8080, "/health")
+    assert parse_probe_tag("probe:icmp") == ProbeSpec("icmp")
+    assert parse_probe_tag("production") is None
+    assert ProbeSpec("tcp", 22).name == "probe.tcp_22"
+
+
+def test_tcp_and_http_probes():
+    """Test probes succeed against local listeners and fail on closed ports"""
+    async def run():
+        ok, port = await _http_server("200 OK")
+        broken, broken_port = await _http_server("503 Service Unavailable")
+        async with ok, broken:
+            assert await tcp_probe("127.0.0.1", port) >= 0
+            assert await http_probe("127.0.0.1", port, "/health") >= 0
+            try:
+                await http_probe("127.0.0.1", broken_port)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("5xx should count as down")
+        try:
+            await tcp_probe("127.0.0.1", _closed_port())
+        except OSError:
+            pass
+        else:
+            raise AssertionError("closed port should fail")
+
+    asyncio.run(run())
+
+
+def test_scheduler_writes_metrics_and_status(host):
+    """Test a probe round records latency/up metrics and flips host status"""
+    closed = _closed_port()
+
+    async def run():
+        server, port = await _http_server("200 OK")
+        async with server:
+            db = SessionLocal()
+            db.query(Host).filter(Host.id == host.id).update(
+                {Host.tags: [f"probe:tcp:{port}", f"probe:http:{port}/"]}, synchronize_session=False
+            )
+            db.commit()
+            db.close()
+
+            scheduler = ProbeScheduler(interval=30, concurrency=10, timeout=1.0)
+            hosts = [(host.id, "127.0.0.1", [f"probe:tcp:{port}", f"probe:http:{port}/"], "unknown")]
+            await scheduler.run_cycle(hosts, spread=False)
+            await scheduler.drain()
+            await scheduler.flush()
+
+            down = [(host.id, "127.0.0.1", [f"probe:tcp:{closed}"], "online")]
+            await scheduler.run_cycle(down, spread=False)
+            await scheduler.drain()
+            return scheduler
+
+    scheduler = asyncio.run(run())
+
+    db = SessionLocal()
+    keys = {key for (key,) in db.query(Item.key).join(Metric).filter(Item.host_id == host.id)}
+    assert any(k.endswith(".latency_ms") for k in keys)
+    assert any(k.startswith("probe.http_") and k.endswith(".up") for k in keys)
+    assert db.query(Host.status).filter(Host.id == host.id).scalar() == "online"
+    db.close()
+
+    # The second round saw the host down; the change is pending until flushed
+    asyncio.run(scheduler.flush())
+    db = SessionLocal()
+    assert db.query(Host.status).filter(Host.id == host.id).scalar() == "offline"
+    db.close()
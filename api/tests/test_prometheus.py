@@ -0,0 +1,111 @@
+"""
+Tests for Prometheus ingestion
+"""
+import struct
+import uuid
+from fastapi.testclient import TestClient
+from api.main import app
+from api.core.compression import snappy_decompress
+from api.db.database import SessionLocal
+from api.db.models import Host, Item, Metric
+from api.services.prometheus import parse_text
+
+client = TestClient(app)
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _len_field(number, payload):
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _write_request(series):
+    """Encode a WriteRequest from [(labels, [(value, ts_ms), ...])]"""
+    body = b""
+    for labels, samples in series:
+        ts = b""
+        for name, value in labels.items():
+            ts += _len_field(1, _len_field(1, name.encode()) + _len_field(2, value.encode()))
+        for value, timestamp in samples:
+            sample = _varint(1 << 3 | 1) + struct.pack("<d", value) + _varint(2 << 3 | 0) + _varint(timestamp)
+            ts += _len_field(2, sample)
+        body += _len_field(1, ts)
+    return body
+
+
+def _snappy_literal(data):
+    """Valid snappy block made of a single literal"""
+    size = len(data) - 1
+    return _varint(len(data)) + bytes([63 << 2]) + size.to_bytes(4, "little") + data
+
+
+def test_snappy_overlapping_copy():
+    """Test a literal followed by a copy that overlaps its own output"""
+    assert snappy_decompress(b"\x0c\x0cabcd\x11\x04") == b"abcdabcdabcd"
+
+
+def test_remote_write_large_batch(auth_headers):
+    """Test a 10k+ sample remote_write request is written in full"""
+    node = f"node-{uuid.uuid4().hex[:8]}"
+    series = [
+        ({"__name__": "node_load1", "instance": f"{node}:9100", "job": "node"},
+         [(float(i), 1_790_000_000_000 + i * 1000) for i in range(5250)]),
+        ({"__name__": "node_cpu_seconds_total", "instance": f"{node}:9100", "job": "node", "mode": "idle"},
+         [(float(i), 1_790_000_000_000 + i * 1000) for i in range(5250)]),
+    ]
+    response = client.post(
+        "/api/v1/prometheus/write",
+        content=_snappy_literal(_write_request(series)),
+        headers={
+            **auth_headers,
+            "Content-Encoding": "snappy",
+            "Content-Type": "application/x-protobuf",
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 10500
+
+    db = SessionLocal()
+    host = db.query(Host).filter(Host.name == node).one()
+    keys = {key for (key,) in db.query(Item.key).filter(Item.host_id == host.id)}
+    assert keys == {"node_load1", 'node_cpu_seconds_total{mode="idle"}'}
+    assert db.query(Metric).join(Item).filter(Item.host_id == host.id).count() == 10500
+    db.close()
+
+
+def test_text_import(auth_headers, host):
+    """Test exposition text lands on the given host, skipping NaN samples"""
+    body = (
+        "# HELP http_requests_total Requests\n"
+        "# TYPE http_requests_total counter\n"
+        'http_requests_total{method="post",path="/a \\"b\\""} 1027 1790000000000\n'
+        "process_open_fds 12\n"
+        "broken_gauge NaN\n"
+    )
+    response = client.post(
+        f"/api/v1/prometheus/import?host={host.name}",
+        content=body,
+        headers={**auth_headers, "Content-Type": "text/plain"},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"accepted": 2, "rejected": 1, "foreign_hosts": []}
+
+
+def test_parse_text_rejects_garbage():
+    """Test unparseable lines are reported with their number"""
+    try:
+        parse_text("ok 1\nnot a sample\n")
+    except ValueError as e:
+        assert "line 2" in str(e)
+    else:
+        raise AssertionError("expected ValueError")
@@ -0,0 +1,194 @@
+"""
+Tests for host deletion and the purge jobs
+"""
+import asyncio
+import uuid
+import orjson
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from api.core.config import settings
+from api.core.security import create_access_token
+from api.db.database import SessionLocal
+from api.db.models import Host, Item, Metric, PurgeJob, Trigger, User
+from api.main import app
+from api.services.events import Subscription, event_broker, hosts_deleted_event
+from api.services.items import item_registry
+from api.services.latest import latest_values
+from api.services.purge import delete_hosts, run_purge_jobs
+
+client = TestClient(app)
+
+
+def _write_points(host, auth_headers, count=5):
+    points = [
+        {"host_id": host.id, "key": key, "value": float(i)}
+        for key in ("cpu", "mem")
+        for i in range(count)
+    ]
+    response = client.post("/api/v1/metrics/batch", json={"metrics": points}, headers=auth_headers)
+    assert response.status_code in (200, 202)
+
+
+def _count(model, *conditions):
+    db = SessionLocal()
+    try:
+        return db.execute(select(func.count()).select_from(model).where(*conditions)).scalar()
+    finally:
+        db.close()
+
+
+def _purge_now(monkeypatch):
+    monkeypatch.setattr(settings, "PURGE_DELAY_SECONDS", 0)
+    monkeypatch.setattr(settings, "PURGE_CHUNK_SIZE", 3)
+    monkeypatch.setattr(settings, "PURGE_CHUNK_PAUSE_SECONDS", 0)
+    return run_purge_jobs()
+
+
+def test_delete_hides_host_at_once(auth_headers, host):
+    """Test a deleted host is gone from reads before its data is purged"""
+    _write_points(host, auth_headers)
+    response = client.delete(f"/api/v1/hosts/{host.id}", headers=auth_headers)
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "pending" and job["host_ids"] == [host.id]
+
+    assert client.get(f"/api/v1/hosts/{host.id}", headers=auth_headers).status_code == 404
+    assert client.get(f"/api/v1/hosts/by-name/{host.name}", headers=auth_headers).status_code == 404
+    listed = client.get("/api/v1/hosts/", headers=auth_headers).json()["items"]
+    assert host.id not in {h["id"] for h in listed}
+    metric = {"host_id": host.id, "key": "cpu", "value": 1.0}
+    assert client.post("/api/v1/metrics/", json=metric, headers=auth_headers).status_code == 404
+    assert client.delete(f"/api/v1/hosts/{host.id}", headers=auth_headers).status_code == 404
+
+    # Rows stay until the purge job runs
+    assert _count(Metric, Metric.item_id.in_(select(Item.id).where(Item.host_id == host.id))) == 10
+
+
+def test_deleted_name_can_be_reused(auth_headers, host):
+    """Test a new host may take the name of one still being purged"""
+    client.delete(f"/api/v1/hosts/{host.id}", headers=auth_headers)
+
+    created = client.put(
+        f"/api/v1/hosts/by-name/{host.name}", json={"ip_address": "10.0.0.3"}, headers=auth_headers
+    )
+    assert created.status_code == 200
+    assert created.json()["id"] != host.id
+
+
+def test_purge_job_deletes_rows_in_chunks(auth_headers, host, monkeypatch):
+    """Test the worker deletes a host's rows and records what it deleted"""
+    _write_points(host, auth_headers)
+    trigger = {"host_id": host.id, "key": "cpu", "condition": ">", "threshold": 90}
+    assert client.post("/api/v1/triggers/", json=trigger, headers=auth_headers).status_code == 200
+    job = client.delete(f"/api/v1/hosts/{host.id}", headers=auth_headers).json()
+    assert _count(Trigger, Trigger.host_id == host.id, Trigger.enabled.is_(True)) == 0
+
+    assert _purge_now(monkeypatch) >= 1
+
+    status = client.get(f"/api/v1/hosts/purge-jobs/{job['id']}", headers=auth_headers).json()
+    assert status["status"] == "done" and status["attempts"] == 1
+    assert status["finished_at"] is not None
+    assert status["deleted"]["metrics"] == 10
+    assert status["deleted"]["items"] == 2
+    assert status["deleted"]["triggers"] == 1
+    assert status["deleted"]["hosts"] == 1
+    assert _count(Host, Host.id == host.id) == 0
+    assert _count(Item, Item.host_id == host.id) == 0
+
+
+def test_purge_skips_live_hosts(auth_headers, host, monkeypatch):
+    """Test a job never removes a host that is not soft-deleted, nor its data"""
+    _write_points(host, auth_headers)
+    db = SessionLocal()
+    job = PurgeJob(user_id=host.user_id, host_ids=[host.id], status="pending", deleted={})
+    db.add(job)
+    db.commit()
+    job_id = job.id
+    db.close()
+
+    _purge_now(monkeypatch)
+
+    assert _count(Host, Host.id == host.id) == 1
+    assert _count(Item, Item.host_id == host.id) == 2
+    assert _count(PurgeJob, PurgeJob.id == job_id, PurgeJob.status == "done") == 1
+
+
+def test_bulk_delete(auth_headers, user, host):
+    """Test one job covers the caller's hosts and ignores ids it does not own"""
+    db = SessionLocal()
+    second = Host(name=f"host-{uuid.uuid4().hex[:12]}", ip_address="127.0.0.2", tags=[], user_id=user.id)
+    db.add(second)
+    db.commit()
+    second_id = second.id
+    db.close()
+
+    response = client.post(
+        "/api/v1/hosts/bulk-delete", json={"host_ids": [second_id, host.id, 0]}, headers=auth_headers
+    )
+    assert response.status_code == 202
+    assert response.json()["host_ids"] == sorted([host.id, second_id])
+
+    again = client.post("/api/v1/hosts/bulk-delete", json={"host_ids": [host.id]}, headers=auth_headers)
+    assert again.status_code == 404
+    empty = client.post("/api/v1/hosts/bulk-delete", json={"host_ids": []}, headers=auth_headers)
+    assert empty.status_code == 422
+
+
+def test_purge_job_is_private(auth_headers, host):
+    """Test another user cannot see a purge job"""
+    job = client.delete(f"/api/v1/hosts/{host.id}", headers=auth_headers).json()
+    assert client.get(f"/api/v1/hosts/purge-jobs/{job['id']}", headers=auth_headers).status_code == 200
+
+    db = SessionLocal()
+    name = f"user-{uuid.uuid4().hex[:12]}"
+    db.add(User(username=name, email=f"{name}@example.com", hashed_password="x"))
+    db.commit()
+    db.close()
+    other = {"Authorization": f"Bearer {create_access_token(data={'sub': name})}"}
+    assert client.get(f"/api/v1/hosts/purge-jobs/{job['id']}", headers=other).status_code == 404
+
+
+def _cached(host):
+    return (
+        any(key[0] == host.id for key in item_registry._ids),
+        host.id in latest_values._local,
+    )
+
+
+def test_deletion_clears_caches_on_commit(auth_headers, host):
+    """Test committing a deletion publishes an event that drops the host's cached items and values"""
+    _write_points(host, auth_headers)
+    assert _cached(host) == (True, True)
+
+    def delete(commit):
+        db = SessionLocal()
+        try:
+            delete_hosts(db, host.user_id, [host.id])
+            assert db.info["netmon_events"] == [hosts_deleted_event([host.id])]
+            db.commit() if commit else db.rollback()
+        finally:
+            db.close()
+
+    async def run():
+        # A subscriber keeps the broker publishing, as the relay does in production
+        subscription = event_broker.subscribe(Subscription(set()))
+        try:
+            await asyncio.to_thread(delete, False)
+            await asyncio.sleep(0.05)
+            assert _cached(host) == (True, True)
+            await asyncio.to_thread(delete, True)
+            await asyncio.sleep(0.05)
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    asyncio.run(run())
+    assert _cached(host) == (False, False)
+
+
+def test_relayed_deletion_clears_caches(auth_headers, host):
+    """Test a deletion made by another worker reaches this worker's caches over the relay"""
+    _write_points(host, auth_headers)
+    assert _cached(host) == (True, True)
+
+    event_broker._receive(orjson.dumps({"origin": "other-worker", "events": [hosts_deleted_event([host.id])]}))
+    assert _cached(host) == (False, False)
@@ -0,0 +1,356 @@
+"""
+Query plan regression tests
+
+Each route runs against a seeded, analyzed database while its statements
+are recorded; every statement then goes through EXPLAIN on the database the
+tests run against. A query that reads a whole table or sorts rows itself
+fails the test, so a changed query or a dropped index shows up here rather
+than in production latency.
+
+On PostgreSQL, sequential scans and sorts are disabled for the EXPLAIN, so
+the planner picks them only where no index can serve the query, however
+small the seeded tables are.
+"""
+import re
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from api.main import app
+from api.core.security import api_key_cache, create_access_token, get_password_hash
+from api.db.database import SessionLocal, async_engine, engine
+from api.db.models import (
+    Alert, Base, Host, Item, Metric, MetricRollup1h, MetricRollup1m, Trigger, User,
+)
+from api.core.config import settings
+from api.services.items import ItemRegistry
+from api.services.purge import run_purge_jobs
+from api.services.retention import purge_chunked
+from api.services.triggers import trigger_engine
+
+client = TestClient(app)
+
+INIT_SQL = Path(__file__).resolve().parents[2] / "infra" / "init.sql"
+
+HOSTS = 40
+KEYS = 5
+MINUTES = 120
+
+# A bare "SCAN <table>" reads the whole table; "SCAN t USING INDEX" walks an index
+_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+# PostgreSQL plan nodes that read a whole table or sort rows
+_POSTGRES_PROBLEMS = ("Seq Scan", "Sort", "Incremental Sort")
+
+# asyncpg's numbered placeholders, replayed through psycopg2
+_NUMBERED = re.compile(r"\$(\d+)")
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    """One user with a realistic spread of hosts, samples, rollups, triggers and alerts"""
+    db = SessionLocal()
+    name = f"plans-{uuid.uuid4().hex[:12]}"
+    user = User(username=name, email=f"{name}@example.com", hashed_password=get_password_hash("x"))
+    db.add(user)
+    db.commit()
+    hosts = [
+        Host(name=f"{name}-{i}", ip_address="10.0.0.1", tags=[], user_id=user.id, status="online")
+        for i in range(HOSTS)
+    ]
+    db.add_all(hosts)
+    db.commit()
+    items = [Item(host_id=h.id, key=f"key{k}") for h in hosts for k in range(KEYS)]
+    db.add_all(items)
+    db.commit()
+
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    minutes = [now - timedelta(minutes=m) for m in range(MINUTES)]
+    db.bulk_insert_mappings(Metric, [
+        {"item_id": item.id, "value": float(m), "timestamp": ts}
+        for item in items for m, ts in enumerate(minutes)
+    ])
+    db.bulk_insert_mappings(MetricRollup1m, [
+        {"item_id": item.id, "bucket": ts, "count": 1, "sum": 1.0, "min": 1.0, "max": 1.0}
+        for item in items for ts in minutes
+    ])
+    db.bulk_insert_mappings(MetricRollup1h, [
+        {"item_id": item.id, "bucket": now.replace(minute=0) - timedelta(hours=h), "count": 60, "sum": 60.0}
+        for item in items for h in range(72)
+    ])
+    db.bulk_insert_mappings(Trigger, [
+        {"host_id": h.id, "key": "key0", "condition": ">", "threshold": 1e9, "updated_at": now}
+        for h in hosts for _ in range(3)
+    ])
+    # Mostly resolved, as in any database that has run for a while
+    db.bulk_insert_mappings(Alert, [
+        {
+            "host_id": h.id, "title": "seeded", "message": "", "level": "warning",
+            "status": "active" if m % 25 == 0 else "resolved",
+            "triggered_at": now - timedelta(minutes=m),
+        }
+        for h in hosts for m in range(100)
+    ])
+    db.commit()
+    db.execute(text("ANALYZE"))
+    db.commit()
+    # Loading reads every enabled trigger once; not a per-request query.
+    # Loaded here so refreshes start from the seeded triggers' watermark
+    trigger_engine.load(db)
+    host_id, host_name = hosts[0].id, hosts[0].name
+    db.close()
+
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': name})}"}
+    key = client.post("/api/v1/api-keys/", json={"name": "plans"}, headers=headers).json()["key"]
+    page = client.get("/api/v1/alerts/", params={"limit": 5}, headers=headers).json()
+    return {
+        "headers": headers,
+        "key_headers": {"Authorization": f"Bearer {key}"},
+        "host_id": host_id,
+        "host_name": host_name,
+        "trigger_id": client.get(
+            "/api/v1/triggers/", params={"host_id": host_id}, headers=headers
+        ).json()["items"][0]["id"],
+        "alert_cursor": page["next_cursor"],
+        "now": now,
+    }
+
+
+@contextmanager
+def recorded():
+    """Statements run on either engine inside the block"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            statements.append((statement, parameters, conn.dialect.paramstyle))
+
+    targets = (engine, async_engine.sync_engine)
+    for target in targets:
+        event.listen(target, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for target in targets:
+            event.remove(target, "before_cursor_execute", record)
+
+
+def _sqlite_plan(statement, parameters):
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", tuple(parameters or ()))
+        return [row[-1] for row in rows]
+
+
+def _sqlite_problems(statement, plan):
+    problems = []
+    for detail in plan:
+        if detail.startswith("USE TEMP B-TREE"):
+            problems.append(detail)
+        match = _FULL_SCAN.match(detail)
+        # A rowid table is its own primary key index: walking it in
+        # ORDER BY id order and stopping at LIMIT is an index scan
+        if match and not (
+            re.search(rf"ORDER BY {match.group(1)}\.id\b", statement) and "LIMIT" in statement
+        ):
+            problems.append(detail)
+    return problems
+
+
+def _postgres_plan(statement, parameters, paramstyle):
+    if paramstyle == "numeric_dollar":
+        values = []
+
+        def placeholder(match):
+            values.append(parameters[int(match.group(1)) - 1])
+            return "%s"
+
+        statement = _NUMBERED.sub(placeholder, statement.replace("%", "%%"))
+        parameters = tuple(values)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        conn.exec_driver_sql("SET LOCAL enable_sort = off")
+        plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+    return plan[0]["Plan"]
+
+
+def _postgres_nodes(node):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _postgres_nodes(child)
+
+
+def _postgres_problems(plan):
+    return [
+        f"{node['Node Type']} {node.get('Relation Name') or node.get('Sort Key')}"
+        for node in _postgres_nodes(plan)
+        if node["Node Type"] in _POSTGRES_PROBLEMS
+    ]
+
+
+def _check(statement, parameters, paramstyle):
+    """(problems, plan lines) of one recorded statement"""
+    if engine.dialect.name == "postgresql":
+        plan = _postgres_plan(statement, parameters, paramstyle)
+        lines = [
+            f"{node['Node Type']} {node.get('Relation Name') or node.get('Index Name') or ''}".rstrip()
+            for node in _postgres_nodes(plan)
+        ]
+        return _postgres_problems(plan), lines
+    if engine.dialect.name == "sqlite":
+        plan = _sqlite_plan(statement, parameters)
+        return _sqlite_problems(statement, plan), plan
+    pytest.skip(f"no query plan checks for {engine.dialect.name}")
+
+
+def _assert_indexed(statements):
+    assert statements, "nothing was queried"
+    failures = []
+    for statement, parameters, paramstyle in statements:
+        problems, plan = _check(statement, parameters, paramstyle)
+        if problems:
+            failures.append(f"{' '.join(statement.split())}\n    " + "\n    ".join(plan))
+    assert not failures, "Queries without a usable index:\n" + "\n".join(failures)
+
+
+ROUTES = [
+    ("GET", "/api/v1/hosts/", {}),
+    ("GET", "/api/v1/hosts/{host_id}", {}),
+    ("GET", "/api/v1/hosts/by-name/{host_name}", {}),
+    ("GET", "/api/v1/alerts/", {}),
+    ("GET", "/api/v1/alerts/", {"cursor": "{alert_cursor}"}),
+    ("GET", "/api/v1/alerts/", {"status_filter": "active"}),
+    ("GET", "/api/v1/alerts/", {"host_id": "{host_id}"}),
+    ("GET", "/api/v1/alerts/", {"host_id": "{host_id}", "status_filter": "active"}),
+    ("GET", "/api/v1/triggers/", {}),
+    ("GET", "/api/v1/triggers/", {"host_id": "{host_id}"}),
+    ("GET", "/api/v1/triggers/{trigger_id}", {}),
+    ("GET", "/api/v1/metrics/", {}),
+    ("GET", "/api/v1/metrics/", {"host_id": "{host_id}", "key": "key1"}),
+    ("GET", "/api/v1/metrics/series", {"host_id": "{host_id}", "key": "key1"}),
+    ("GET", "/api/v1/metrics/series", {"host_id": "{host_id}", "key": "key1", "max_points": 10}),
+    ("GET", "/api/v1/metrics/series", {"host_id": "{host_id}", "key": "key1", "start": "{three_days_ago}", "max_points": 10}),
+    ("GET", "/api/v1/metrics/summary", {"host_id": "{host_id}", "key": "key1"}),
+    ("GET", "/api/v1/metrics/summary", {"host_id": "{host_id}", "key": "key1", "start": "{three_days_ago}"}),
+    ("GET", "/api/v1/metrics/latest", {"host_ids": "{host_id}"}),
+    ("GET", "/api/v1/api-keys/", {}),
+]
+
+
+@pytest.mark.parametrize("method,path,params", ROUTES, ids=lambda v: v if isinstance(v, str) else None)
+def test_route_queries_use_indexes(seeded, method, path, params):
+    """Test every query a read route runs is served by an index, without a sort"""
+    values = dict(seeded, three_days_ago=(seeded["now"] - timedelta(days=3)).isoformat())
+    url = path.format(**values)
+    query = {name: str(value).format(**values) for name, value in params.items()}
+    with recorded() as statements:
+        response = client.request(method, url, params=query, headers=seeded["headers"])
+    assert response.status_code == 200, response.text
+    _assert_indexed(statements)
+
+
+def test_ingest_queries_use_indexes(seeded):
+    """Test the batch write path, API key authentication included"""
+    api_key_cache.clear()
+    now = datetime.utcnow()
+    batch = {"metrics": [
+        {"host_id": seeded["host_id"], "key": f"key{k}", "value": 1.0, "timestamp": now.isoformat()}
+        for k in range(KEYS + 1)
+    ]}
+    with recorded() as statements:
+        response = client.post("/api/v1/metrics/batch", json=batch, headers=seeded["key_headers"])
+    assert response.status_code == 200, response.text
+    _assert_indexed(statements)
+
+
+def test_background_queries_use_indexes(seeded):
+    """Test item lookups, the trigger refresh and retention deletes"""
+    db = SessionLocal()
+    try:
+        with recorded() as statements:
+            ItemRegistry().resolve(db, [(seeded["host_id"], "key1"), (seeded["host_id"], "key2")])
+            trigger_engine.refresh(db)
+        db.rollback()
+    finally:
+        db.close()
+    # Nothing is this old, so these delete nothing
+    with recorded() as deletes:
+        for model, column in (
+            (Metric, Metric.timestamp),
+            (MetricRollup1m, MetricRollup1m.bucket),
+            (MetricRollup1h, MetricRollup1h.bucket),
+        ):
+            purge_chunked(model, column, datetime(2000, 1, 1), 1000)
+    _assert_indexed(statements + deletes)
+
+
+def test_purge_queries_use_indexes(seeded, monkeypatch):
+    """Test deleting a host, purging its rows and polling the job"""
+    db = SessionLocal()
+    user_id = db.get(Host, seeded["host_id"]).user_id
+    host = Host(name=f"purged-{uuid.uuid4().hex[:12]}", ip_address="10.0.0.2", tags=[], user_id=user_id)
+    db.add(host)
+    db.commit()
+    item = Item(host_id=host.id, key="key0")
+    db.add(item)
+    db.commit()
+    db.bulk_insert_mappings(Metric, [
+        {"item_id": item.id, "value": 1.0, "timestamp": seeded["now"] - timedelta(minutes=m)}
+        for m in range(10)
+    ])
+    db.commit()
+    host_id = host.id
+    db.close()
+
+    monkeypatch.setattr(settings, "PURGE_DELAY_SECONDS", 0)
+    monkeypatch.setattr(settings, "PURGE_CHUNK_SIZE", 4)
+    monkeypatch.setattr(settings, "PURGE_CHUNK_PAUSE_SECONDS", 0)
+    with recorded() as statements:
+        response = client.delete(f"/api/v1/hosts/{host_id}", headers=seeded["headers"])
+        assert response.status_code == 202, response.text
+        run_purge_jobs()
+        job = client.get(f"/api/v1/hosts/purge-jobs/{response.json()['id']}", headers=seeded["headers"])
+    assert job.json()["status"] == "done"
+    _assert_indexed(statements)
+
+
+_INDEX = re.compile(
+    r"CREATE (UNIQUE )?INDEX (\w+) ON (\w+)\s*\(([^)]*)\)"
+    r"(?:\s*INCLUDE \(([^)]*)\))?(?:\s*WHERE ([^;]+))?;"
+)
+
+
+def _columns(spec):
+    return tuple(c.strip() for c in spec.split(",")) if spec else ()
+
+
+def test_init_sql_indexes_match_models():
+    """Test infra/init.sql declares exactly the indexes the models do"""
+    declared = {
+        name: (table, _columns(columns), bool(unique), _columns(include), (where or "").strip())
+        for unique, name, table, columns, include, where in _INDEX.findall(INIT_SQL.read_text())
+    }
+    modeled = {}
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            options = index.dialect_options["postgresql"]
+            where = options.get("where")
+            modeled[index.name] = (
+                table.name,
+                tuple(c.name for c in index.columns),
+                index.unique,
+                tuple(options.get("include") or ()),
+                str(where) if where is not None else "",
+            )
+    assert declared == modeled
+
+
+def test_rollup_primary_keys_lead_with_item():
+    """Test rollup primary keys serve per-item range reads, as in init.sql"""
+    sql = " ".join(INIT_SQL.read_text().split())
+    for model in (MetricRollup1m, MetricRollup1h):
+        assert [c.name for c in model.__table__.primary_key.columns] == ["item_id", "bucket"]
+        assert f"CREATE TABLE IF NOT EXISTS {model.__tablename__} (" in sql
+    assert sql.count("PRIMARY KEY (item_id, bucket)") == 2
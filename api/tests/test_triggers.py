@@ -0,0 +1,221 @@
+"""
+Tests for trigger evaluation
+"""
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from api.main import app
+from api.db.database import SessionLocal, engine
+from api.db.models import Alert, Trigger
+from api.schemas import MetricCreate
+from api.services.ingest import write_metrics
+from api.services.triggers import TriggerEngine, trigger_engine
+
+client = TestClient(app)
+
+
+def _send(headers, host_id, start, values, key="cpu_usage"):
+    points = [
+        {
+            "host_id": host_id,
+            "key": key,
+            "value": value,
+            "timestamp": (start + timedelta(seconds=10 * i)).isoformat(),
+        }
+        for i, value in enumerate(values)
+    ]
+    response = client.post("/api/v1/metrics/batch", json={"metrics": points}, headers=headers)
+    assert response.status_code == 200
+
+
+def _alerts(host_id):
+    db = SessionLocal()
+    alerts = db.query(Alert).filter(Alert.host_id == host_id).order_by(Alert.id).all()
+    db.close()
+    return alerts
+
+
+def test_trigger_fires_after_duration_and_resolves(auth_headers, host):
+    """Test an alert opens once the condition held for duration, then resolves"""
+    response = client.post(
+        "/api/v1/triggers/",
+        json={"host_id": host.id, "key": "cpu_usage", "condition": ">",
+              "threshold": 90, "duration": 30, "alert_level": "critical"},
+        headers=auth_headers,
+    )
+    trigger_id = response.json()["id"]
+    start = datetime(2026, 3, 1)
+
+    # Held for 20s only: not long enough
+    _send(auth_headers, host.id, start, [95, 96, 97, 10])
+    assert _alerts(host.id) == []
+
+    # Held for 30s: opens one alert, further breaches do not duplicate it
+    _send(auth_headers, host.id, start + timedelta(minutes=1), [95, 96, 97, 98, 99])
+    alerts = _alerts(host.id)
+    assert len(alerts) == 1
+    assert alerts[0].trigger_id == trigger_id
+    assert alerts[0].level == "critical"
+    assert alerts[0].status == "active"
+
+    _send(auth_headers, host.id, start + timedelta(minutes=2), [5])
+    alerts = _alerts(host.id)
+    assert len(alerts) == 1
+    assert alerts[0].status == "resolved"
+
+
+def test_disabled_trigger_is_not_evaluated(auth_headers, host):
+    """Test update_trigger refreshes the index"""
+    response = client.post(
+        "/api/v1/triggers/",
+        json={"host_id": host.id, "key": "memory_usage", "condition": "<",
+              "threshold": 5, "duration": 0},
+        headers=auth_headers,
+    )
+    trigger_id = response.json()["id"]
+    client.patch(f"/api/v1/triggers/{trigger_id}", json={"enabled": False}, headers=auth_headers)
+
+    _send(auth_headers, host.id, datetime(2026, 3, 2), [1, 1, 1], key="memory_usage")
+    assert _alerts(host.id) == []
+
+
+def test_flapping_series_keeps_one_alert(auth_headers, host):
+    """Test rapid fire/clear cycles stop adding rows and count occurrences instead"""
+    client.post(
+        "/api/v1/triggers/",
+        json={"host_id": host.id, "key": "disk_usage", "condition": ">",
+              "threshold": 90, "duration": 0},
+        headers=auth_headers,
+    )
+    start = datetime(2026, 3, 3)
+
+    # 20 fire/clear cycles 10s apart; flap detection kicks in after 6 changes
+    _send(auth_headers, host.id, start, [95, 5] * 20, key="disk_usage")
+    alerts = _alerts(host.id)
+    assert len(alerts) == 3
+    assert [a.status for a in alerts] == ["resolved", "resolved", "active"]
+
+    # Clear for longer than the flap window: the open alert resolves with the repeats
+    _send(auth_headers, host.id, start + timedelta(hours=1), [5], key="disk_usage")
+    alerts = _alerts(host.id)
+    assert len(alerts) == 3
+    assert alerts[-1].status == "resolved"
+    assert alerts[-1].occurrences == 1 + 17
+
+
+def _trigger(headers, host_id, key):
+    response = client.post(
+        "/api/v1/triggers/",
+        json={"host_id": host_id, "key": key, "condition": ">", "threshold": 90, "duration": 0},
+        headers=headers,
+    )
+    return response.json()["id"]
+
+
+def _write(db, host_id, key, ts, value):
+    write_metrics(db, [MetricCreate(host_id=host_id, key=key, value=value, timestamp=ts)])
+
+
+def test_rolled_back_firing_is_forgotten(auth_headers, host):
+    """Test state stepped in a rolled-back transaction does not suppress the next firing"""
+    _trigger(auth_headers, host.id, "load")
+    start = datetime(2026, 3, 4)
+
+    db = SessionLocal()
+    _write(db, host.id, "load", start, 95)
+    db.rollback()
+    db.close()
+    assert _alerts(host.id) == []
+
+    _send(auth_headers, host.id, start + timedelta(seconds=10), [96], key="load")
+    alerts = _alerts(host.id)
+    assert len(alerts) == 1 and alerts[0].status == "active"
+
+
+def test_concurrent_transactions_rebuild_state(auth_headers, host):
+    """Test a transaction that stepped an outdated state gives it up at commit"""
+    trigger_id = _trigger(auth_headers, host.id, "temp")
+    start = datetime(2026, 3, 5)
+    _send(auth_headers, host.id, start, [95], key="temp")
+
+    # Still breaching: steps the open alert without writing anything
+    db = SessionLocal()
+    row = {"host_id": host.id, "key": "temp", "value": 96.0, "timestamp": start + timedelta(seconds=10)}
+    trigger_engine.evaluate(db, [row])
+    # Another transaction resolves the alert before this one commits
+    _send(auth_headers, host.id, start + timedelta(seconds=20), [5], key="temp")
+    db.commit()
+    db.close()
+    assert [a.status for a in _alerts(host.id)] == ["resolved"]
+    assert trigger_id in trigger_engine._stale
+
+    # Rebuilt from the database: no open alert, so the next breach opens one
+    _send(auth_headers, host.id, start + timedelta(seconds=30), [97], key="temp")
+    assert [a.status for a in _alerts(host.id)] == ["resolved", "active"]
+    assert trigger_id not in trigger_engine._stale
+
+
+def test_engine_lock_is_not_held_during_queries(auth_headers, host):
+    """Test evaluation never holds the engine lock while talking to the database"""
+    _trigger(auth_headers, host.id, "swap")
+    held = []
+
+    def check(*args):
+        held.append(trigger_engine._lock.locked())
+
+    event.listen(engine, "before_cursor_execute", check)
+    try:
+        db = SessionLocal()
+        _write(db, host.id, "swap", datetime(2026, 3, 6), 95)
+        db.commit()
+        db.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", check)
+    assert held and not any(held)
+    assert len(_alerts(host.id)) == 1
+
+
+def test_refresh_reads_edits_stamped_before_a_local_one(auth_headers, host):
+    """Test a local upsert does not hide another worker's edit from the next refresh"""
+    worker = TriggerEngine()
+    db = SessionLocal()
+    worker.load(db)
+    db.commit()
+    now = datetime.utcnow()
+
+    # This worker's edit, stamped by a clock running ahead
+    local = Trigger(host_id=host.id, key="iops", condition=">", threshold=90, duration=0,
+                    updated_at=now + timedelta(minutes=1))
+    db.add(local)
+    db.flush()
+    worker.upsert(db, local)
+    db.commit()
+    # Another worker's edit, committed afterwards with an older time
+    remote = Trigger(host_id=host.id, key="iops", condition=">", threshold=50, duration=0, updated_at=now)
+    db.add(remote)
+    db.commit()
+
+    worker.refresh(db)
+    db.commit()
+    assert {local.id, remote.id} <= set(worker._rules)
+    db.close()
+
+
+def test_refresh_keeps_pending_window_of_unchanged_trigger(auth_headers, host):
+    """Test reading an unchanged trigger again does not restart its window"""
+    client.post(
+        "/api/v1/triggers/",
+        json={"host_id": host.id, "key": "fan", "condition": ">", "threshold": 90, "duration": 30},
+        headers=auth_headers,
+    )
+    start = datetime(2026, 3, 7)
+    _send(auth_headers, host.id, start, [95, 96], key="fan")
+
+    db = SessionLocal()
+    trigger_engine.refresh(db)
+    db.commit()
+    db.close()
+
+    # Held from start through start + 30s
+    _send(auth_headers, host.id, start + timedelta(seconds=20), [97, 98], key="fan")
+    assert [a.status for a in _alerts(host.id)] == ["active"]
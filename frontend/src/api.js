@@ -49,7 +49,8 @@ export const hostsAPI = {
 export const metricsAPI = {
   list: (params) => api.get('/metrics', { params }),
   create: (data) => api.post('/metrics', data),
-  getLatest: (hostId) => api.get(`/metrics/latest/${hostId}`),
+  series: (params) => api.get('/metrics/series', { params }),
+  getLatest: (hostIds) => api.get('/metrics/latest', { params: { host_ids: [].concat(hostIds).join(',') } }),
 };
 
 export const alertsAPI = {
@@ -64,4 +65,42 @@ export const triggersAPI = {
   update: (id, data) => api.patch(`/triggers/${id}`, data),
 };
 
+// Server-Sent Events. EventSource cannot set headers and the access token
+// must not go in a URL, so each connection is opened with a short-lived
+// stream ticket; reconnects fetch a new one since the old has expired
+export const eventsAPI = {
+  ticket: () => api.post('/events/ticket'),
+  stream: (params, handlers) => {
+    let source = null;
+    let closed = false;
+    const reconnect = () => {
+      if (!closed) setTimeout(open, 3000);
+    };
+    const open = async () => {
+      try {
+        const { data } = await eventsAPI.ticket();
+        if (closed) return;
+        const query = new URLSearchParams({ ...params, ticket: data.ticket });
+        source = new EventSource(`${API_BASE_URL}/events/stream?${query}`);
+        Object.entries(handlers).forEach(([name, handler]) =>
+          source.addEventListener(name, (event) => handler(JSON.parse(event.data)))
+        );
+        source.onerror = () => {
+          source.close();
+          reconnect();
+        };
+      } catch (err) {
+        reconnect();
+      }
+    };
+    open();
+    return {
+      close: () => {
+        closed = true;
+        if (source) source.close();
+      },
+    };
+  },
+};
+
 export default api;
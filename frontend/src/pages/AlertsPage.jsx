@@ -1,7 +1,22 @@
 import React, { useState, useEffect } from 'react'
-import { alertsAPI } from '../api'
+import { alertsAPI, eventsAPI } from '../api'
 import { ChartCard, Table, Badge } from '../components'
 
+// Update a listed alert in place, or add a new one at the top
+export const mergeAlert = (alerts, alert, filter = 'all') => {
+  const index = alerts.findIndex((a) => a.id === alert.id)
+  const visible = filter === 'all' || alert.status === filter
+  if (index === -1) {
+    return visible && alert.title ? [alert, ...alerts] : alerts
+  }
+  if (!visible) {
+    return alerts.filter((a) => a.id !== alert.id)
+  }
+  const next = [...alerts]
+  next[index] = { ...alerts[index], ...alert }
+  return next
+}
+
 export default function AlertsPage() {
   const [alerts, setAlerts] = useState([])
   const [loading, setLoading] = useState(true)
@@ -9,8 +24,16 @@ export default function AlertsPage() {
 
   useEffect(() => {
     loadAlerts()
-    const interval = setInterval(loadAlerts, 30000)
-    return () => clearInterval(interval)
+    // Live changes arrive over the event stream; the slow poll only catches
+    // up after reconnects
+    const interval = setInterval(loadAlerts, 300000)
+    const source = eventsAPI.stream({ types: 'alerts' }, {
+      alert: ({ alert }) => setAlerts((current) => mergeAlert(current, alert, filter)),
+    })
+    return () => {
+      clearInterval(interval)
+      source.close()
+    }
   }, [filter])
 
   const loadAlerts = async () => {
@@ -18,7 +41,7 @@ export default function AlertsPage() {
       const response = await alertsAPI.list({
         status_filter: filter === 'all' ? null : filter
       })
-      setAlerts(response.data)
+      setAlerts(response.data.items)
     } catch (err) {
       console.error('Error loading alerts:', err)
     } finally {
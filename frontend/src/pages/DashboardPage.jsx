@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react'
-import { hostsAPI, metricsAPI, alertsAPI } from '../api'
+import { hostsAPI, metricsAPI, alertsAPI, eventsAPI } from '../api'
+import { mergeAlert } from './AlertsPage'
 import { KPICard, ChartCard, Table, Badge, Button } from '../components'
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer } from 'recharts'
 
@@ -17,8 +18,15 @@ export default function DashboardPage() {
 
   useEffect(() => {
     loadDashboard()
-    const interval = setInterval(loadDashboard, 10000)
-    return () => clearInterval(interval)
+    // Alerts are pushed; host status still comes from the (slower) poll
+    const interval = setInterval(loadDashboard, 60000)
+    const source = eventsAPI.stream({ types: 'alerts' }, {
+      alert: ({ alert }) => setAlerts((current) => mergeAlert(current, alert)),
+    })
+    return () => {
+      clearInterval(interval)
+      source.close()
+    }
   }, [])
 
   const loadDashboard = async () => {
@@ -28,13 +36,15 @@ export default function DashboardPage() {
         alertsAPI.list(),
       ])
 
-      setHosts(hostsRes.data)
-      setAlerts(alertsRes.data)
+      const hosts = hostsRes.data.items
+      const alerts = alertsRes.data.items
+      setHosts(hosts)
+      setAlerts(alerts)
 
       const stats = {
-        totalHosts: hostsRes.data.length,
-        criticalAlerts: alertsRes.data.filter(a => a.level === 'critical').length,
-        warningAlerts: alertsRes.data.filter(a => a.level === 'warning').length,
+        totalHosts: hosts.length,
+        criticalAlerts: alerts.filter(a => a.level === 'critical').length,
+        warningAlerts: alerts.filter(a => a.level === 'warning').length,
         avgCPU: Math.random() * 100,
       }
       setStats(stats)
@@ -15,7 +15,7 @@ export default function HostsPage() {
   const loadHosts = async () => {
     try {
       const response = await hostsAPI.list()
-      setHosts(response.data)
+      setHosts(response.data.items)
     } catch (err) {
       console.error('Error loading hosts:', err)
     } finally {
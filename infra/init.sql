@@ -11,12 +11,28 @@ CREATE TABLE IF NOT EXISTS users (
 
 CREATE TABLE IF NOT EXISTS hosts (
     id SERIAL PRIMARY KEY,
-    name VARCHAR(255) UNIQUE NOT NULL,
+    name VARCHAR(255) NOT NULL,
     ip_address VARCHAR(45) NOT NULL,
     status VARCHAR(50) DEFAULT 'unknown',
     tags JSONB DEFAULT '[]',
     user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Set on deletion; a purge job deletes the row and its data later
+    deleted_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS purge_jobs (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    host_ids JSON NOT NULL,
+    status VARCHAR(50) NOT NULL DEFAULT 'pending',
+    deleted JSON,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -25,29 +41,50 @@ CREATE TABLE IF NOT EXISTS items (
     host_id INTEGER NOT NULL REFERENCES hosts(id) ON DELETE CASCADE,
     key VARCHAR(255) NOT NULL,
     value_type VARCHAR(50) DEFAULT 'numeric',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_items_host_id_key UNIQUE (host_id, key)
 );
 
+-- Host and key live on the item; a sample is just (item_id, value, timestamp)
 CREATE TABLE IF NOT EXISTS metrics (
-    id SERIAL PRIMARY KEY,
-    host_id INTEGER NOT NULL REFERENCES hosts(id) ON DELETE CASCADE,
-    item_id INTEGER REFERENCES items(id) ON DELETE SET NULL,
-    key VARCHAR(255) NOT NULL,
+    id BIGSERIAL PRIMARY KEY,
+    item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
     value FLOAT NOT NULL,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE TABLE IF NOT EXISTS alerts (
+CREATE TABLE IF NOT EXISTS metric_rollups_1m (
+    item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+    bucket TIMESTAMP NOT NULL,
+    count INTEGER DEFAULT 0,
+    sum FLOAT DEFAULT 0,
+    min FLOAT,
+    max FLOAT,
+    sketch JSON,
+    PRIMARY KEY (item_id, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS metric_rollups_1h (
+    item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+    bucket TIMESTAMP NOT NULL,
+    count INTEGER DEFAULT 0,
+    sum FLOAT DEFAULT 0,
+    min FLOAT,
+    max FLOAT,
+    sketch JSON,
+    PRIMARY KEY (item_id, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS api_keys (
     id SERIAL PRIMARY KEY,
-    host_id INTEGER NOT NULL REFERENCES hosts(id) ON DELETE CASCADE,
-    title VARCHAR(255) NOT NULL,
-    message TEXT,
-    level VARCHAR(50) DEFAULT 'info',
-    status VARCHAR(50) DEFAULT 'active',
-    triggered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    resolved_at TIMESTAMP,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    host_id INTEGER REFERENCES hosts(id) ON DELETE CASCADE,
+    name VARCHAR(255),
+    prefix VARCHAR(16) UNIQUE NOT NULL,
+    key_hash VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP,
+    revoked_at TIMESTAMP
 );
 
 CREATE TABLE IF NOT EXISTS triggers (
@@ -64,12 +101,47 @@ CREATE TABLE IF NOT EXISTS triggers (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Create indexes for performance
-CREATE INDEX idx_hosts_user_id ON hosts(user_id);
-CREATE INDEX idx_metrics_host_id ON metrics(host_id);
-CREATE INDEX idx_metrics_timestamp ON metrics(timestamp);
-CREATE INDEX idx_alerts_host_id ON alerts(host_id);
-CREATE INDEX idx_triggers_host_id ON triggers(host_id);
+CREATE TABLE IF NOT EXISTS alerts (
+    id SERIAL PRIMARY KEY,
+    host_id INTEGER NOT NULL REFERENCES hosts(id) ON DELETE CASCADE,
+    trigger_id INTEGER REFERENCES triggers(id) ON DELETE SET NULL,
+    title VARCHAR(255) NOT NULL,
+    message TEXT,
+    level VARCHAR(50) DEFAULT 'info',
+    status VARCHAR(50) DEFAULT 'active',
+    triggered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    resolved_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    fingerprint VARCHAR(40),
+    occurrences INTEGER NOT NULL DEFAULT 1,
+    last_seen_at TIMESTAMP
+);
+
+-- Indexes; kept identical to the models (api/db/models.py), the tests compare them.
+-- Primary keys and unique constraints cover lookups by id, username,
+-- email, API key prefix and (host_id, key), so they get no index of their own.
+-- Host indexes cover live hosts only; a deleted host's name is free at once
+CREATE INDEX ix_hosts_user_id_id ON hosts(user_id, id) WHERE deleted_at IS NULL;
+CREATE UNIQUE INDEX ux_hosts_name ON hosts(name) WHERE deleted_at IS NULL;
+CREATE INDEX ix_purge_jobs_status_id ON purge_jobs(status, id);
+CREATE INDEX ix_api_keys_user_id ON api_keys(user_id);
+CREATE INDEX ix_api_keys_host_id ON api_keys(host_id);
+-- Covering: series reads never visit the heap
+CREATE INDEX ix_metrics_item_id_timestamp ON metrics(item_id, timestamp) INCLUDE (value);
+-- Retention and the newest-first metric list
+CREATE INDEX ix_metrics_timestamp ON metrics(timestamp);
+CREATE INDEX ix_metric_rollups_1m_bucket ON metric_rollups_1m(bucket);
+CREATE INDEX ix_metric_rollups_1h_bucket ON metric_rollups_1h(bucket);
+CREATE INDEX ix_triggers_host_id_id ON triggers(host_id, id);
+CREATE INDEX ix_triggers_item_id ON triggers(item_id);
+CREATE INDEX ix_triggers_updated_at ON triggers(updated_at);
+-- Alert pages, newest first: all hosts or one, any status or one
+CREATE INDEX ix_alerts_triggered_at_id ON alerts(triggered_at, id);
+CREATE INDEX ix_alerts_host_id_triggered_at_id ON alerts(host_id, triggered_at, id);
+CREATE INDEX ix_alerts_status_triggered_at_id ON alerts(status, triggered_at, id);
+CREATE INDEX ix_alerts_host_id_status_triggered_at_id ON alerts(host_id, status, triggered_at, id);
+CREATE INDEX ix_alerts_trigger_id ON alerts(trigger_id);
+CREATE UNIQUE INDEX ux_alerts_active_fingerprint ON alerts(fingerprint) WHERE status = 'active';
 
 -- Create default test user
 INSERT INTO users (username, email, hashed_password, is_active)
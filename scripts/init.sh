@@ -23,7 +23,7 @@ sleep 10
 
 # Run database initialization
 echo "🗄️  Initializing database..."
-docker-compose exec -T api python init_db.py
+docker-compose exec -T api python -m api.db.migrate
 
 # Create demo host (optional)
 echo "✅ Netmon initialized successfully!"